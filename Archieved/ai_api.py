@@ -1,17 +1,31 @@
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import uvicorn
 import time
 import io
 import logging
 
-from ai_mqtt_consumer import classify_audio_bytes, classify_image_bytes, upload_to_supabase
+from ai_mqtt_consumer import (classify_audio_bytes, classify_image_bytes, upload_to_supabase,
+                              model_registry, startup)
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai_api")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # importing the consumer no longer loads the models; load and warm them up before serving
+    model_registry.load_all()
+    logger.info("Startup: %s, model versions: %s", startup.report(), model_registry.versions())
+    # retrained artifacts are swapped in while serving (see model_registry.py)
+    model_registry.start()
+    yield
+    model_registry.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,7 +58,7 @@ async def classify_audio(file: UploadFile = File(...), device_id: str = Form(...
         label = classify_audio_bytes(contents)
     except Exception as e:
         return {"status": "error", "message": f"audio classification failed: {e}"}
-    result = {"status": "ok", "label": label, "timestamp": ts}
+    result = {"status": "ok", "label": label, "timestamp": ts, "model_versions": model_registry.versions()}
     if upload:
         try:
             import uuid
@@ -81,7 +95,7 @@ async def classify_frame(file: UploadFile = File(...), device_id: str = Form(...
         label = classify_image_bytes(contents)
     except Exception as e:
         return {"status": "error", "message": f"image classification failed: {e}"}
-    result = {"status": "ok", "label": label, "timestamp": ts}
+    result = {"status": "ok", "label": label, "timestamp": ts, "model_versions": model_registry.versions()}
     if upload:
         try:
             # generate a safe renamed filename
@@ -147,8 +161,15 @@ async def classify_both(
             except Exception as e:
                 result.setdefault("uploads", {})["audio_error"] = str(e)
 
+    result["model_versions"] = model_registry.versions()
     return result
 
 
+@app.get("/api/models")
+def models_status():
+    """Active version, load time, in-flight requests and reload history of each model."""
+    return model_registry.status()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,214 @@
+"""Export the vision model to TorchScript / ONNX / int8 and compare them with FP32.
+
+Run from the repository root:
+
+  python Computer-Vision/export_model.py                       # export all + report
+  python Computer-Vision/export_model.py --formats int8 --quant dynamic
+  python Computer-Vision/export_model.py --report-only         # just compare what's on disk
+
+Artifacts are written next to cheating_cnn_model.pth (see vision_runtime.py
+for names and how the consumer / FastAPI server pick one). The int8 model is
+only written when its label agreement with FP32 on the dataset is at least
+--min-agreement.
+
+The report covers, for every artifact: label agreement with FP32 over
+Computer-Vision/dataset_photo/Dataset, median latency at batch 1 and batch 8,
+file size, and resident memory added by loading it.
+"""
+import os
+import sys
+import copy
+import glob
+import time
+import argparse
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from vision_runtime import (ARTIFACTS, artifact_path, build_resnet18, load_artifact,  # noqa: E402
+                            _set_quantized_engine)
+
+IMG_SIZE = 224
+DATASET_DIR = ROOT / "Computer-Vision" / "dataset_photo" / "Dataset"
+
+cv_transform = transforms.Compose([
+    transforms.Resize((IMG_SIZE, IMG_SIZE)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def load_dataset(limit=None):
+    paths = sorted(glob.glob(str(DATASET_DIR / "*.jpg")))[:limit]
+    if not paths:
+        raise SystemExit(f"No images found in {DATASET_DIR}")
+    return torch.stack([cv_transform(Image.open(p).convert("RGB")) for p in paths])
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return float("nan")
+
+
+def predict(model, images, batch_size=16):
+    preds = []
+    with torch.no_grad():
+        for i in range(0, len(images), batch_size):
+            preds.append(torch.argmax(model(images[i:i + batch_size]), dim=1))
+    return torch.cat(preds)
+
+
+def latency_ms(model, images, batch_size, repeat=20):
+    batch = images[:batch_size]
+    if len(batch) < batch_size:
+        batch = batch.repeat((batch_size + len(batch) - 1) // len(batch), 1, 1, 1)[:batch_size]
+    with torch.no_grad():
+        for _ in range(3):
+            model(batch)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(batch)
+            times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+# ------------------------------------------------------------------ export
+
+def export_torchscript(model, example, path):
+    traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced.eval())
+    torch.jit.save(traced, path)
+
+
+def export_onnx(model, example, path):
+    kwargs = dict(input_names=["input"], output_names=["logits"],
+                  dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}, opset_version=17)
+    try:
+        torch.onnx.export(model, example, path, dynamo=False, **kwargs)
+    except TypeError:
+        # torch < 2.5 has no `dynamo` switch and always uses the TorchScript exporter
+        torch.onnx.export(model, example, path, **kwargs)
+
+
+def quantize_static(model, calibration, example):
+    """Post-training static int8 (convs + linear) with FX graph mode, calibrated on dataset frames."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    engine = _set_quantized_engine()
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for i in range(0, len(calibration), 8):
+            prepared(calibration[i:i + 8])
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model):
+    """Dynamic int8 for the Linear head only; the convs stay FP32."""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_int8(model, images, example, path, mode, calibration_size, min_agreement, reference):
+    if mode == "static":
+        try:
+            quantized = quantize_static(model, images[:calibration_size], example)
+        except Exception as e:
+            print(f"  static quantization failed ({e}); falling back to dynamic")
+            quantized = quantize_dynamic(model)
+    else:
+        quantized = quantize_dynamic(model)
+    agreement = float((predict(quantized, images) == reference).float().mean())
+    if agreement < min_agreement:
+        print(f"  int8 agreement {agreement:.1%} < {min_agreement:.1%}; not writing {path}")
+        return False
+    traced = torch.jit.freeze(torch.jit.trace(quantized, example).eval())
+    torch.jit.save(traced, path)
+    return True
+
+
+# ------------------------------------------------------------------ report
+
+def report(model_dir, num_classes, images, reference):
+    print(f"\n{'runtime':>12} | {'agreement':>9} | {'b1 ms':>7} | {'b8 ms':>7} | {'size MB':>7} | {'+RSS MB':>7}")
+    for runtime in ARTIFACTS:
+        path = artifact_path(runtime, model_dir)
+        if not os.path.exists(path):
+            continue
+        before = rss_mb()
+        try:
+            model = load_artifact(runtime, num_classes, "cpu", model_dir)
+        except Exception as e:
+            print(f"{runtime:>12} | could not load: {e}")
+            continue
+        agreement = float((predict(model, images) == reference).float().mean())
+        b1 = latency_ms(model, images, 1)
+        b8 = latency_ms(model, images, 8)
+        print(f"{runtime:>12} | {agreement:>8.1%} | {b1:>7.1f} | {b8:>7.1f} | "
+              f"{os.path.getsize(path) / 2**20:>7.1f} | {rss_mb() - before:>7.1f}")
+        del model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=str(ROOT / "Computer-Vision"))
+    parser.add_argument("--encoder", default=str(ROOT / "Computer-Vision" / "vision_label_encoder.joblib"))
+    parser.add_argument("--formats", nargs="+", default=["torchscript", "onnx", "int8"],
+                        choices=["torchscript", "onnx", "int8"])
+    parser.add_argument("--quant", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calibration", type=int, default=64, help="dataset frames used to calibrate static int8")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N dataset images")
+    parser.add_argument("--report-only", action="store_true")
+    parser.add_argument("--random-init", action="store_true",
+                        help="export an untrained model (pipeline smoke test when the .pth isn't available; "
+                             "use with a scratch --model-dir)")
+    args = parser.parse_args()
+
+    torch.set_num_threads(max(1, os.cpu_count() or 1))
+    # torch.ao / tracer deprecation chatter
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    num_classes = len(joblib.load(args.encoder).classes_)
+    weights = artifact_path("eager", args.model_dir)
+    if args.random_init:
+        torch.manual_seed(0)
+        model = build_resnet18(num_classes).eval()
+    else:
+        if not os.path.exists(weights):
+            raise SystemExit(f"{weights} not found (train it first, or pass --random-init for a smoke test)")
+        model = build_resnet18(num_classes)
+        model.load_state_dict(torch.load(weights, map_location="cpu"))
+        model.eval()
+
+    images = load_dataset(args.limit)
+    reference = predict(model, images)
+    example = images[:1]
+    print(f"{len(images)} dataset images, {num_classes} classes")
+
+    if not args.report_only:
+        for fmt in args.formats:
+            path = artifact_path(fmt, args.model_dir)
+            print(f"Exporting {fmt} -> {path}")
+            if fmt == "torchscript":
+                export_torchscript(model, example, path)
+            elif fmt == "onnx":
+                export_onnx(model, example, path)
+            else:
+                export_int8(model, images, example, path, args.quant, args.calibration,
+                            args.min_agreement, reference)
+
+    report(args.model_dir, num_classes, images, reference)
+
+
+if __name__ == "__main__":
+    main()
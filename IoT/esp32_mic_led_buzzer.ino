@@ -16,8 +16,12 @@
 #define DEVICE_ID   "esp32_audio_01"
 
 /* ================= TOPICS ================= */
-#define TOPIC_AUDIO   "iot/audio/chunk"
-#define TOPIC_RESULT  "iot/integrity/result"
+// per-device topic so a clustered consumer can shard on the topic alone
+// (the consumer still accepts the flat "iot/audio/chunk")
+#define TOPIC_AUDIO   "iot/audio/chunk/" DEVICE_ID
+// results for this device only (consumer INTEGRITY_TOPIC_MODE=device);
+// use "iot/integrity/result" if the consumer runs in legacy mode
+#define TOPIC_RESULT  "iot/integrity/result/" DEVICE_ID
 
 /* ================= LED & BUZZER ================= */
 #define LED_GREEN   26
@@ -44,6 +48,10 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
   StaticJsonDocument<128> doc;
   if (deserializeJson(doc, payload, length)) return;
 
+  // the legacy shared topic carries every device's results
+  const char* device = doc["device_id"];
+  if (device && strcmp(device, DEVICE_ID) != 0) return;
+
   float score = doc["integrity_score"];
   const char* label = doc["label"];
 
@@ -1,9 +1,8 @@
 # fastapi_server_esp32.py
-from fastapi import FastAPI, UploadFile, File, Header, HTTPException
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import librosa
 import numpy as np
-import joblib
 import uvicorn
 import time
 import json
@@ -16,8 +15,16 @@ import pandas as pd
 import asyncio
 from contextlib import asynccontextmanager
 import redis
-import sqlite3
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from model_registry import build_registry
+from inference_executor import build_executors, predict_speech, Saturated, saturated_response
+from sqlite_store import SQLiteStore, prediction_stats, device_rollup
+from debug_archive import DebugArchive
+from broadcast_hub import BroadcastHub, channels_for
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -32,61 +39,23 @@ except:
     redis_client = None
     logger.warning("Redis not available, using in-memory storage")
 
-# Database setup
-def init_database():
-    conn = sqlite3.connect('argus_data.db')
-    cursor = conn.cursor()
-    
-    # Create tables if they don't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS audio_predictions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        device_id TEXT,
-        student_id TEXT,
-        prediction TEXT,
-        confidence REAL,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        audio_features TEXT
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS devices (
-        device_id TEXT PRIMARY KEY,
-        student_id TEXT,
-        last_seen DATETIME,
-        ip_address TEXT,
-        status TEXT DEFAULT 'active'
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS alerts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        device_id TEXT,
-        alert_type TEXT,
-        severity TEXT,
-        description TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        resolved BOOLEAN DEFAULT 0
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Database: one WAL connection on a writer thread that batches inserts, plus pooled
+# read-only connections, so no request opens a connection or commits on the event loop
+store = SQLiteStore()  # ARGUS_DB_PATH, default argus_data.db
 
-# Initialize database on startup
-init_database()
+# ML assets: loaded at startup, then a retrained model in Speech-Recognition/models_output
+# is loaded in the background and swapped in without a restart (see model_registry.py)
+model_registry = build_registry(vision=False)
+speech_models = model_registry["speech"]
+# decoding, features and the SVM run on a bounded pool (INFERENCE_SPEECH_EXECUTOR), never on the event loop
+executors = build_executors(model_registry, vision=False)
 
-# Load ML assets
-try:
-    model = joblib.load("./Speech-Recognition/models_output/best_model.joblib")
-    scaler = joblib.load("./Speech-Recognition/models_output/scaler.joblib")
-    encoder = joblib.load("./Speech-Recognition/models_output/label_encoder.joblib")
-    logger.info("ML models loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading ML models: {e}")
-    raise
+# Debug audio: alerts, errors, low-confidence clips and a small sample of the rest, appended to
+# rolling per-device segments by a writer thread and pruned by size and age (DEBUG_AUDIO_*)
+debug_archive = DebugArchive()
+
+# Live viewers (/ws, /events): each prediction and alert is pushed once, to the channels that want it
+hub = BroadcastHub()
 
 # Global state for latest predictions
 latest_predictions = {}
@@ -97,6 +66,13 @@ device_history = {}
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Argus API Server...")
+    if speech_models.load() is None:
+        raise RuntimeError("Error loading ML models (see log)")
+    logger.info(f"ML models loaded successfully (version {speech_models.version})")
+    model_registry.start()
+    store.start()
+    executors["speech"].start()
+    debug_archive.start()
     
     # Load existing device data
     load_device_data()
@@ -105,7 +81,13 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Argus API Server...")
+    executors["speech"].stop()
+    model_registry.stop()
+    debug_archive.stop()
     save_device_data()
+    # commits everything still queued
+    store.stop()
+    logger.info(f"SQLite writer stats: {store.stats}")
 
 app = FastAPI(title="Argus AI Server", lifespan=lifespan)
 
@@ -116,33 +98,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def extract_features(audio_data, sr=16000):
-    """Extract audio features from raw audio data"""
-    try:
-        # Convert bytes to numpy array
-        audio_np = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-        
-        # Extract features
-        rms = np.mean(librosa.feature.rms(y=audio_np))
-        zcr = np.mean(librosa.feature.zero_crossing_rate(audio_np))
-        spec = np.mean(librosa.feature.spectral_centroid(y=audio_np, sr=sr))
-        mfcc = librosa.feature.mfcc(y=audio_np, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        
-        features = np.hstack([rms, zcr, spec, mfcc_mean])
-        return features
-    except Exception as e:
-        logger.error(f"Error extracting features: {e}")
-        raise
+@app.exception_handler(Saturated)
+async def saturated_handler(request, exc):
+    # every inference worker is busy and the backlog is full: tell the device when to retry
+    return saturated_response(exc)
 
 def load_device_data():
     """Load device data from database"""
     try:
-        conn = sqlite3.connect('argus_data.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT device_id, student_id, last_seen, ip_address, status FROM devices")
-        devices = cursor.fetchall()
+        devices = store.query("SELECT device_id, student_id, last_seen, ip_address, status FROM devices")
         
         for device in devices:
             device_id = device[0]
@@ -153,7 +117,6 @@ def load_device_data():
                 'status': device[4]
             }
         
-        conn.close()
         logger.info(f"Loaded {len(devices)} devices from database")
     except Exception as e:
         logger.error(f"Error loading device data: {e}")
@@ -161,11 +124,8 @@ def load_device_data():
 def save_device_data():
     """Save device data to database"""
     try:
-        conn = sqlite3.connect('argus_data.db')
-        cursor = conn.cursor()
-        
         for device_id, device_data in connected_devices.items():
-            cursor.execute('''
+            store.execute('''
             INSERT OR REPLACE INTO devices (device_id, student_id, last_seen, ip_address, status)
             VALUES (?, ?, ?, ?, ?)
             ''', (
@@ -176,8 +136,7 @@ def save_device_data():
                 device_data.get('status', 'active')
             ))
         
-        conn.commit()
-        conn.close()
+        store.flush()
         logger.info(f"Saved {len(connected_devices)} devices to database")
     except Exception as e:
         logger.error(f"Error saving device data: {e}")
@@ -210,25 +169,22 @@ async def upload_audio(
     }
     
     # Read audio data
+    contents = b""
     try:
         contents = await file.read()
         
-        # Save raw audio for debugging (optional)
-        debug_path = f"./debug_audio/{device_id}_{int(time.time())}.wav"
-        os.makedirs(os.path.dirname(debug_path), exist_ok=True)
-        with open(debug_path, "wb") as f:
-            f.write(contents)
-        
         logger.info(f"Received audio from device {device_id}, size: {len(contents)} bytes")
         
-        # Extract features and predict
-        features = extract_features(contents)
-        features_scaled = scaler.transform(features.reshape(1, -1))
-        prediction = model.predict(features_scaled)[0]
-        label = encoder.inverse_transform([prediction])[0]
-        
-        # Get prediction probabilities
-        probabilities = model.predict_proba(features_scaled)[0]
+        # Extract features and predict on the inference pool. The ESP32 posts WAV or raw 16 kHz int16 PCM;
+        # anything that isn't RIFF is decoded as PCM, never sniffed (quiet PCM can look like an MP3 sync word).
+        # The model version the request started on answers it, even if a new one is swapped in meanwhile
+        fmt = "wav" if contents[:4] == b"RIFF" else "pcm"
+        result = await executors["speech"].run(predict_speech, contents, sr=16000, pcm_rate=16000, proba=True,
+                                               fmt=fmt)
+        label = result["label"]
+        features = result["features"]
+        probabilities = result["probabilities"]
+        model_version = result["model_version"]
         confidence = float(np.max(probabilities))
         
         # Create prediction record
@@ -238,42 +194,38 @@ async def upload_audio(
             'prediction': label,
             'confidence': confidence,
             'timestamp': timestamp,
-            'features': features.tolist(),
-            'probabilities': probabilities.tolist()
+            'features': features,
+            'probabilities': probabilities,
+            'model_version': model_version
         }
         
-        # Update latest prediction
+        # Update latest prediction and push it to live viewers
         latest_predictions[device_id] = prediction_record
+        hub.publish("prediction", prediction_record, device_id, label)
         
-        # Store in database
-        conn = sqlite3.connect('argus_data.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        INSERT INTO audio_predictions (device_id, student_id, prediction, confidence, audio_features)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (
-            device_id,
-            student_id,
-            label,
-            confidence,
-            json.dumps(features.tolist())
-        ))
+        # Store in database (queued; committed with other uploads' rows by the writer thread)
+        store.insert_prediction(device_id, student_id, label, confidence, json.dumps(features))
         
         # Check if this is an alert condition
-        if label == 'whispering' and confidence > 0.8:
-            cursor.execute('''
-            INSERT INTO alerts (device_id, alert_type, severity, description)
-            VALUES (?, ?, ?, ?)
-            ''', (
+        alert = label == 'whispering' and confidence > 0.8
+        if alert:
+            store.insert_alert(
                 device_id,
                 'whispering_detected',
                 'medium',
                 f'Whispering detected with {confidence:.2f} confidence'
-            ))
+            )
+            hub.publish("alert", {
+                'device_id': device_id,
+                'student_id': student_id,
+                'alert_type': 'whispering_detected',
+                'severity': 'medium',
+                'description': f'Whispering detected with {confidence:.2f} confidence',
+                'timestamp': timestamp
+            }, device_id, label)
         
-        conn.commit()
-        conn.close()
+        # Keep the clip for debugging if the sampling policy wants it (queued, written off the event loop)
+        debug_archive.offer(device_id, contents, label, confidence, alert=alert)
         
         # Update Redis for real-time dashboard (if available)
         if redis_client:
@@ -300,6 +252,7 @@ async def upload_audio(
             "confidence": confidence,
             "processing_time": processing_time,
             "timestamp": timestamp,
+            "model_version": model_version,
             "probabilities": {
                 "silence": float(probabilities[0]),
                 "whispering": float(probabilities[1]),
@@ -307,26 +260,31 @@ async def upload_audio(
             }
         }
         
+    except Saturated:
+        # answered with 503 + Retry-After, not logged as a processing error
+        raise
     except Exception as e:
         logger.error(f"Error processing audio from device {device_id}: {e}")
         
         # Log error in database
         try:
-            conn = sqlite3.connect('argus_data.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-            INSERT INTO alerts (device_id, alert_type, severity, description)
-            VALUES (?, ?, ?, ?)
-            ''', (
+            store.insert_alert(
                 device_id,
                 'processing_error',
                 'high',
                 f'Error processing audio: {str(e)}'
-            ))
-            conn.commit()
-            conn.close()
+            )
+            hub.publish("alert", {
+                'device_id': device_id,
+                'student_id': student_id,
+                'alert_type': 'processing_error',
+                'severity': 'high',
+                'description': f'Error processing audio: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }, device_id)
         except:
             pass
+        debug_archive.offer(device_id, contents, error=True)
         
         return {
             "status": "error",
@@ -375,28 +333,33 @@ async def get_device_history(device_id: str, limit: int = 50):
         "count": len(history)
     }
 
+@app.get("/device/{device_id}/rollup")
+async def get_device_rollup(device_id: str, minutes: int = 60):
+    """Per-minute prediction counts and confidence for a device (UTC minutes)"""
+    timeline = await store.aread(device_rollup, device_id, min(max(minutes, 1), 24 * 60))
+    return {
+        "device_id": device_id,
+        "minutes": minutes,
+        "timeline": timeline
+    }
+
 @app.get("/alerts")
 async def get_alerts(limit: int = 20, resolved: bool = False):
     """Get recent alerts"""
-    conn = sqlite3.connect('argus_data.db')
-    cursor = conn.cursor()
-    
     if resolved:
-        cursor.execute('''
+        alerts = await store.aquery('''
         SELECT * FROM alerts 
         ORDER BY timestamp DESC 
         LIMIT ?
         ''', (limit,))
     else:
-        cursor.execute('''
+        alerts = await store.aquery('''
         SELECT * FROM alerts 
         WHERE resolved = 0 
         ORDER BY timestamp DESC 
         LIMIT ?
         ''', (limit,))
     
-    alerts = cursor.fetchall()
-    
     # Convert to dict
     alerts_list = []
     for alert in alerts:
@@ -410,8 +373,6 @@ async def get_alerts(limit: int = 20, resolved: bool = False):
             'resolved': bool(alert[6])
         })
     
-    conn.close()
-    
     return {
         "alerts": alerts_list,
         "count": len(alerts_list),
@@ -434,18 +395,12 @@ async def register_device(
         'status': 'active'
     }
     
-    # Save to database
-    conn = sqlite3.connect('argus_data.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+    # Save to database (awaits the writer thread's commit without blocking the event loop)
+    await store.awrite('''
     INSERT OR REPLACE INTO devices (device_id, student_id, last_seen, ip_address, status)
     VALUES (?, ?, ?, ?, ?)
     ''', (device_id, student_id, timestamp, ip_address or "unknown", 'active'))
     
-    conn.commit()
-    conn.close()
-    
     return {
         "status": "success",
         "device_id": device_id,
@@ -456,30 +411,8 @@ async def register_device(
 @app.get("/stats")
 async def get_stats():
     """Get server statistics"""
-    conn = sqlite3.connect('argus_data.db')
-    cursor = conn.cursor()
-    
-    # Get total predictions
-    cursor.execute("SELECT COUNT(*) FROM audio_predictions")
-    total_predictions = cursor.fetchone()[0]
-    
-    # Get predictions by label
-    cursor.execute('''
-    SELECT prediction, COUNT(*) as count 
-    FROM audio_predictions 
-    GROUP BY prediction
-    ''')
-    predictions_by_label = cursor.fetchall()
-    
-    # Get today's predictions
-    cursor.execute('''
-    SELECT COUNT(*) 
-    FROM audio_predictions 
-    WHERE DATE(timestamp) = DATE('now')
-    ''')
-    today_predictions = cursor.fetchone()[0]
-    
-    conn.close()
+    # counters maintained on insert: the same few rows whatever the size of audio_predictions
+    total_predictions, predictions_by_label, today_predictions = await store.aread(prediction_stats)
     
     return {
         "server_status": "running",
@@ -487,39 +420,68 @@ async def get_stats():
         "connected_devices": len(connected_devices),
         "total_predictions": total_predictions,
         "today_predictions": today_predictions,
-        "predictions_by_label": dict(predictions_by_label),
+        "predictions_by_label": predictions_by_label,
+        "model_version": speech_models.version,
+        "database": store.stats,
+        "executor": executors["speech"].status(),
+        "debug_audio": debug_archive.status(),
+        "live_viewers": hub.status(),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/models")
+async def get_models():
+    """Active speech model version, when it was loaded and its reload history"""
+    return model_registry.status()
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket):
-    """WebSocket endpoint for real-time updates"""
+async def websocket_endpoint(
+    websocket: WebSocket,
+    device_id: Optional[str] = None,
+    label: Optional[str] = None,
+    alerts: bool = False
+):
+    """WebSocket pushing predictions and alerts as they arrive.
+    
+    Filters come from the query string (?device_id=a,b&label=whispering&alerts=true)
+    or, for existing clients, from a first JSON message {"device_id": ...}. No filter
+    means every device.
+    """
     await websocket.accept()
-    device_id = None
     
     try:
-        # Receive initial message with device ID
-        data = await websocket.receive_text()
-        message = json.loads(data)
-        device_id = message.get('device_id')
+        if not (device_id or label or alerts):
+            # Receive initial message with device ID
+            data = await websocket.receive_text()
+            message = json.loads(data)
+            device_id = message.get('device_id')
+            label = message.get('label')
+            alerts = bool(message.get('alerts'))
         
-        if device_id:
-            logger.info(f"WebSocket connected for device {device_id}")
-        
-        while True:
-            # Send latest prediction for this device
-            if device_id and device_id in latest_predictions:
-                await websocket.send_json(latest_predictions[device_id])
-            else:
+        logger.info(f"WebSocket connected (device={device_id}, label={label}, alerts={alerts})")
+        with hub.subscribe(channels_for(device_id, label, alerts)) as sub:
+            if device_id and hub.latest(device_id) is None and not label:
                 await websocket.send_json({"status": "no_data"})
-            
-            await asyncio.sleep(1)  # Update every second
+            await hub.stream_websocket(websocket, sub)
             
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
         logger.info(f"WebSocket disconnected for device {device_id}")
 
+@app.get("/events")
+async def event_stream(
+    device_id: Optional[str] = None,
+    label: Optional[str] = None,
+    alerts: bool = False
+):
+    """Server-Sent Events: the same pushes as /ws for clients that only need to listen"""
+    return StreamingResponse(
+        hub.stream_sse(channels_for(device_id, label, alerts)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Store app start time
 app_start_time = time.time()
 
@@ -1,12 +1,34 @@
 from fastapi import FastAPI, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-import librosa
-import numpy as np
-import joblib
+from contextlib import asynccontextmanager
 import uvicorn
 import time
+import sys
+from pathlib import Path
 
-app = FastAPI()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from model_registry import build_registry
+from inference_executor import build_executors, predict_speech, Saturated, saturated_response
+
+# speech model only; a retrained model in Speech-Recognition/models_output is swapped in while serving
+model_registry = build_registry(vision=False)
+speech_models = model_registry["speech"]
+# decoding, features and the SVM run on a bounded pool (INFERENCE_SPEECH_EXECUTOR), not on the event loop
+executors = build_executors(model_registry, vision=False)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if speech_models.load() is None:
+        raise RuntimeError("could not load the speech model (see log)")
+    model_registry.start()
+    executors["speech"].start()
+    yield
+    executors["speech"].stop()
+    model_registry.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,42 +37,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load ML assets
-model = joblib.load("./Speech-Recognition/models_output/best_model.joblib")
-scaler = joblib.load("./Speech-Recognition/models_output/scaler.joblib")
-encoder = joblib.load("./Speech-Recognition/models_output/label_encoder.joblib")
-
 latest_prediction = "none"
 
-def extract_features(path):
-    y, sr = librosa.load(path, sr=16000)
-    rms = np.mean(librosa.feature.rms(y=y))
-    zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-    spec = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    mfcc_mean = np.mean(mfcc, axis=1)
-    return np.hstack([rms, zcr, spec, mfcc_mean])
+@app.exception_handler(Saturated)
+async def saturated_handler(request, exc):
+    return saturated_response(exc)
 
 @app.post("/upload")
 async def upload_audio(file: UploadFile):
     global latest_prediction
 
     contents = await file.read()
-    temp_path = "temp_audio.wav"
-    with open(temp_path, "wb") as f:
-        f.write(contents)
 
     try:
-        feats = extract_features(temp_path).reshape(1, -1)
-        feats_scaled = scaler.transform(feats)
-        pred = model.predict(feats_scaled)[0]
-        label = encoder.inverse_transform([pred])[0]
+        result = await executors["speech"].run(predict_speech, contents)
+        label = result["label"]
 
         latest_prediction = label
         print("Prediction:", label)
 
-        return {"status": "ok", "prediction": label}
+        return {"status": "ok", "prediction": label, "model_version": result["model_version"]}
 
+    except Saturated:
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e)}
 
@@ -58,5 +67,9 @@ async def upload_audio(file: UploadFile):
 def get_latest():
     return {"label": latest_prediction, "timestamp": time.time()}
 
+@app.get("/models")
+def get_models():
+    return model_registry.status()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
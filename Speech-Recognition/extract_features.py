@@ -6,6 +6,10 @@ import numpy as np
 import pandas as pd
 from datetime import datetime
 import soundfile as sf
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import audio_features
 
 
 # ========== KONVERSI OTOMATIS M4A → WAV via FFmpeg ==========
@@ -39,29 +43,10 @@ def extract_features_from_signal(y, sr, frame_length_seconds=0.3):
     for start in range(0, len(y) - frame_len + 1, hop_len):
         frame = y[start:start+frame_len]
 
-        # RMS
-        rms = float(np.sqrt(np.mean(frame**2)))
-
-        # ZCR
-        try:
-            zcr = float(np.mean(librosa.feature.zero_crossing_rate(frame)[0]))
-        except Exception:
-            zcr = 0.0
-
-        # Spectral Centroid
-        try:
-            spec_cent = float(np.mean(librosa.feature.spectral_centroid(y=frame, sr=sr)))
-        except Exception:
-            spec_cent = 0.0
-
-        # MFCC
-        try:
-            mfcc = librosa.feature.mfcc(y=frame, sr=sr, n_mfcc=13)
-            mfcc_mean = [float(np.mean(mfcc[i])) for i in range(13)]
-        except Exception:
-            mfcc_mean = [0.0] * 13
-
-        features.append([rms, zcr, spec_cent] + mfcc_mean)
+        # RMS (whole frame), ZCR, Spectral Centroid, MFCC — one shared STFT per frame
+        feats = audio_features.extract_features(frame, sr, rms_mode="global")
+
+        features.append([float(v) for v in feats])
 
     return features
 
@@ -1,6 +1,10 @@
 # streamlit_dashboard.py
 import streamlit as st
 import requests
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import http_pool  # shared keep-alive session (repo root)
 import time
 import json
 import pandas as pd
@@ -196,7 +200,7 @@ def send_audio_to_api(audio_data, sample_rate=16000):
         
         # Send to FastAPI
         files = {'file': ('audio.wav', audio_bytes, 'audio/wav')}
-        response = requests.post(f"{FASTAPI_URL}/upload", files=files, timeout=10)
+        response = http_pool.post(f"{FASTAPI_URL}/upload", files=files, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -209,7 +213,7 @@ def send_audio_to_api(audio_data, sample_rate=16000):
 def get_latest_prediction():
     """Get latest prediction from FastAPI server"""
     try:
-        response = requests.get(f"{FASTAPI_URL}/latest", timeout=5)
+        response = http_pool.get(f"{FASTAPI_URL}/latest", timeout=5)
         if response.status_code == 200:
             return response.json()
     except:
@@ -391,7 +395,7 @@ def main():
         # Connection Status
         st.markdown("### 🔗 Connection Status")
         try:
-            response = requests.get(f"{FASTAPI_URL}/latest", timeout=2)
+            response = http_pool.get(f"{FASTAPI_URL}/latest", timeout=2)
             if response.status_code == 200:
                 st.success("✅ FastAPI Server Connected")
             else:
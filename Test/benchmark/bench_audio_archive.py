@@ -0,0 +1,77 @@
+"""Compare per-window MP3 export (one ffmpeg per window) with the segmented AudioArchiver.
+
+Usage:
+  python Test/benchmark/bench_audio_archive.py --devices 4 --seconds 30 --window 1.0
+
+Without ffmpeg on PATH only the WAV archiver is measured.
+"""
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from audio_archive import AudioArchiver, FFMPEG_PATH  # noqa: E402
+
+
+def per_window_mp3(windows, sr):
+    """What convert_pcm_to_audio_bytes used to do: spawn an encoder for every window."""
+    out = 0
+    for _, pcm in windows:
+        proc = subprocess.run(
+            [FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(sr), "-ac", "1",
+             "-i", "pipe:0", "-f", "mp3", "pipe:1"],
+            input=pcm, stdout=subprocess.PIPE, check=True)
+        out += len(proc.stdout)
+    return out
+
+
+def archiver(windows, sr, fmt, segment_seconds):
+    sizes = []
+    arch = AudioArchiver(lambda *seg: sizes.append(len(seg[3])), sr, 1,
+                         segment_seconds=segment_seconds, fmt=fmt, idle_seconds=3600, queue_size=len(windows) + 1)
+    for device_id, pcm in windows:
+        arch.add(device_id, pcm, label="normal_conversation")
+    arch.stop(timeout=600)
+    return sum(sizes), arch.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=30.0, help="audio per device")
+    parser.add_argument("--window", type=float, default=1.0, help="classification window length")
+    parser.add_argument("--segment", type=float, default=10.0, help="archive segment length")
+    parser.add_argument("--sr", type=int, default=16000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    per_window = int(args.window * args.sr)
+    windows = []
+    for _ in range(int(args.seconds / args.window)):
+        for d in range(args.devices):
+            pcm = (rng.standard_normal(per_window) * 3000).astype("<i2").tobytes()
+            windows.append((f"dev{d}", pcm))
+    audio_s = args.devices * args.seconds
+    print(f"{len(windows)} windows, {audio_s:.0f} s of audio, ffmpeg={'yes' if FFMPEG_PATH else 'no'}")
+    print(f"{'mode':>20} | {'wall s':>7} | {'audio s / wall s':>16} | {'out KB':>8}")
+
+    modes = [("wav", "archiver wav")]
+    if FFMPEG_PATH:
+        modes.insert(0, ("mp3", "archiver mp3"))
+        start = time.perf_counter()
+        size = per_window_mp3(windows, args.sr)
+        wall = time.perf_counter() - start
+        print(f"{'per-window mp3':>20} | {wall:>7.2f} | {audio_s / wall:>16.1f} | {size / 1024:>8.0f}")
+    for fmt, name in modes:
+        start = time.perf_counter()
+        size, stats = archiver(windows, args.sr, fmt, args.segment)
+        wall = time.perf_counter() - start
+        print(f"{name:>20} | {wall:>7.2f} | {audio_s / wall:>16.1f} | {size / 1024:>8.0f}   {stats}")
+
+
+if __name__ == "__main__":
+    main()
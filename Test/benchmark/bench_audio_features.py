@@ -0,0 +1,52 @@
+"""Compare the single-STFT feature engine with the per-feature librosa calls.
+
+Usage:
+  python Test/benchmark/bench_audio_features.py --seconds 1 2 5 --repeat 50
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from audio_features import extract_features  # noqa: E402
+
+
+def librosa_features(y, sr):
+    rms = np.mean(librosa.feature.rms(y=y))
+    zcr = np.mean(librosa.feature.zero_crossing_rate(y))
+    spec = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    return np.hstack([rms, zcr, spec, np.mean(mfcc, axis=1)])
+
+
+def timed(fn, y, sr, repeat):
+    fn(y, sr)  # warm-up (numba compilation, filterbank cache)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(y, sr)
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, nargs="+", default=[0.3, 1.0, 2.0, 5.0])
+    parser.add_argument("--sr", type=int, default=16000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'window s':>8} | {'librosa ms':>10} | {'engine ms':>9} | {'speedup':>7} | {'max abs diff':>12}")
+    for sec in args.seconds:
+        y = (rng.standard_normal(int(sec * args.sr)) * 0.1).astype(np.float32)
+        ref = timed(librosa_features, y, args.sr, args.repeat)
+        eng = timed(extract_features, y, args.sr, args.repeat)
+        diff = np.max(np.abs(librosa_features(y, args.sr) - extract_features(y, args.sr)))
+        print(f"{sec:>8.1f} | {ref:>10.2f} | {eng:>9.2f} | {ref / eng:>6.1f}x | {diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
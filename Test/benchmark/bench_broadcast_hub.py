@@ -0,0 +1,185 @@
+"""Live viewers of fastapi_iot_server: the old 1 s polling /ws loop vs BroadcastHub push.
+
+Usage:
+  python Test/benchmark/bench_broadcast_hub.py --viewers 500 --devices 40 --seconds 10 --slow 0.05
+
+One event loop, as uvicorn runs it. --devices producers each publish a
+prediction record (features and probabilities included, as /upload builds
+it) about once a second, 3% of them followed by an alert. --viewers fake
+sockets watch them:
+
+  - --dashboards of them want every device, --class-viewers only whispering,
+    the rest follow one device each;
+  - every (1 / --slow)-th viewer takes --slow-ms per send (a phone on bad Wi-Fi).
+
+Modes:
+  polling   the old loop per socket: send_json(latest_predictions[device]), sleep(1);
+            viewers that want more than one device poll the whole dict
+  hub       BroadcastHub.subscribe + stream_websocket, with publish() called by the producers
+
+Reported: sends and JSON encodes per second, the share of sends that repeated
+what the viewer already had, prediction -> viewer latency for the fast
+single-device viewers, messages dropped for slow viewers, and the process
+CPU used (time.process_time / wall time).
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import broadcast_hub  # noqa: E402
+from broadcast_hub import BroadcastHub, channels_for  # noqa: E402
+
+LABELS = ("silence", "whispering", "normal_conversation")
+
+
+class CountingJson:
+    """Stands in for the json module to count encodes."""
+
+    def __init__(self):
+        self.encodes = 0
+
+    def dumps(self, obj, **kwargs):
+        self.encodes += 1
+        return json.dumps(obj, **kwargs)
+
+
+class FakeSocket:
+    """Just enough of starlette's WebSocket for both /ws implementations."""
+
+    def __init__(self, slow_s, track, closed, counters):
+        self.slow_s = slow_s
+        self.track = track
+        self.closed = closed
+        self.counters = counters
+        self.last_seq = None
+
+    async def send_text(self, text):
+        if self.slow_s:
+            await asyncio.sleep(self.slow_s)
+        self.counters["sends"] += 1
+        self.counters["bytes"] += len(text)
+        if not self.track or not text.startswith('{"seq":'):
+            return
+        seq = int(text[7:text.index(",", 7)])
+        if seq == self.last_seq:
+            self.counters["unchanged"] += 1
+        elif not self.slow_s:
+            self.counters["latency"].append(time.perf_counter() - self.counters["published_at"][seq])
+        self.last_seq = seq
+
+    async def send_json(self, data):
+        self.counters["encodes"] += 1
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def receive(self):
+        await self.closed.wait()
+        return {"type": "websocket.disconnect"}
+
+
+async def run(mode, viewers, devices, seconds, dashboards, class_viewers, slow, slow_ms, seed=0):
+    rng = random.Random(seed)
+    counters = {"sends": 0, "bytes": 0, "unchanged": 0, "encodes": 0, "latency": [], "published_at": {}}
+    latest_predictions = {}
+    hub = BroadcastHub() if mode == "hub" else None
+    counting = CountingJson()
+    broadcast_hub.json = counting
+    closed = asyncio.Event()
+    seq = 0
+
+    async def producer(d):
+        nonlocal seq
+        device_id = f"esp32-{d}"
+        await asyncio.sleep(rng.random())
+        while not closed.is_set():
+            seq += 1
+            label = rng.choice(LABELS)
+            record = {"seq": seq, "device_id": device_id, "student_id": f"student{d}", "prediction": label,
+                      "confidence": rng.random(), "timestamp": time.time(),
+                      "features": [rng.random() for _ in range(16)],
+                      "probabilities": [rng.random() for _ in range(3)], "model_version": "20261017-120000-abcdef12"}
+            counters["published_at"][seq] = time.perf_counter()
+            latest_predictions[device_id] = record
+            if hub is not None:
+                hub.publish("prediction", record, device_id, label)
+                if rng.random() < 0.03:
+                    hub.publish("alert", {"device_id": device_id, "alert_type": "whispering_detected",
+                                          "severity": "medium"}, device_id, label)
+            await asyncio.sleep(rng.uniform(0.9, 1.1))
+
+    async def polling_viewer(sock, device_id):
+        await asyncio.sleep(rng.random())
+        while not closed.is_set():
+            if device_id is None:
+                await sock.send_json(latest_predictions)
+            elif device_id in latest_predictions:
+                await sock.send_json(latest_predictions[device_id])
+            else:
+                await sock.send_json({"status": "no_data"})
+            await asyncio.sleep(1)
+
+    tasks = [asyncio.create_task(producer(d)) for d in range(devices)]
+    for v in range(viewers):
+        if v < dashboards:
+            device_id, channels = None, channels_for()
+        elif v < dashboards + class_viewers:
+            device_id, channels = None, channels_for(label="whispering")
+        else:
+            device_id = f"esp32-{v % devices}"
+            channels = channels_for(device_id)
+        # every n-th viewer is slow, so some of them follow all devices (40 messages/s)
+        slow_s = slow_ms / 1000 if slow and v % max(1, round(1 / slow)) == 0 else 0.0
+        sock = FakeSocket(slow_s, device_id is not None, closed, counters)
+        if hub is None:
+            tasks.append(asyncio.create_task(polling_viewer(sock, device_id)))
+        else:
+            tasks.append(asyncio.create_task(hub.stream_websocket(sock, hub.subscribe(channels))))
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    closed.set()
+    if hub is not None:
+        for sub in list({s for subs in hub._channels.values() for s in subs}):
+            sub.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    broadcast_hub.json = json
+    encodes = counters["encodes"] + counting.encodes
+    dropped = hub.stats["dropped"] if hub is not None else 0
+    return wall, cpu, counters, encodes, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--viewers", type=int, default=500)
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--dashboards", type=int, default=10)
+    parser.add_argument("--class-viewers", type=int, default=20)
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of slow viewers")
+    parser.add_argument("--slow-ms", type=float, default=1500)
+    parser.add_argument("--modes", nargs="+", default=["polling", "hub"])
+    args = parser.parse_args()
+
+    print(f"{args.viewers} viewers ({args.dashboards} all-device, {args.class_viewers} whispering-only, "
+          f"{args.slow:.0%} slow), {args.devices} devices at ~1 prediction/s, {args.seconds:.0f} s")
+    print(f"{'mode':>8} | {'sends/s':>7} | {'encodes/s':>9} | {'MB/s':>5} | {'unchanged':>9} | "
+          f"{'latency p50 ms':>14} | {'latency p99 ms':>14} | {'dropped':>7} | {'CPU':>5}")
+    for mode in args.modes:
+        wall, cpu, c, encodes, dropped = asyncio.run(run(mode, args.viewers, args.devices, args.seconds,
+                                                          args.dashboards, args.class_viewers, args.slow,
+                                                          args.slow_ms))
+        latency = np.array(c["latency"] or [0.0]) * 1000
+        print(f"{mode:>8} | {c['sends'] / wall:>7.0f} | {encodes / wall:>9.0f} | {c['bytes'] / wall / 1e6:>5.2f} | "
+              f"{c['unchanged'] / max(1, c['sends']):>9.0%} | {np.percentile(latency, 50):>14.1f} | "
+              f"{np.percentile(latency, 99):>14.1f} | {dropped:>7} | {cpu / wall:>5.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Debug-audio cost in /upload: one file per upload vs the sampled DebugArchive.
+
+Usage:
+  python Test/benchmark/bench_debug_archive.py --uploads 5000 --concurrency 32 --devices 40
+
+Runs only the debug-audio part of fastapi_iot_server's /upload from
+--concurrency asyncio tasks on one event loop, with one-second 16 kHz int16
+clips (32 kB, what the ESP32 posts):
+
+  per-upload   os.makedirs + open/write of ./debug_audio/{device}_{ts}.wav in the handler
+  archive      DebugArchive.offer (default policy: 1% sample, confidence < 0.6, alerts),
+               with --low-rate of uploads under the confidence threshold and --alert-rate alerts
+  archive-all  DebugArchive.offer with sample_rate=1: every clip kept, still written off the loop
+
+Reports the time spent in the handler, uploads/s until everything is on
+disk, the files and bytes the run left behind, and the clips dropped because
+the writer queue (DEBUG_AUDIO_QUEUE_SIZE) was full.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from debug_archive import DebugArchive  # noqa: E402
+
+
+def per_upload_write(root, device_id, contents):
+    debug_path = f"{root}/{device_id}_{int(time.time() * 1000)}_{random.random():.6f}.wav"
+    os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+    with open(debug_path, "wb") as f:
+        f.write(contents)
+
+
+def disk_usage(root):
+    files = size = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+async def run(mode, root, uploads, concurrency, devices, low_rate, alert_rate):
+    archive = None
+    if mode != "per-upload":
+        archive = DebugArchive(root, sample_rate=1.0 if mode == "archive-all" else 0.01, seed=0).start()
+    rng = random.Random(0)
+    clip = bytes(32000)
+    jobs = []
+    for i in range(uploads):
+        r = rng.random()
+        confidence = 0.5 if r < low_rate else 0.9
+        jobs.append((f"dev{i % devices}", confidence, rng.random() < alert_rate))
+    handler_ms = []
+
+    async def uploader(worker):
+        for device_id, confidence, alert in jobs[worker::concurrency]:
+            start = time.perf_counter()
+            if archive is None:
+                per_upload_write(root, device_id, clip)
+            else:
+                archive.offer(device_id, clip, "silence", confidence, alert=alert)
+            handler_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(uploader(w) for w in range(concurrency)))
+    if archive is not None:
+        await asyncio.to_thread(archive.flush, 120)
+    wall = time.perf_counter() - start
+    dropped = 0
+    if archive is not None:
+        archive.stop()
+        dropped = archive.stats["dropped"]
+    return wall, np.array(handler_ms), disk_usage(root), dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--low-rate", type=float, default=0.05)
+    parser.add_argument("--alert-rate", type=float, default=0.02)
+    parser.add_argument("--modes", nargs="+", default=["per-upload", "archive", "archive-all"])
+    args = parser.parse_args()
+
+    print(f"{args.uploads} uploads of 32 kB from {args.devices} devices, {args.concurrency} concurrent handlers")
+    print(f"{'mode':>12} | {'uploads/s':>9} | {'handler p50 ms':>14} | {'handler p99 ms':>14} | "
+          f"{'files':>6} | {'MB on disk':>10} | {'dropped':>7}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = str(Path(tmp) / "debug_audio")
+            wall, handler, (files, size), dropped = asyncio.run(run(mode, root, args.uploads, args.concurrency,
+                                                                    args.devices, args.low_rate, args.alert_rate))
+        print(f"{mode:>12} | {args.uploads / wall:>9.0f} | {np.percentile(handler, 50):>14.3f} | "
+              f"{np.percentile(handler, 99):>14.3f} | {files:>6} | {size / 1e6:>10.1f} | {dropped:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Skip rate, label agreement and CPU saved by the frame change detector.
+
+Usage:
+  python Test/benchmark/bench_frame_change.py --thresholds 0 2 4 6 8 --hold 3
+
+Replays Computer-Vision/dataset_photo/Dataset in capture order (frame_N.jpg,
+sampled about a second apart from an exam recording) as one device's stream,
+re-encoded at the ESP32-CAM's 160x120. Each photo is held for --hold frames
+with a little sensor noise, as a camera sending several frames per second
+would produce. The "model" answers with the photo's label from
+auto_labeled_dataset.csv, after spending the time of a real ResNet18 forward
+(the served artifact if present, random weights otherwise), so the table shows
+both how often a reused label is wrong and how much inference time is saved.
+"""
+import io
+import re
+import csv
+import sys
+import time
+import glob
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from frame_change import FrameChangeDetector  # noqa: E402
+from vision_preprocess import FramePreprocessor  # noqa: E402
+from vision_runtime import build_resnet18, load_vision_model  # noqa: E402
+
+DATASET = ROOT / "Computer-Vision" / "dataset_photo"
+
+
+def load_stream(hold, size, seed):
+    labels = {}
+    with open(DATASET / "auto_labeled_dataset.csv", newline="") as f:
+        for row in csv.DictReader(f):
+            labels[row["image"]] = row["label"]
+    paths = sorted(glob.glob(str(DATASET / "Dataset" / "*.jpg")), key=lambda p: int(re.findall(r"\d+", Path(p).name)[0]))
+    rng = np.random.default_rng(seed)
+    stream = []
+    for path in paths:
+        name = Path(path).name
+        if name not in labels:
+            continue
+        base = np.asarray(Image.open(path).convert("RGB").resize(size, Image.BILINEAR), dtype=np.int16)
+        for _ in range(hold):
+            noisy = np.clip(base + rng.normal(0, 3, base.shape), 0, 255).astype(np.uint8)
+            buf = io.BytesIO()
+            Image.fromarray(noisy).save(buf, "JPEG", quality=80)
+            stream.append((buf.getvalue(), labels[name]))
+    return stream
+
+
+def make_model():
+    try:
+        model, _ = load_vision_model(3, "cpu", model_dir=str(ROOT / "Computer-Vision"))
+    except (FileNotFoundError, ValueError):
+        model = build_resnet18(3).eval()
+    return model
+
+
+def run(stream, threshold, max_staleness, fps, model, pre):
+    detector = FrameChangeDetector(threshold=threshold, max_staleness=max_staleness, log_seconds=0)
+    truth = {}
+
+    def classify(image_bytes):
+        with torch.no_grad():
+            model(pre.batch([image_bytes]))
+        return truth["label"]
+
+    agree = 0
+    start = time.perf_counter()
+    for i, (frame, label) in enumerate(stream):
+        truth["label"] = label
+        got, _ = detector.classify("cam-01", frame, classify, now=i / fps)
+        agree += got == label
+    wall = time.perf_counter() - start
+    return detector.stats(), agree / len(stream), wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0, 2, 4, 6, 8])
+    parser.add_argument("--hold", type=int, default=3, help="frames sent per dataset photo")
+    parser.add_argument("--fps", type=float, default=3.0, help="frame rate used for the staleness clock")
+    parser.add_argument("--max-staleness", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    stream = load_stream(args.hold, (160, 120), args.seed)
+    model, pre = make_model(), FramePreprocessor(max_batch=1)
+    print(f"{len(stream)} frames, hold={args.hold}, {args.fps:g} fps, max staleness {args.max_staleness:g}s")
+    print(f"{'threshold':>9} | {'skip rate':>9} | {'label agree':>11} | {'thumb ms':>8} | "
+          f"{'infer ms':>8} | {'CPU saved s':>11} | {'wall s':>6}")
+    for threshold in args.thresholds:
+        stats, agreement, wall = run(stream, threshold, args.max_staleness, args.fps, model, pre)
+        print(f"{threshold:>9g} | {stats['skip_rate']:>9.1%} | {agreement:>11.1%} | {stats['mean_thumbnail_ms']:>8.3f} | "
+              f"{stats['mean_inference_ms']:>8.1f} | {stats['cpu_saved_seconds']:>11.2f} | {wall:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
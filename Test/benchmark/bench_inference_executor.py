@@ -0,0 +1,115 @@
+"""Concurrent /upload load on the speech server: inline inference vs thread and process pools.
+
+Usage:
+  python Test/benchmark/bench_inference_executor.py --clients 16 --requests 20 --workers 4
+
+Drives Server/speech_server.py's app in-process through httpx's ASGI
+transport (one event loop, like uvicorn with one worker) with --clients
+concurrent uploaders, each posting --requests one-second 16 kHz WAV clips.
+Meanwhile a probe requests the cheap `/latest` endpoint every 10 ms: its
+latency is what every other request and the `/ws` loop see while uploads
+are being classified.
+
+Rows: inline (the old behaviour), thread and process pools of --workers,
+and the thread pool with --saturate-pending as its admission limit, to show
+the 503 + Retry-After path. Uses the speech model in
+Speech-Recognition/models_output.
+"""
+import io
+import sys
+import time
+import wave
+import asyncio
+import argparse
+import contextlib
+from pathlib import Path
+
+import numpy as np
+import httpx
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Server"))
+import speech_server  # noqa: E402
+from inference_executor import InferenceExecutor  # noqa: E402
+
+
+def make_wav(seed, seconds=1.0, sr=16000):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    y = 0.2 * np.sin(2 * np.pi * rng.uniform(150, 400) * t) + rng.normal(0, 0.05, t.shape)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+async def run(kind, workers, max_pending, clients, requests, clips):
+    speech_server.executors["speech"] = InferenceExecutor("speech", kind, workers, max_pending,
+                                                          speech=True, vision=False)
+    app = speech_server.app
+    upload_ms, probe_ms, codes = [], [], {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await client.post("/upload", files={"file": ("warm.wav", clips[0], "audio/wav")})
+            done = asyncio.Event()
+
+            async def uploader(c):
+                for r in range(requests):
+                    clip = clips[(c * requests + r) % len(clips)]
+                    start = time.perf_counter()
+                    resp = await client.post("/upload", files={"file": ("a.wav", clip, "audio/wav")})
+                    upload_ms.append((time.perf_counter() - start) * 1000)
+                    codes[resp.status_code] = codes.get(resp.status_code, 0) + 1
+                    if resp.status_code == 503:
+                        # a real device would wait Retry-After seconds; keep the load on
+                        await asyncio.sleep(0.01)
+
+            async def probe():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/latest")
+                    probe_ms.append((time.perf_counter() - start) * 1000)
+                    await asyncio.sleep(0.01)
+
+            probing = asyncio.create_task(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(uploader(c) for c in range(clients)))
+            wall = time.perf_counter() - start
+            done.set()
+            await probing
+    return wall, np.array(upload_ms), np.array(probe_ms or [0.0]), codes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=20, help="uploads per client")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--saturate-pending", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread", "process", "thread-bounded"])
+    args = parser.parse_args()
+
+    clips = [make_wav(i) for i in range(16)]
+    total = args.clients * args.requests
+    print(f"{args.clients} clients x {args.requests} uploads of 1 s WAV, {args.workers} workers")
+    print(f"{'mode':>15} | {'ok/s':>6} | {'upload p50 ms':>13} | {'upload p99 ms':>13} | "
+          f"{'probe p50 ms':>12} | {'probe p99 ms':>12} | {'probe max ms':>12} | {'503s':>5}")
+    for mode in args.modes:
+        kind = "thread" if mode == "thread-bounded" else mode
+        limit = args.saturate_pending if mode == "thread-bounded" else total + 1
+        with contextlib.redirect_stdout(io.StringIO()):  # the server prints every prediction
+            wall, upload, probe, codes = asyncio.run(run(kind, args.workers, limit, args.clients, args.requests,
+                                                         clips))
+        ok = codes.get(200, 0)
+        print(f"{mode:>15} | {ok / wall:>6.1f} | {np.percentile(upload, 50):>13.1f} | "
+              f"{np.percentile(upload, 99):>13.1f} | {np.percentile(probe, 50):>12.1f} | "
+              f"{np.percentile(probe, 99):>12.1f} | {probe.max():>12.1f} | {codes.get(503, 0):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""/stats and /alerts read cost against history size, before and after schema version 2.
+
+Usage:
+  python Test/benchmark/bench_iot_stats.py --rows 100000 1000000 --devices 40 --days 30
+
+For each size, a database at schema version 1 (the original tables, no
+indexes) is filled with predictions spread over --days and --devices, plus
+one alert per 20 predictions. Then it times:
+
+  /stats      COUNT(*), GROUP BY prediction and DATE(timestamp) = DATE('now') over
+              audio_predictions, vs prediction_stats() on the counters
+  /alerts     unresolved alerts, newest first, LIMIT 20, without vs with the index
+  rollup      one device's last 60 minutes from prediction_rollups
+
+and how long `migrate` takes to add the indexes and backfill the counters,
+and the per-row cost of the insert triggers (batches of 200, as the writer commits).
+"""
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from sqlite_store import MIGRATIONS, migrate, prediction_stats, device_rollup, INSERT_PREDICTION, sql_now  # noqa: E402
+
+LABELS = ("silence", "whispering", "normal_conversation")
+ALERTS_SQL = "SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC LIMIT 20"
+
+
+def legacy_stats(conn):
+    total = conn.execute("SELECT COUNT(*) FROM audio_predictions").fetchone()[0]
+    by_label = dict(conn.execute("SELECT prediction, COUNT(*) FROM audio_predictions GROUP BY prediction").fetchall())
+    today = conn.execute(
+        "SELECT COUNT(*) FROM audio_predictions WHERE DATE(timestamp) = DATE('now')").fetchone()[0]
+    return total, by_label, today
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def fill(conn, rows, devices, days, seed=0):
+    rng = random.Random(seed)
+    now = time.time()
+    conn.execute("BEGIN")
+    for statement in MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.execute("PRAGMA user_version = 1")
+    predictions, alerts = [], []
+    for i in range(rows):
+        ts = sql_now(now - rng.random() * days * 86400)
+        device = f"dev{rng.randrange(devices)}"
+        predictions.append((device, "student", rng.choice(LABELS), rng.random(), ts, "[]"))
+        if i % 20 == 0:
+            alerts.append((device, "whispering_detected", "medium", "bench", ts, int(rng.random() < 0.8)))
+    conn.executemany(INSERT_PREDICTION, predictions)
+    conn.executemany("INSERT INTO alerts (device_id, alert_type, severity, description, timestamp, resolved) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", alerts)
+    conn.execute("COMMIT")
+
+
+def insert_cost(conn, n=2000, batch=200):
+    rows = [("dev0", "student", LABELS[i % 3], 0.5, sql_now(), "[]") for i in range(n)]
+    start = time.perf_counter()
+    for i in range(0, n, batch):
+        with conn:
+            conn.executemany(INSERT_PREDICTION, rows[i:i + batch])
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} | {'/stats v1 ms':>12} | {'/stats v2 ms':>12} | {'/alerts v1 ms':>13} | "
+          f"{'/alerts v2 ms':>13} | {'rollup ms':>9} | {'migrate s':>9} | {'insert us/row v1 -> v2':>22}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(str(Path(tmp) / "argus.db"), isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            fill(conn, rows, args.devices, args.days)
+            conn.isolation_level = ""
+            stats_v1, old = timed(lambda: legacy_stats(conn), args.repeat)
+            alerts_v1, _ = timed(lambda: conn.execute(ALERTS_SQL).fetchall(), args.repeat)
+            insert_v1 = insert_cost(conn)
+
+            start = time.perf_counter()
+            migrate(conn)
+            migrate_s = time.perf_counter() - start
+            stats_v2, new = timed(lambda: prediction_stats(conn), args.repeat)
+            assert old[0] + 2000 == new[0], (old, new)
+            alerts_v2, _ = timed(lambda: conn.execute(ALERTS_SQL).fetchall(), args.repeat)
+            rollup, _ = timed(lambda: device_rollup(conn, "dev1", 60), args.repeat)
+            insert_v2 = insert_cost(conn)
+            conn.close()
+        print(f"{rows:>9} | {stats_v1:>12.2f} | {stats_v2:>12.3f} | {alerts_v1:>13.2f} | {alerts_v2:>13.3f} | "
+              f"{rollup:>9.3f} | {migrate_s:>9.2f} | {insert_v1:>10.1f} -> {insert_v2:<9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Sustained /upload database throughput: per-request connections vs SQLiteStore.
+
+Usage:
+  python Test/benchmark/bench_sqlite_store.py --uploads 5000 --concurrency 32 --alert-rate 0.1
+
+Runs only the database part of fastapi_iot_server's /upload (prediction row,
+plus an alert row for --alert-rate of uploads) from --concurrency asyncio
+tasks on one event loop, as uvicorn does, against a fresh database file:
+
+  per-request     sqlite3.connect + INSERT + COMMIT + close inside the handler
+                  (what the server did: default rollback journal, synchronous=FULL)
+  store           SQLiteStore.insert_prediction / insert_alert (WAL, writer thread, batches)
+
+While the uploads run, a reader task polls the /alerts query; its latency is
+reported too, as that is what a dashboard sees while the server is busy.
+Uploads/s counts until every row is committed.
+"""
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from sqlite_store import SQLiteStore, migrate  # noqa: E402
+
+ALERTS_SQL = "SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC LIMIT 20"
+FEATURES = json.dumps([round(random.random(), 6) for _ in range(16)])
+
+
+def init(path):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+
+
+def per_request_upload(path, device_id, alert):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+    INSERT INTO audio_predictions (device_id, student_id, prediction, confidence, audio_features)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (device_id, "student", "whispering", 0.9, FEATURES))
+    if alert:
+        cursor.execute('''
+        INSERT INTO alerts (device_id, alert_type, severity, description)
+        VALUES (?, ?, ?, ?)
+        ''', (device_id, "whispering_detected", "medium", "Whispering detected with 0.90 confidence"))
+    conn.commit()
+    conn.close()
+
+
+async def run(mode, path, uploads, concurrency, alert_rate):
+    store = SQLiteStore(path).start() if mode == "store" else None
+    rng = random.Random(0)
+    jobs = [(f"dev{i % 40}", rng.random() < alert_rate) for i in range(uploads)]
+    handler_ms, read_ms = [], []
+    done = asyncio.Event()
+
+    async def uploader(worker):
+        for device_id, alert in jobs[worker::concurrency]:
+            start = time.perf_counter()
+            if store is None:
+                per_request_upload(path, device_id, alert)
+            else:
+                store.insert_prediction(device_id, "student", "whispering", 0.9, FEATURES)
+                if alert:
+                    store.insert_alert(device_id, "whispering_detected", "medium",
+                                       "Whispering detected with 0.90 confidence")
+            handler_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0)  # the rest of the request (feature extraction etc.) yields here
+
+    async def reader():
+        while not done.is_set():
+            start = time.perf_counter()
+            if store is None:
+                conn = sqlite3.connect(path)
+                conn.execute(ALERTS_SQL).fetchall()
+                conn.close()
+            else:
+                await store.aquery(ALERTS_SQL)
+            read_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    reading = asyncio.create_task(reader())
+    await asyncio.gather(*(uploader(w) for w in range(concurrency)))
+    if store is not None:
+        await asyncio.to_thread(store.flush, 60)
+    wall = time.perf_counter() - start
+    done.set()
+    await reading
+    stats = None
+    if store is not None:
+        stats = dict(store.stats)
+        store.stop()
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT COUNT(*) FROM audio_predictions").fetchone()[0]
+    conn.close()
+    assert rows == uploads, (mode, rows)
+    return wall, np.array(handler_ms), np.array(read_ms or [0.0]), stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--alert-rate", type=float, default=0.1)
+    parser.add_argument("--modes", nargs="+", default=["per-request", "store"])
+    args = parser.parse_args()
+
+    print(f"{args.uploads} uploads, {args.concurrency} concurrent handlers, {args.alert_rate:.0%} with an alert")
+    print(f"{'mode':>12} | {'uploads/s':>9} | {'handler p50 ms':>14} | {'handler p99 ms':>14} | "
+          f"{'/alerts p50 ms':>14} | {'/alerts p99 ms':>14} | {'batches':>7}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "argus_data.db")
+            init(path)
+            wall, handler, reads, stats = asyncio.run(run(mode, path, args.uploads, args.concurrency,
+                                                          args.alert_rate))
+        batches = stats["batches"] if stats else args.uploads
+        print(f"{mode:>12} | {args.uploads / wall:>9.0f} | {np.percentile(handler, 50):>14.3f} | "
+              f"{np.percentile(handler, 99):>14.3f} | {np.percentile(reads, 50):>14.3f} | "
+              f"{np.percentile(reads, 99):>14.3f} | {batches:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure ResNet18 vision throughput (frames/sec) against batch size.
+
+Usage:
+  python Test/benchmark/bench_vision_batch.py --frames 64 --batch-sizes 1 2 4 8 16
+
+Runs two passes: a raw stacked forward for each batch size, then the same
+frames pushed through `VisionBatcher` from several concurrent callers, which
+is how the MQTT workers and /upload_frame use it. Uses the trained weights
+when ./Computer-Vision/cheating_cnn_model.pth exists, random weights otherwise
+(throughput does not depend on the weights).
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from torchvision import models
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from vision_batcher import VisionBatcher  # noqa: E402
+
+
+def build_model(num_classes=3):
+    model = models.resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    weights = Path("./Computer-Vision/cheating_cnn_model.pth")
+    if weights.exists():
+        model.load_state_dict(torch.load(weights, map_location="cpu"))
+    model.eval()
+    return model
+
+
+def bench_raw(model, frames, batch_size):
+    start = time.perf_counter()
+    with torch.no_grad():
+        for i in range(0, len(frames), batch_size):
+            model(torch.stack(frames[i:i + batch_size]))
+    return len(frames) / (time.perf_counter() - start)
+
+
+def bench_batcher(model, frames, batch_size, callers, wait_ms):
+    batcher = VisionBatcher(model, max_batch_size=batch_size, max_wait_ms=wait_ms).start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(batcher.classify, frames))
+    fps = len(frames) / (time.perf_counter() - start)
+    mean_batch = batcher.mean_batch_size
+    batcher.stop()
+    return fps, mean_batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--callers", type=int, default=16, help="concurrent submitters for the batcher pass")
+    parser.add_argument("--wait-ms", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = build_model()
+    frames = [torch.randn(3, 224, 224) for _ in range(args.frames)]
+    bench_raw(model, frames[:4], 4)  # warm-up
+
+    print(f"{'batch':>5} | {'raw fps':>8} | {'batcher fps':>11} | {'mean batch':>10}")
+    for bs in args.batch_sizes:
+        raw = bench_raw(model, frames, bs)
+        fps, mean_batch = bench_batcher(model, frames, bs, args.callers, args.wait_ms)
+        print(f"{bs:>5} | {raw:>8.1f} | {fps:>11.1f} | {mean_batch:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
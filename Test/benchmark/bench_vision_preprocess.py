@@ -0,0 +1,127 @@
+"""Compare the fused frame preprocessing with the torchvision `cv_transform` chain.
+
+Usage:
+  python Test/benchmark/bench_vision_preprocess.py --frames 64 --repeat 3
+
+Uses the photos in Computer-Vision/dataset_photo/Dataset (1280x720) and the
+same photos re-encoded as 160x120 QQVGA JPEGs, like the ESP32-CAM sends. For
+each it reports ms per frame for:
+
+  cv_transform     Image.open().convert("RGB") + Resize + ToTensor + Normalize, then torch.stack
+  fused            FramePreprocessor.tensor (one tensor per frame, as fed to VisionBatcher)
+  fused batch      FramePreprocessor.batch (written into the reused batch buffer)
+
+plus the largest difference from cv_transform's tensors and, with a vision
+model, the share of frames whose predicted class is unchanged. Draft decoding
+(VISION_JPEG_DRAFT) is measured on and off. Uses the served model artifact
+when one exists under ./Computer-Vision, random weights otherwise.
+"""
+import io
+import sys
+import glob
+import time
+import argparse
+from pathlib import Path
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from vision_preprocess import FramePreprocessor  # noqa: E402
+from vision_runtime import build_resnet18, load_vision_model  # noqa: E402
+
+cv_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def load_frames(limit, size=None):
+    frames = []
+    for path in sorted(glob.glob(str(ROOT / "Computer-Vision" / "dataset_photo" / "Dataset" / "*.jpg")))[:limit]:
+        if size is None:
+            frames.append(Path(path).read_bytes())
+            continue
+        buf = io.BytesIO()
+        Image.open(path).convert("RGB").resize(size, Image.BILINEAR).save(buf, "JPEG", quality=80)
+        frames.append(buf.getvalue())
+    if not frames:
+        raise SystemExit("No images found in Computer-Vision/dataset_photo/Dataset")
+    return frames
+
+
+def load_model():
+    try:
+        model, name = load_vision_model(3, "cpu", model_dir=str(ROOT / "Computer-Vision"))
+        return model, name
+    except (FileNotFoundError, ValueError):
+        torch.manual_seed(0)
+        return build_resnet18(3).eval(), "random weights"
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def predict(model, batch, chunk=16):
+    with torch.no_grad():
+        return torch.cat([torch.argmax(model(batch[i:i + chunk]), dim=1) for i in range(0, len(batch), chunk)])
+
+
+def run(label, frames, model, repeat, batch_size):
+    baseline_s, reference = timed(
+        lambda: torch.stack([cv_transform(Image.open(io.BytesIO(f)).convert("RGB")) for f in frames]), repeat)
+    ref_pred = predict(model, reference) if model is not None else None
+    n = len(frames)
+    print(f"\n{label}: {n} frames")
+    print(f"{'path':>24} | {'ms/frame':>8} | {'speedup':>7} | {'max diff':>8} | {'same label':>10}")
+    print(f"{'cv_transform':>24} | {baseline_s / n * 1000:>8.3f} | {1.0:>6.2f}x | {0.0:>8.2g} | {'-':>10}")
+    for draft in (False, True):
+        pre = FramePreprocessor(max_batch=batch_size, draft=draft)
+        single_s, single = timed(lambda: torch.stack([pre.tensor(f) for f in frames]), repeat)
+
+        def batched():
+            out = torch.empty_like(reference)
+            for i in range(0, n, batch_size):
+                out[i:i + batch_size] = pre.batch(frames[i:i + batch_size])
+            return out
+        batch_s, _ = timed(lambda: [pre.batch(frames[i:i + batch_size]) for i in range(0, n, batch_size)], repeat)
+        diff = float((single - reference).abs().max())
+        same = "-"
+        if ref_pred is not None:
+            same = f"{float((predict(model, batched()) == ref_pred).float().mean()):.1%}"
+        tag = "draft" if draft else "full decode"
+        print(f"{'fused, ' + tag:>24} | {single_s / n * 1000:>8.3f} | {baseline_s / single_s:>6.2f}x | "
+              f"{diff:>8.2g} | {same:>10}")
+        print(f"{'fused batch, ' + tag:>24} | {batch_s / n * 1000:>8.3f} | {baseline_s / batch_s:>6.2f}x | "
+              f"{diff:>8.2g} | {same:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--no-model", action="store_true", help="skip the label agreement column")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)  # preprocessing runs per worker thread; keep the comparison single-threaded
+    model = None
+    if not args.no_model:
+        model, name = load_model()
+        print(f"Vision model: {name}")
+    run("dataset photos (1280x720)", load_frames(args.frames), model, args.repeat, args.batch_size)
+    run("ESP32-CAM QQVGA (160x120)", load_frames(args.frames, (160, 120)), model, args.repeat, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
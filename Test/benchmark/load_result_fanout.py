@@ -0,0 +1,182 @@
+"""Broker fan-out of integrity results for a room of simulated devices.
+
+Counts how many messages the broker has to deliver when every device's
+results go to the legacy shared topic versus per-device topics, with and
+without change-driven publishing.
+
+By default the broker is simulated (a delivery per matching subscription,
+using paho's topic matcher). With --broker the same traffic is sent through a
+real broker: one subscriber client per device plus one dashboard client, and
+the counts are what the clients actually received.
+
+Usage:
+  python Test/benchmark/load_result_fanout.py --devices 36 --windows 300
+  python Test/benchmark/load_result_fanout.py --devices 36 --windows 60 --broker localhost:1883
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from integrity_publisher import IntegrityPublisher  # noqa: E402
+
+BASE_TOPIC = "iot/integrity/result"
+AGGREGATE_TOPIC = "iot/integrity/all"
+
+# integrity scores the consumer can produce for typical (vision, audio) label pairs
+CALM = [100.0, 84.0, 80.0]
+SUSPICIOUS = [64.0, 52.0, 36.0, 24.0]
+
+
+def score_stream(rng, windows, alert_rate=0.03, alert_len=5, change_rate=0.2):
+    """Mostly calm windows with occasional short bursts of suspicious behaviour.
+
+    Behaviour persists between windows: the score only changes with probability `change_rate`.
+    """
+    scores = []
+    alert_left = 0
+    current = CALM[0]
+    for _ in range(windows):
+        if alert_left == 0 and rng.random() < alert_rate:
+            alert_left = alert_len
+            current = rng.choice(SUSPICIOUS)
+        if alert_left:
+            alert_left -= 1
+            if rng.random() < change_rate:
+                current = rng.choice(SUSPICIOUS)
+            if alert_left == 0:
+                current = rng.choice(CALM)
+        elif rng.random() < change_rate:
+            current = rng.choice(CALM)
+        scores.append(current)
+    return scores
+
+
+def subscriptions(devices, mode, aggregate):
+    subs = []
+    for d in devices:
+        if mode == "legacy":
+            subs.append((d, BASE_TOPIC))
+        else:
+            subs.append((d, f"{BASE_TOPIC}/{d}"))
+    subs.append(("dashboard", AGGREGATE_TOPIC if aggregate else
+                 (BASE_TOPIC if mode == "legacy" else f"{BASE_TOPIC}/+")))
+    return subs
+
+
+class _CountingPublisher:
+    def __init__(self, subs):
+        self.subs = subs
+        self.publishes = 0
+        self.deliveries = 0
+        self.per_device = {}
+
+    def publish(self, topic, payload):
+        self.publishes += 1
+        for client_id, sub in self.subs:
+            if mqtt.topic_matches_sub(sub, topic):
+                self.deliveries += 1
+                self.per_device[client_id] = self.per_device.get(client_id, 0) + 1
+
+
+def _scenario(devices, windows, seed, mode, debounce, aggregate):
+    rng = random.Random(seed)
+    streams = {d: score_stream(rng, windows) for d in devices}
+    # debounce off: a negative score delta lets every window through
+    pub = IntegrityPublisher(BASE_TOPIC, mode=mode, aggregate_topic=AGGREGATE_TOPIC if aggregate else "",
+                             score_delta=10 if debounce else -1, heartbeat_seconds=30)
+    return streams, pub
+
+
+def run_simulated(devices, windows, seed, mode, debounce, aggregate, window_seconds=1.0):
+    streams, pub = _scenario(devices, windows, seed, mode, debounce, aggregate)
+    broker = _CountingPublisher(subscriptions(devices, mode, aggregate))
+    for w in range(windows):
+        for d in devices:
+            pub.update(broker, d, streams[d][w], now=w * window_seconds)
+    return broker.publishes, broker.deliveries, broker.per_device
+
+
+def _client(client_id, host, port):
+    c = mqtt.Client(client_id=client_id)
+    if os.getenv("HIVEMQ_USER") and os.getenv("HIVEMQ_PASS"):
+        c.username_pw_set(os.getenv("HIVEMQ_USER"), os.getenv("HIVEMQ_PASS"))
+    if port == 8883:
+        c.tls_set()
+    c.connect(host, port, 60)
+    c.loop_start()
+    return c
+
+
+def run_broker(devices, windows, seed, mode, debounce, aggregate, host, port):
+    streams, pub = _scenario(devices, windows, seed, mode, debounce, aggregate)
+    received = {}
+    lock = threading.Lock()
+    clients = []
+    tag = f"fanout-{os.getpid()}-{int(time.time())}"
+    for client_id, sub in subscriptions(devices, mode, aggregate):
+        c = _client(f"{tag}-{client_id}", host, port)
+
+        def on_message(_c, _u, _m, client_id=client_id):
+            with lock:
+                received[client_id] = received.get(client_id, 0) + 1
+        c.on_message = on_message
+        c.subscribe(sub, qos=1)
+        clients.append(c)
+    time.sleep(1.0)
+    publisher = _client(f"{tag}-consumer", host, port)
+    sent = []
+
+    class _Pub:
+        def publish(self, topic, payload):
+            sent.append(publisher.publish(topic, payload, qos=1))
+    wrapper = _Pub()
+    for w in range(windows):
+        for d in devices:
+            pub.update(wrapper, d, streams[d][w], now=float(w))
+    for info in sent:
+        info.wait_for_publish()
+    time.sleep(2.0)
+    for c in clients + [publisher]:
+        c.loop_stop()
+        c.disconnect()
+    return len(sent), sum(received.values()), received
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=36)
+    parser.add_argument("--windows", type=int, default=300, help="audio windows per device (~1 s each)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--broker", help="host[:port] of a real broker; simulated if omitted")
+    args = parser.parse_args()
+
+    devices = [f"esp32_audio_{i:02d}" for i in range(1, args.devices + 1)]
+    scenarios = [
+        ("legacy, every window", "legacy", False, False),
+        ("legacy, debounced", "legacy", True, False),
+        ("per-device, every window", "device", False, False),
+        ("per-device, debounced", "device", True, False),
+        ("per-device + aggregate", "device", True, True),
+    ]
+    print(f"{args.devices} devices x {args.windows} windows, broker={'real ' + args.broker if args.broker else 'simulated'}")
+    print(f"{'scenario':>26} | {'publishes':>9} | {'deliveries':>10} | {'per device':>10}")
+    for name, mode, debounce, aggregate in scenarios:
+        if args.broker:
+            host, _, port = args.broker.partition(":")
+            publishes, deliveries, per = run_broker(devices, args.windows, args.seed, mode, debounce, aggregate,
+                                                    host, int(port or 1883))
+        else:
+            publishes, deliveries, per = run_simulated(devices, args.windows, args.seed, mode, debounce, aggregate)
+        device_avg = sum(per.get(d, 0) for d in devices) / len(devices)
+        print(f"{name:>26} | {publishes:>9} | {deliveries:>10} | {device_avg:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 Usage:
   python local_audio_capture.py --duration 3
+  python local_audio_capture.py --mqtt --binary   # int16 PCM chunks in the binary payload format
 
 Environment variables (via .env or env):
   HIVEMQ_HOST, HIVEMQ_PORT (default 1883), HIVEMQ_USER, HIVEMQ_PASS
@@ -9,21 +10,27 @@ Environment variables (via .env or env):
   LOCAL_DEVICE_ID (default local_device)
 
 The script records audio, encodes it as WAV bytes, base64-encodes and publishes a JSON
-payload to the MQTT topic similar to what real devices send.
+payload to the MQTT topic similar to what real devices send. With --binary the raw
+samples are sent instead as sequenced chunks using payload_codec (see payload_codec.py).
 """
 import os
+import sys
 import time
 import json
 import base64
 import tempfile
 import argparse
 import logging
+from pathlib import Path
 
 import sounddevice as sd
 import soundfile as sf
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from payload_codec import encode_audio
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("local_audio_capture")
@@ -37,11 +44,17 @@ TOPIC_AUDIO = os.getenv("HIVEMQ_TOPIC_AUDIO", "esp32mic/audio")
 DEVICE_ID = os.getenv("LOCAL_DEVICE_ID", "local_device")
 
 
-def record_wav_bytes(duration=3, samplerate=16000, channels=1):
-    """Record audio from the default microphone and return WAV bytes."""
+def record_pcm(duration=3, samplerate=16000, channels=1):
+    """Record audio from the default microphone and return int16 samples (frames, channels)."""
     logger.info("Recording %s seconds from microphone...", duration)
     data = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=channels, dtype='int16')
     sd.wait()
+    return data
+
+
+def record_wav_bytes(duration=3, samplerate=16000, channels=1):
+    """Record audio from the default microphone and return WAV bytes."""
+    data = record_pcm(duration, samplerate, channels)
     with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tf:
         tmp_path = tf.name
     sf.write(tmp_path, data, samplerate)
@@ -54,14 +67,7 @@ def record_wav_bytes(duration=3, samplerate=16000, channels=1):
     return b
 
 
-def publish_audio_bytes(audio_bytes, fmt="wav"):
-    payload = {
-        "device_id": DEVICE_ID,
-        "timestamp": int(time.time()),
-        "format": fmt,
-        "data": base64.b64encode(audio_bytes).decode("utf-8")
-    }
-
+def _connect():
     client = mqtt.Client()
     if HIVEMQ_USER and HIVEMQ_PASS:
         client.username_pw_set(HIVEMQ_USER, HIVEMQ_PASS)
@@ -72,20 +78,54 @@ def publish_audio_bytes(audio_bytes, fmt="wav"):
         pass
     client.connect(HIVEMQ_HOST, HIVEMQ_PORT, 60)
     client.loop_start()
+    return client
+
+
+def publish_audio_bytes(audio_bytes, fmt="wav"):
+    payload = {
+        "device_id": DEVICE_ID,
+        "timestamp": int(time.time()),
+        "format": fmt,
+        "data": base64.b64encode(audio_bytes).decode("utf-8")
+    }
+
+    client = _connect()
     client.publish(TOPIC_AUDIO, json.dumps(payload))
     logger.info("Published audio to %s", TOPIC_AUDIO)
     client.loop_stop()
     client.disconnect()
 
 
+def publish_audio_pcm(samples, samplerate=16000, channels=1, chunk_seconds=0.1):
+    """Publish int16 samples as sequenced binary chunks, the way the mic firmware streams."""
+    flat = samples.reshape(-1)
+    step = max(channels, int(samplerate * chunk_seconds) * channels)
+    starts = range(0, len(flat), step)
+    client = _connect()
+    for seq, start in enumerate(starts):
+        payload = encode_audio(DEVICE_ID, flat[start:start + step], seq=seq,
+                               sample_rate=samplerate, channels=channels)
+        info = client.publish(TOPIC_AUDIO, payload)
+        if seq == len(starts) - 1:
+            info.wait_for_publish()
+    logger.info("Published %d binary audio chunks to %s", len(starts), TOPIC_AUDIO)
+    client.loop_stop()
+    client.disconnect()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--duration", type=float, default=3.0, help="seconds to record")
     parser.add_argument("--mqtt", action="store_true", help="publish to MQTT instead of saving locally")
+    parser.add_argument("--binary", action="store_true", help="with --mqtt, send PCM chunks in the binary payload format")
     parser.add_argument("--classify", action="store_true", help="classify locally after capture (imports ai_mqtt_consumer)")
     parser.add_argument("--upload", action="store_true", help="upload captured file and metadata to Supabase (requires credentials)")
     args = parser.parse_args()
 
+    if args.mqtt and args.binary:
+        publish_audio_pcm(record_pcm(duration=args.duration))
+        return
+
     audio = record_wav_bytes(duration=args.duration)
 
     # Default: save locally and optionally classify. MQTT is opt-in.
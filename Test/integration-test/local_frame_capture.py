@@ -2,6 +2,7 @@
 
 Usage:
   python local_frame_capture.py
+  python local_frame_capture.py --mqtt --binary   # raw JPEG in the binary payload format
 
 Environment variables (via .env or env):
   HIVEMQ_HOST, HIVEMQ_PORT (default 1883), HIVEMQ_USER, HIVEMQ_PASS
@@ -9,18 +10,24 @@ Environment variables (via .env or env):
   LOCAL_DEVICE_ID (default local_device)
 
 The script captures a frame, JPEG-encodes it, base64-encodes and publishes a JSON
-payload to the MQTT topic similar to what real devices send.
+payload to the MQTT topic similar to what real devices send. With --binary the JPEG
+bytes are sent as-is behind a small header (see payload_codec.py), skipping base64.
 """
 import os
+import sys
 import time
 import json
 import base64
 import logging
+from pathlib import Path
 
 import cv2
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from payload_codec import encode_frame
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("local_frame_capture")
@@ -48,13 +55,16 @@ def capture_frame_bytes(fmt="jpg"):
     return encoded.tobytes()
 
 
-def publish_frame_bytes(frame_bytes, fmt="jpg"):
-    payload = {
-        "device_id": DEVICE_ID,
-        "timestamp": int(time.time()),
-        "format": fmt,
-        "data": base64.b64encode(frame_bytes).decode("utf-8")
-    }
+def publish_frame_bytes(frame_bytes, fmt="jpg", binary=False):
+    if binary:
+        payload = encode_frame(DEVICE_ID, frame_bytes)
+    else:
+        payload = json.dumps({
+            "device_id": DEVICE_ID,
+            "timestamp": int(time.time()),
+            "format": fmt,
+            "data": base64.b64encode(frame_bytes).decode("utf-8")
+        })
 
     client = mqtt.Client()
     if HIVEMQ_USER and HIVEMQ_PASS:
@@ -66,7 +76,7 @@ def publish_frame_bytes(frame_bytes, fmt="jpg"):
         pass
     client.connect(HIVEMQ_HOST, HIVEMQ_PORT, 60)
     client.loop_start()
-    client.publish(TOPIC_FRAME, json.dumps(payload))
+    client.publish(TOPIC_FRAME, payload)
     logger.info("Published frame to %s", TOPIC_FRAME)
     client.loop_stop()
     client.disconnect()
@@ -76,6 +86,7 @@ def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--mqtt", action="store_true", help="publish to MQTT instead of saving locally")
+    parser.add_argument("--binary", action="store_true", help="with --mqtt, send the JPEG in the binary payload format")
     parser.add_argument("--classify", action="store_true", help="classify locally after capture (imports ai_mqtt_consumer)")
     parser.add_argument("--upload", action="store_true", help="upload captured file and metadata to Supabase (requires credentials)")
     args = parser.parse_args()
@@ -83,7 +94,7 @@ def main():
     try:
         frame = capture_frame_bytes()
         if args.mqtt:
-            publish_frame_bytes(frame)
+            publish_frame_bytes(frame, binary=args.binary)
             return
 
         out_dir = os.path.join(os.getcwd(), "local_output", "frame")
@@ -0,0 +1,108 @@
+"""Local MJPEG stub that behaves like the ESP32-CAM /stream endpoint.
+
+Usage:
+  python Test/integration-test/mjpeg_stub_server.py --port 8081 --fps 10
+
+Then point the consumer at it with CAMERA_MJPEG_URL=http://127.0.0.1:8081/stream.
+Frames are taken from Computer-Vision/dataset_photo/Dataset when available,
+otherwise small generated JPEGs are used. Each part carries Content-Length like
+the real camera; pass --no-length to exercise the end-marker fallback.
+"""
+import io
+import time
+import glob
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("mjpeg_stub_server")
+
+BOUNDARY = "123456789000000000000987654321"
+
+
+def generated_frames(count=8, size=(160, 120)):
+    from PIL import Image
+    frames = []
+    for i in range(count):
+        img = Image.new("RGB", size, ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+        out = io.BytesIO()
+        img.save(out, format="JPEG")
+        frames.append(out.getvalue())
+    return frames
+
+
+def dataset_frames(limit=16):
+    paths = sorted(glob.glob("./Computer-Vision/dataset_photo/Dataset/*.jpg"))[:limit]
+    frames = []
+    for p in paths:
+        with open(p, "rb") as f:
+            frames.append(f.read())
+    return frames
+
+
+def make_handler(frames, fps, send_length=True):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+        def do_GET(self):
+            if self.path != "/stream":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+            self.end_headers()
+            i = 0
+            try:
+                while not self.server.stopping.is_set():
+                    jpg = frames[i % len(frames)]
+                    head = f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                    if send_length:
+                        head += f"Content-Length: {len(jpg)}\r\n"
+                    self.wfile.write(head.encode() + b"\r\n" + jpg + b"\r\n")
+                    self.wfile.flush()
+                    i += 1
+                    time.sleep(1.0 / fps)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+
+def start_stub_server(frames=None, fps=20, port=0, send_length=True):
+    """Start the stub in a background thread; returns (server, stream_url)."""
+    frames = frames or dataset_frames() or generated_frames()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(frames, fps, send_length))
+    server.daemon_threads = True
+    server.stopping = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/stream"
+    return server, url
+
+
+def stop_stub_server(server):
+    server.stopping.set()
+    server.shutdown()
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--no-length", action="store_true", help="omit Content-Length from each part")
+    args = parser.parse_args()
+    server, url = start_stub_server(fps=args.fps, port=args.port, send_length=not args.no_length)
+    logger.info("Serving MJPEG stub at %s", url)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_stub_server(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import io
+import wave
+
+import numpy as np
+
+import audio_archive
+from audio_archive import AudioArchiver, mp3_frames_end
+
+
+def _mp3_frame():
+    # MPEG-2 layer III, 64 kbit/s, 16 kHz, no padding: 72000 * 64 / 16000 = 288 bytes
+    return b"\xff\xf3\x88\x00" + b"\x00" * 284
+
+
+def test_mp3_frames_end_stops_at_last_complete_frame():
+    buf = _mp3_frame() * 2 + _mp3_frame()[:100]
+    assert mp3_frames_end(buf) == 576
+    assert mp3_frames_end(b"not an mp3 stream") == len(b"not an mp3 stream")
+
+
+def test_segments_per_device_and_flush_on_stop():
+    out = []
+    archiver = AudioArchiver(lambda *seg: out.append(seg), sample_rate=1000, channels=1,
+                             segment_seconds=1.0, fmt="wav", idle_seconds=60)
+    window = np.arange(250, dtype=np.int16).tobytes()
+    for i in range(6):
+        archiver.add("a", window, label="whispering" if i < 3 else "silence", timestamp=100 + i)
+    archiver.add("b", window, label="silence", timestamp=200)
+    archiver.stop()
+
+    by_device = {}
+    for device_id, label, ts, data, ext in out:
+        with wave.open(io.BytesIO(data)) as w:
+            by_device.setdefault(device_id, []).append((label, ts, w.getnframes()))
+        assert ext == "wav"
+    # 1500 samples for "a": one full 1 s segment, then the 0.5 s remainder at shutdown
+    assert by_device["a"][0] == ("whispering", 100, 1000)
+    assert by_device["a"][1] == ("silence", 104, 500)
+    assert by_device["b"] == [("silence", 200, 250)]
+    stats = archiver.stats()
+    assert stats["segments"] == 3 and stats["audio_seconds"] == 1.75
+
+
+class DyingEncoder:
+    """Stands in for the ffmpeg pipe: encodes two windows, then the process is gone."""
+
+    def __init__(self, sample_rate, channels, bitrate):
+        self.writes = 0
+
+    def write(self, pcm_bytes):
+        self.writes += 1
+        if self.writes > 2:
+            raise BrokenPipeError("ffmpeg exited")
+
+    def close(self, timeout=5.0):
+        return _mp3_frame() * 3
+
+
+def test_encoder_death_keeps_what_was_encoded(monkeypatch):
+    monkeypatch.setattr(audio_archive, "Mp3StreamEncoder", DyingEncoder)
+    out = []
+    archiver = AudioArchiver(lambda *seg: out.append(seg), sample_rate=1000, channels=1,
+                             segment_seconds=10.0, fmt="wav", idle_seconds=60)
+    archiver.fmt = "mp3"
+    window = np.zeros(250, dtype=np.int16).tobytes()
+    for i in range(4):
+        archiver.add("a", window, label="silence", timestamp=100 + i)
+    archiver.stop()
+    assert [(ts, ext, len(data)) for _, _, ts, data, ext in out] == [(100, "mp3", 864), (102, "wav", 44 + 1000)]
+    assert archiver.stats()["audio_seconds"] == 1.0
@@ -0,0 +1,34 @@
+import io
+import wave
+
+import numpy as np
+
+from audio_decode import decode_audio, sniff_format
+
+
+def test_quiet_raw_pcm_is_not_sniffed_as_mp3():
+    # first sample -1 -> bytes FF FF, an MPEG frame-sync lookalike
+    pcm = np.array([-1, 0, 1, 2, -3] * 3200, "<i2")
+    assert sniff_format(pcm.tobytes()) == "raw"
+    y, sr = decode_audio(pcm.tobytes(), sr=16000, pcm_rate=16000)
+    assert sr == 16000 and len(y) == 16000
+    np.testing.assert_allclose(y, pcm.astype(np.float32) / 32768.0)
+    # a single valid layer III header followed by PCM is still not an MP3 stream
+    fake = b"\xff\xfb\x90\x00" + pcm.tobytes()
+    assert sniff_format(fake) == "raw"
+
+
+def test_containers_are_sniffed():
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(np.array([[1000, -1000]] * 800, "<i2").tobytes())
+    assert sniff_format(buf.getvalue()) == "wav"
+    y, sr = decode_audio(buf.getvalue(), sr=None)
+    assert sr == 8000 and len(y) == 800 and np.allclose(y, 0.0)
+    # MPEG-1 layer III, 128 kbit/s, 44.1 kHz: 417-byte frames, each header where the last frame ends
+    frame = b"\xff\xfb\x90\x00" + bytes(413)
+    assert sniff_format(frame * 3) == "mp3"
+    assert sniff_format(b"ID3\x04" + bytes(20)) == "mp3"
@@ -0,0 +1,51 @@
+# test_audio_features.py
+# Parity of the single-STFT feature engine with the per-feature librosa calls it replaces.
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+
+from audio_features import extract_features, mel_filterbank, FEATURE_NAMES
+
+
+def librosa_features(y, sr):
+    rms = np.mean(librosa.feature.rms(y=y))
+    zcr = np.mean(librosa.feature.zero_crossing_rate(y))
+    spec = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    return np.hstack([rms, zcr, spec, np.mean(mfcc, axis=1)])
+
+
+def _signals(sr):
+    rng = np.random.default_rng(7)
+    t = np.arange(sr) / sr
+    return {
+        "noise": (rng.standard_normal(sr) * 0.1).astype(np.float32),
+        "tone": (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32),
+        "chirp": (0.2 * np.sin(2 * np.pi * (200 + 3000 * t) * t)).astype(np.float32),
+        "silence": np.zeros(sr, dtype=np.float32),
+        "near_silence": (rng.standard_normal(2 * sr) * 1e-4).astype(np.float32),
+        "short": (rng.standard_normal(900) * 0.05).astype(np.float32),
+    }
+
+
+@pytest.mark.parametrize("sr", [16000, 22050])
+@pytest.mark.filterwarnings("ignore:n_fft=")
+def test_matches_librosa(sr):
+    for name, y in _signals(sr).items():
+        expected = librosa_features(y, sr)
+        got = extract_features(y, sr)
+        assert got.shape == (len(FEATURE_NAMES),)
+        np.testing.assert_allclose(got, expected, rtol=1e-4, atol=2e-3, err_msg=name)
+
+
+def test_mel_filterbank_matches_librosa():
+    np.testing.assert_allclose(mel_filterbank(16000, 2048), librosa.filters.mel(sr=16000, n_fft=2048),
+                               rtol=1e-5, atol=1e-8)
+
+
+def test_global_rms_mode_matches_dataset_extractor():
+    y = _signals(16000)["noise"][:4800]
+    got = extract_features(y, 16000, rms_mode="global")
+    assert got[0] == pytest.approx(float(np.sqrt(np.mean(y.astype(np.float64) ** 2))))
+    np.testing.assert_allclose(got[1:], librosa_features(y, 16000)[1:], rtol=1e-4, atol=2e-3)
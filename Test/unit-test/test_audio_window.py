@@ -0,0 +1,67 @@
+import numpy as np
+
+from audio_window import AudioWindowAggregator
+
+
+def chunk(n, value=0):
+    return np.full(n, value, dtype="<i2")
+
+
+def test_windows_follow_each_devices_format():
+    agg = AudioWindowAggregator(44100, 2, window_seconds=0.5)
+    # binary 16 kHz mono chunks: a 0.5 s window is 8000 values, not 44100 stereo's 44100
+    windows = [w for seq in range(20) for w in agg.add("mono", seq, chunk(400), sample_rate=16000, channels=1)]
+    assert [(len(w.samples), w.sample_rate, w.channels) for w in windows] == [(8000, 16000, 1)]
+    # chunks without a format (JSON firmware) use the aggregator's defaults
+    windows = [w for seq in range(60) for w in agg.add("stereo", seq, chunk(800))]
+    assert [(len(w.samples), w.sample_rate, w.channels) for w in windows] == [(44100, 44100, 2)]
+    # a device switching format starts over instead of mixing the two in one window
+    agg.add("mono", 20, chunk(4000, 1), sample_rate=16000, channels=1)
+    windows = agg.add("mono", 21, chunk(8000, 2), sample_rate=8000, channels=1)
+    assert [(len(w.samples), w.sample_rate, set(w.samples)) for w in windows] == [(4000, 8000, {2})] * 2
+    assert agg.stats("mono")["format_changes"] == 1
+
+
+def feed(agg, device, seqs, now=0.0, n=100):
+    """Chunk `seq` holds n copies of seq, so windows show which chunks they were built from."""
+    out = []
+    for i, seq in enumerate(seqs):
+        out += agg.add(device, seq, chunk(n, seq), now=now + i * 0.03, sample_rate=1000, channels=1)
+    return [list(dict.fromkeys(w.samples)) for w in out]
+
+
+def test_reorder_duplicates_and_gaps():
+    agg = AudioWindowAggregator(1000, 1, window_seconds=0.3, reorder_depth=4, gap_timeout=10)
+    # 2 arrives before 1, 1 is then redelivered: audio comes out in order, once
+    assert feed(agg, "d", [0, 2, 1, 1, 0]) == [[0, 1, 2]]
+    assert agg.stats("d")["reordered"] == 1 and agg.stats("d")["duplicates"] == 2
+    # 4 never arrives: skipped once 4 later chunks are held
+    assert feed(agg, "d", [3, 5, 6, 7, 8]) == [[3, 5, 6]]
+    assert agg.stats("d")["lost"] == 1
+    # ... or once the hole is older than gap_timeout
+    agg = AudioWindowAggregator(1000, 1, window_seconds=0.3, reorder_depth=100, gap_timeout=0.5)
+    assert feed(agg, "d", [0, 2, 3]) == []
+    assert [list(dict.fromkeys(w.samples)) for w in agg.add("d", 4, chunk(100, 4), now=1.0)] == [[0, 2, 3]]
+
+
+def test_reboot_restarts_the_stream():
+    agg = AudioWindowAggregator(1000, 1, window_seconds=0.3, reorder_depth=4)
+    feed(agg, "d", range(50))
+    # rebooted 1.5 s into the exam: seq starts over at 0 well below SEQ_RESET_THRESHOLD
+    assert feed(agg, "d", [0, 1, 2], now=2.0) == [[0, 1, 2]]
+    assert agg.stats("d")["resets"] == 1 and agg.stats("d")["duplicates"] == 0
+    # silent for longer than reset_idle_seconds, then back at a lower seq (first chunk lost on reconnect)
+    feed(agg, "d", range(3, 30), now=3.0)
+    assert feed(agg, "d", [2, 3, 4], now=10.0) == [[2, 3, 4]]
+    assert agg.stats("d")["resets"] == 2
+    # a redelivered seq 0 moments after start-up is still a duplicate
+    agg = AudioWindowAggregator(1000, 1, window_seconds=0.3, reorder_depth=4)
+    assert feed(agg, "e", [0, 1, 2, 0]) == [[0, 1, 2]]
+    assert agg.stats("e")["resets"] == 0 and agg.stats("e")["duplicates"] == 1
+
+
+def test_default_window_is_about_100_chunks():
+    agg = AudioWindowAggregator(16000, 1)
+    # 30 ms chunks, as the ESP32 sends them
+    windows = [w for seq in range(1000) for w in agg.add("d", seq, chunk(480))]
+    assert len(windows) == 10 and all(len(w.samples) == 48000 for w in windows)
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from broadcast_hub import BroadcastHub, channels_for
+
+
+def test_routing_dedupes_and_encodes_once():
+    async def scenario():
+        hub = BroadcastHub()
+        dev1 = hub.subscribe(channels_for("esp1"))
+        both = hub.subscribe(channels_for("esp1,esp2", "whispering", alerts=True))
+        whisper = hub.subscribe(channels_for(label="whispering"))
+        everything = hub.subscribe(channels_for())
+        assert hub.publish("prediction", {"prediction": "whispering"}, "esp1", "whispering") == 4
+        assert hub.publish("alert", {"alert_type": "whispering_detected"}, "esp2", "whispering") == 3
+        assert hub.publish("prediction", {"prediction": "silence"}, "esp3", "silence") == 1
+        first = [await s.get(0.1) for s in (dev1, both, whisper, everything)]
+        # one Message object and one encoding, whoever receives it
+        assert all(m is first[0] for m in first)
+        assert json.loads(first[0].text) == {"prediction": "whispering", "type": "prediction"}
+        assert first[0].sse.startswith(b"event: prediction\ndata: {")
+        assert (await both.get(0.1)).kind == "alert" and await both.get(0.01) is None
+        assert [(await everything.get(0.1)).payload["type"] for _ in range(2)] == ["alert", "prediction"]
+        assert await dev1.get(0.01) is None
+        for s in (dev1, both, whisper, everything):
+            s.close()
+        assert hub.status()["subscribers"] == 0 and hub.status()["channels"] == 0
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_drops_oldest_and_new_ones_get_latest():
+    async def scenario():
+        hub = BroadcastHub(queue_size=3)
+        slow = hub.subscribe(["device:esp1"])
+        for i in range(10):
+            hub.publish("prediction", {"seq": i}, "esp1", "silence")
+        assert [(await slow.get(0.1)).payload["seq"] for _ in range(3)] == [7, 8, 9]
+        assert slow.dropped == 7 and hub.stats["dropped"] == 7
+        hub.publish("prediction", {"seq": 0}, "esp2", "silence")
+        late = hub.subscribe(["device:esp1"])
+        assert (await late.get(0.1)).payload["seq"] == 9 and await late.get(0.01) is None
+        dashboard = hub.subscribe(["all"])
+        assert sorted(m.payload["seq"] for m in [await dashboard.get(0.1), await dashboard.get(0.1)]) == [0, 9]
+        # close wakes a waiting consumer
+        waiting = asyncio.create_task(late.get())
+        await asyncio.sleep(0)
+        late.close()
+        assert await asyncio.wait_for(waiting, 1) is None
+    asyncio.run(scenario())
+
+
+def test_sse_stream_subscribes_only_while_running():
+    async def scenario():
+        hub = BroadcastHub()
+        # a client that leaves before the response body starts
+        never_started = hub.stream_sse(channels_for("esp1"))
+        assert hub.status()["subscribers"] == 0
+        await never_started.aclose()
+        stream = hub.stream_sse(channels_for("esp1"), keepalive=0.05)
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert hub.status()["subscribers"] == 1
+        hub.publish("prediction", {"prediction": "silence"}, "esp1", "silence")
+        assert (await stream.__anext__()).startswith(b"event: prediction\n")
+        assert await stream.__anext__() == b": keepalive\n\n"
+        await stream.aclose()
+        assert hub.status()["subscribers"] == 0
+    asyncio.run(scenario())
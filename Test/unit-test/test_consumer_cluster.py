@@ -0,0 +1,30 @@
+from collections import Counter
+
+import pytest
+
+from consumer_cluster import ClusterMembership, device_from_topic, shard_of
+
+
+def test_every_device_has_exactly_one_owner():
+    devices = [f"esp32_audio_{i:02d}" for i in range(1, 37)]
+    workers = [ClusterMembership("hash", workers=4, index=i) for i in range(4)]
+    owners = {d: [w.index for w in workers if w.owns(d)] for d in devices}
+    assert all(len(o) == 1 for o in owners.values())
+    # sticky: same answer every time, independent of PYTHONHASHSEED
+    assert all(shard_of(d, 4) == owners[d][0] for d in devices)
+    load = Counter(o[0] for o in owners.values())
+    assert len(load) == 4 and max(load.values()) <= 2 * min(load.values())
+
+
+def test_topics_and_subscriptions():
+    assert device_from_topic("iot/audio/chunk/esp32_audio_01", "iot/audio/chunk") == "esp32_audio_01"
+    assert device_from_topic("iot/audio/chunk", "iot/audio/chunk") is None
+    assert device_from_topic("iot/audio/chunk/a/b", "iot/audio/chunk") is None
+
+    assert ClusterMembership("off").subscriptions(["esp32cam/frame"]) == ["esp32cam/frame", "esp32cam/frame/+"]
+    shared = ClusterMembership("shared", workers=3, index=2, group="g")
+    assert shared.subscriptions(["iot/audio/chunk"]) == ["$share/g/iot/audio/chunk", "$share/g/iot/audio/chunk/+"]
+    assert shared.owns("anything") and shared.needs_mqtt5
+
+    with pytest.raises(ValueError):
+        ClusterMembership("hash", workers=2, index=2)
@@ -0,0 +1,61 @@
+import os
+import time
+
+from debug_archive import DebugArchive, iter_clips, SEGMENT_SUFFIX
+
+
+def segments(root):
+    return sorted(os.path.join(d, f) for d, _, files in os.walk(root) for f in files if f.endswith(SEGMENT_SUFFIX))
+
+
+def test_sampling_policy_keeps_alerts_errors_and_low_confidence(tmp_path):
+    archive = DebugArchive(str(tmp_path), sample_rate=0.0, low_confidence=0.6, janitor_seconds=3600)
+    assert archive.reason(0.95) is None
+    assert archive.reason(0.95, alert=True) == "alert"
+    assert archive.reason(error=True) == "error"
+    assert archive.reason(0.4) == "low_confidence"
+    sampled = DebugArchive(str(tmp_path), sample_rate=0.1, low_confidence=0.0, seed=1)
+    kept = sum(sampled.reason(0.9) == "sampled" for _ in range(5000))
+    assert 400 < kept < 600
+
+
+def test_clips_roll_into_segments_and_read_back(tmp_path):
+    archive = DebugArchive(str(tmp_path), sample_rate=1.0, segment_bytes=3000, janitor_seconds=3600).start()
+    try:
+        for i in range(10):
+            assert archive.offer("esp32 #1", bytes([i]) * 1000, "silence", 0.9, timestamp=1700000000 + i)
+        archive.offer("esp32-2", b"x" * 10, "whispering", 0.95, alert=True)
+        assert archive.flush(5)
+        files = segments(tmp_path)
+        # device ids become safe directory names; 3 records of ~1.1 kB fill a 3000-byte segment
+        assert {os.path.basename(os.path.dirname(p)) for p in files} == {"esp32_1", "esp32-2"}
+        dev1 = [p for p in files if "esp32_1" in p]
+        assert len(dev1) == 4
+        clips = [c for p in dev1 for c in iter_clips(p)]
+        assert [data[0] for _, data in clips] == list(range(10))
+        assert clips[0][0]["device_id"] == "esp32 #1" and clips[0][0]["reason"] == "sampled"
+    finally:
+        archive.stop()
+    assert archive.stats["kept"] == 11 and archive.stats["reasons"]["alert"] == 1
+
+
+def test_janitor_enforces_age_then_size_and_spares_open_segments(tmp_path):
+    archive = DebugArchive(str(tmp_path), sample_rate=1.0, segment_bytes=1, max_bytes=2500,
+                           max_age_seconds=3600, janitor_seconds=3600).start()
+    try:
+        for i in range(6):
+            archive.offer("dev0", b"a" * 1000, timestamp=1700000000 + i)
+        assert archive.flush(5)
+        files = segments(tmp_path)
+        assert len(files) == 6
+        now = time.time()
+        os.utime(files[0], (now - 7200, now - 7200))  # past the age limit
+        for i, path in enumerate(files[1:], 1):
+            os.utime(path, (now - 600 + i, now - 600 + i))
+        deleted, _ = archive.clean(now)
+        left = segments(tmp_path)
+        # the expired one, then oldest first down to 2500 bytes; the segment still open is never touched
+        assert deleted == 4 and left == files[4:]
+        assert archive._open["dev0"].path == files[5]
+    finally:
+        archive.stop()
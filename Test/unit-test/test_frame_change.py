@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from frame_change import FrameChangeDetector
+
+
+def _jpeg(pixels):
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _scene(seed):
+    rng = np.random.default_rng(seed)
+    # smooth blobs rather than white noise, like a real scene after downscaling
+    small = rng.integers(0, 256, (6, 8, 3)).astype(np.uint8)
+    return np.asarray(Image.fromarray(small).resize((160, 120), Image.BILINEAR), dtype=np.int16)
+
+
+def test_reuses_label_until_scene_changes_or_goes_stale():
+    calls = []
+
+    def classify(frame):
+        calls.append(frame)
+        return f"label{len(calls)}"
+
+    detector = FrameChangeDetector(threshold=2, max_staleness=10, log_seconds=0)
+    rng = np.random.default_rng(1)
+    scene = _scene(0)
+    assert detector.classify("cam", _jpeg(scene), classify, now=0) == ("label1", False)
+    # sensor noise and a global exposure shift are not changes
+    assert detector.classify("cam", _jpeg(scene + rng.normal(0, 3, scene.shape)), classify, now=1) == ("label1", True)
+    assert detector.classify("cam", _jpeg(scene + 12), classify, now=2) == ("label1", True)
+    # another device has its own cache
+    assert detector.classify("cam2", _jpeg(scene), classify, now=2) == ("label2", False)
+    # a different scene is classified
+    assert detector.classify("cam", _jpeg(_scene(5)), classify, now=3) == ("label3", False)
+    # and an unchanged one is re-classified once the label is too old
+    assert detector.classify("cam", _jpeg(_scene(5)), classify, now=12.9) == ("label3", True)
+    assert detector.classify("cam", _jpeg(_scene(5)), classify, now=13) == ("label4", False)
+
+    stats = detector.stats()
+    assert (stats["frames"], stats["inferred"], stats["skipped"]) == (7, 4, 3)
+    assert (stats["new"], stats["changed"], stats["stale"]) == (2, 1, 1)
+    assert stats["skip_rate"] == round(3 / 7, 3)
+
+
+def test_threshold_zero_always_classifies():
+    detector = FrameChangeDetector(threshold=0, log_seconds=0)
+    frame = _jpeg(_scene(0))
+    for i in range(3):
+        assert detector.classify("cam", frame, lambda f: "x", now=i) == ("x", False)
+    assert detector.stats()["skip_rate"] == 0.0
@@ -0,0 +1,74 @@
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_pool
+
+
+def closed_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def attempts(session, url):
+    before = http_pool.pool_stats()["new_connections"]
+    with pytest.raises(requests.ConnectionError):
+        session.post(url, data=b"x")
+    return http_pool.pool_stats()["new_connections"] - before
+
+
+def test_inference_session_fails_fast_on_connect():
+    url = f"http://127.0.0.1:{closed_port()}/api/classify_both"
+    inference = http_pool.make_session(backoff=0, **http_pool.SESSION_OPTIONS["inference"])
+    assert inference.get_adapter(url).max_retries.connect == 0
+    assert inference.default_timeout[0] == http_pool.HTTP_INFERENCE_CONNECT_TIMEOUT <= 1
+    assert attempts(inference, url) == 1
+    # the general-purpose sessions still retry connects
+    assert attempts(http_pool.make_session(retries=3, connect_retries=3, backoff=0), url) == 4
+    assert http_pool.get_session("inference").get_adapter(url).max_retries.connect == 0
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(0.2)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_blocking_sessions_cap_connections_per_host(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    try:
+        for pool_block, expected in ((True, 2), (False, 6)):
+            session = http_pool.make_session(pool_maxsize=2, pool_block=pool_block)
+            before = http_pool.pool_stats()["new_connections"]
+            with ThreadPoolExecutor(6) as pool:
+                assert [r.status_code for r in pool.map(session.get, [url] * 6)] == [200] * 6
+            assert http_pool.pool_stats()["new_connections"] - before == expected
+        # a request that can't get a connection in time fails instead of waiting forever
+        monkeypatch.setattr(http_pool, "HTTP_POOL_WAIT", 0.05)
+        session = http_pool.make_session(pool_maxsize=1, pool_block=True)
+        with ThreadPoolExecutor(2) as pool:
+            futures = [pool.submit(session.get, url) for _ in range(2)]
+            outcomes = sorted(type(f.exception()).__name__ for f in futures)
+        assert outcomes == ["ConnectionError", "NoneType"]
+    finally:
+        server.shutdown()
+    assert http_pool.get_session("inference").get_adapter(url)._pool_block
+    assert http_pool.get_session().get_adapter(url)._pool_block
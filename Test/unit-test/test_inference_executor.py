@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference_executor import InferenceExecutor, Saturated, saturated_response
+
+
+def test_admission_is_bounded_and_answers_503_with_retry_after():
+    release = threading.Event()
+    executor = InferenceExecutor("test", "thread", workers=1, max_pending=2).start()
+
+    def slow(x):
+        release.wait(5)
+        return x * 2
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run(slow, 1))
+        second = asyncio.ensure_future(executor.run(slow, 2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Saturated) as busy:
+            await executor.run(slow, 3)
+        release.set()
+        return await asyncio.gather(first, second), busy.value
+
+    try:
+        results, busy = asyncio.run(scenario())
+    finally:
+        executor.stop()
+    assert results == [2, 4]
+    assert busy.retry_after >= 1
+    response = saturated_response(busy)
+    assert response.status_code == 503 and response.headers["retry-after"] == str(busy.retry_after)
+    status = executor.status()
+    assert (status["completed"], status["rejected"], status["pending"], status["max_pending"]) == (2, 1, 0, 2)
+
+
+def test_failures_release_their_slot():
+    executor = InferenceExecutor("test", "inline", max_pending=1)
+
+    def broken():
+        raise ValueError("bad clip")
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await executor.run(broken)
+        return await executor.run(lambda: "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+    assert executor.stats["failed"] == 3 and executor.pending == 0
@@ -0,0 +1,47 @@
+import json
+
+from integrity_publisher import IntegrityPublisher, label_with_hysteresis
+
+
+class RecordingClient:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload):
+        self.messages.append((topic, json.loads(payload)))
+
+
+def test_hysteresis_delays_recovery_not_alerts():
+    assert label_with_hysteresis(69, "green", 5) == "yellow"
+    assert label_with_hysteresis(45, "green", 5) == "red"
+    assert label_with_hysteresis(72, "yellow", 5) == "yellow"
+    assert label_with_hysteresis(75, "yellow", 5) == "green"
+    assert label_with_hysteresis(72, "red", 5) == "yellow"
+
+
+def test_steady_stream_is_suppressed_and_alert_goes_out_immediately():
+    client = RecordingClient()
+    pub = IntegrityPublisher("iot/integrity/result", score_delta=10, hysteresis=5, heartbeat_seconds=30,
+                             mode="device", aggregate_topic="")
+    decisions = []
+    # 60 one-second windows of a calm student hovering around the green threshold...
+    for t in range(60):
+        decisions.append(pub.decide("dev", 72 if t % 2 else 69, now=t)[1])
+    # ...then a whisper + head-down alert
+    label, reason = pub.decide("dev", 24, now=60)
+    assert (label, reason) == ("red", "label_change")
+
+    # 69 -> yellow, and 72 never clears 70 + 5, so only the first result and one heartbeat go out
+    assert [(t, r) for t, r in enumerate(decisions) if r] == [(0, "label_change"), (30, "heartbeat")]
+
+    assert pub.update(client, "dev", 25, now=61) is None
+    pub.update(client, "other", 90, now=61)
+    assert client.messages == [("iot/integrity/result/other",
+                                {"device_id": "other", "integrity_score": 0.9, "label": "green"})]
+
+
+def test_topic_modes():
+    assert IntegrityPublisher("iot/integrity/result", mode="device").topics_for("d1") == ["iot/integrity/result/d1"]
+    assert IntegrityPublisher("iot/integrity/result", mode="legacy").topics_for("d1") == ["iot/integrity/result"]
+    both = IntegrityPublisher("iot/integrity/result/", mode="both", aggregate_topic="iot/integrity/all")
+    assert both.topics_for("d1") == ["iot/integrity/result/d1", "iot/integrity/result", "iot/integrity/all"]
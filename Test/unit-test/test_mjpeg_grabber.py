@@ -0,0 +1,45 @@
+# test_mjpeg_grabber.py
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "integration-test"))
+
+from mjpeg_grabber import MjpegStreamParser, MjpegGrabber
+from mjpeg_stub_server import start_stub_server, stop_stub_server, generated_frames
+
+
+def _multipart(frames, with_length=True):
+    out = b""
+    for jpg in frames:
+        head = b"--frame\r\nContent-Type: image/jpeg\r\n"
+        if with_length:
+            head += b"Content-Length: %d\r\n" % len(jpg)
+        out += head + b"\r\n" + jpg + b"\r\n"
+    return out
+
+
+def test_parser_handles_arbitrary_read_sizes():
+    frames = generated_frames(4)
+    for with_length in (True, False):
+        stream = _multipart(frames, with_length)
+        for step in (1, 7, 1024):
+            parser = MjpegStreamParser()
+            got = []
+            for i in range(0, len(stream), step):
+                got += parser.feed(stream[i:i + step])
+            assert got == frames
+
+
+def test_grabber_serves_latest_frame_from_stub():
+    frames = generated_frames(4)
+    server, url = start_stub_server(frames=frames, fps=50)
+    grabber = MjpegGrabber(url).start()
+    try:
+        got = grabber.wait_for_frame(timeout=5)
+        assert got is not None and got[0] in frames
+        assert grabber.latest(max_age_ms=1000) is not None
+        assert grabber.latest(max_age_ms=-1) is None
+        assert grabber.stats["connects"] == 1
+    finally:
+        grabber.stop()
+        stop_stub_server(server)
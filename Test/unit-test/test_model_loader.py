@@ -0,0 +1,54 @@
+import sys
+import subprocess
+import threading
+from pathlib import Path
+
+from model_loader import LazyModel, StartupTimer, startup
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def test_lazy_model_loads_once_and_remembers_failures():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    warmed = []
+    lazy = LazyModel("test-ok", loader, warm_up=warmed.append)
+    threads = [threading.Thread(target=lazy.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and lazy.loaded
+    value = lazy.load()
+    assert warmed == [value] and "warm-up test-ok" in startup.phases
+
+    def broken():
+        calls.append(1)
+        raise FileNotFoundError("no model")
+    failing = LazyModel("test-broken", broken)
+    assert failing.get() is None and failing.load() is None
+    assert len(calls) == 2
+
+
+def test_startup_report_lists_phases_in_order():
+    timer = StartupTimer()
+    timer.add("import", 0.25)
+    with timer.phase("load speech"):
+        pass
+    timer.add("import", 0.25)
+    report = timer.report()
+    assert report.startswith("import 0.50s, load speech 0.00s")
+    assert report.endswith("(total 0.50s)")
+
+
+def test_consumer_import_skips_heavy_dependencies():
+    code = ("import sys, ai_mqtt_consumer; "
+            "print(sorted(m for m in ('torch', 'torchvision', 'sklearn', 'joblib', 'supabase', 'librosa') "
+            "if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,95 @@
+import os
+import threading
+
+from model_loader import LazyModel
+from model_registry import ModelRegistry, artifact_version
+
+
+class Bundle:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+
+def make_slot(tmp_path, closed):
+    path = tmp_path / "model.bin"
+
+    def loader():
+        data = path.read_text()
+        if data == "corrupt":
+            raise ValueError("truncated artifact")
+        return Bundle(data)
+
+    slot = LazyModel("test", loader, fingerprint=lambda: artifact_version([str(path)]),
+                     close=lambda b: closed.append(b.name))
+    return path, slot
+
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_artifact_version_changes_with_contents_and_missing_files(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    write(a, "1", 1_700_000_000_000_000_000)
+    v1 = artifact_version([str(a), str(b)])
+    assert artifact_version([str(b), str(a)]) == v1
+    write(b, "2", 1_700_000_000_000_000_000)
+    v2 = artifact_version([str(a), str(b)])
+    write(b, "22", 1_700_000_001_000_000_000)
+    assert len({v1, v2, artifact_version([str(a), str(b)])}) == 3
+
+
+def test_reload_swaps_after_two_polls_and_keeps_in_flight_version(tmp_path):
+    closed = []
+    path, slot = make_slot(tmp_path, closed)
+    write(path, "v1", 1_700_000_000_000_000_000)
+    registry = ModelRegistry({"test": slot}, interval=0)
+    registry.load_all(warm_up=False)
+    v1 = slot.version
+
+    entered, finish = threading.Event(), threading.Event()
+    seen = []
+
+    def request():
+        with slot.use() as current:
+            entered.set()
+            finish.wait(5)
+            seen.append((current.value.name, current.version))
+
+    t = threading.Thread(target=request)
+    t.start()
+    entered.wait(5)
+
+    write(path, "v2", 1_700_000_100_000_000_000)
+    assert registry.poll() == []          # first sighting: could still be copying
+    assert registry.poll() == ["test"]
+    assert slot.get().name == "v2" and slot.version != v1
+    assert closed == []                   # v1 is still answering a request
+    finish.set()
+    t.join(5)
+    assert seen == [("v1", v1)] and closed == ["v1"]
+    status = registry.status()["models"]["test"]
+    assert status["reloads"] == 1 and status["in_flight"] == 0
+
+
+def test_failed_reload_keeps_old_version_until_files_change(tmp_path):
+    closed = []
+    path, slot = make_slot(tmp_path, closed)
+    write(path, "v1", 1_700_000_000_000_000_000)
+    registry = ModelRegistry({"test": slot}, interval=0)
+    registry.load_all(warm_up=False)
+
+    write(path, "corrupt", 1_700_000_100_000_000_000)
+    registry.poll()
+    assert registry.poll() == []
+    assert slot.get().name == "v1" and slot.failed_version is not None
+    assert registry.poll() == []          # not retried while the files are unchanged
+    assert slot.stats["failures"] == 1
+
+    write(path, "v3", 1_700_000_200_000_000_000)
+    registry.poll()
+    assert registry.poll() == ["test"] and slot.get().name == "v3"
+    registry.stop()
+    assert closed == ["v1", "v3"] and not slot.loaded
@@ -0,0 +1,95 @@
+import json
+import time
+import threading
+
+from mqtt_dispatch import MessageDispatcher
+from payload_codec import encode_audio, peek_device_id
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_each_device_in_order_devices_in_parallel():
+    seen, running, overlap = {}, {}, []
+    lock = threading.Lock()
+
+    def handler(client, message):
+        device, n = message.payload.decode().split(":")
+        with lock:
+            running[device] = running.get(device, 0) + 1
+            overlap.append(running[device] > 1)
+            busy_devices = sum(1 for v in running.values() if v)
+        time.sleep(0.002)
+        with lock:
+            running[device] -= 1
+            seen.setdefault(device, []).append(int(n))
+            seen.setdefault("_parallel", []).append(busy_devices)
+
+    dispatcher = MessageDispatcher(handler, workers=4, queue_size=1000,
+                                   key=lambda topic, payload: payload.split(b":")[0]).start()
+    try:
+        for n in range(50):
+            for device in ("a", "b", "c"):
+                # one shared (flat) topic: the lane comes from the payload
+                dispatcher.submit("iot/audio", f"{device}:{n}".encode())
+        assert wait_for(lambda: dispatcher.stats["processed"] == 150)
+    finally:
+        dispatcher.stop()
+    assert all(seen[d] == list(range(50)) for d in ("a", "b", "c"))
+    assert not any(overlap)
+    assert max(seen["_parallel"]) > 1
+    assert dispatcher.queue_depths() == {}
+
+
+def test_full_lane_drops_oldest_without_blocking_others():
+    release = threading.Event()
+    handled = []
+
+    def handler(client, message):
+        if message.payload == b"slow:0":
+            release.wait(5)
+        handled.append(message.payload)
+
+    dispatcher = MessageDispatcher(handler, workers=2, queue_size=3,
+                                   key=lambda topic, payload: payload.split(b":")[0]).start()
+    try:
+        dispatcher.submit("t", b"slow:0")
+        assert wait_for(lambda: dispatcher.queue_depths().get(b"slow") == 0)
+        start = time.perf_counter()
+        for n in range(1, 11):
+            dispatcher.submit("t", f"slow:{n}".encode())
+        assert time.perf_counter() - start < 0.5  # never blocks the network thread
+        dispatcher.submit("t", b"fast:0")
+        assert wait_for(lambda: b"fast:0" in handled)
+        assert dispatcher.stats["dropped"] == 7 and dispatcher.queue_depths()[b"slow"] == 3
+        release.set()
+        assert wait_for(lambda: len(handled) == 5)
+    finally:
+        dispatcher.stop()
+    assert handled[1:] == [b"slow:0", b"slow:8", b"slow:9", b"slow:10"]
+
+
+def test_peek_device_id_without_decoding():
+    assert peek_device_id(encode_audio("esp32-7", [1, 2, 3])) == "esp32-7"
+    assert peek_device_id(json.dumps({"audio": [0] * 10, "device_id": "esp32-8"}).encode()) == "esp32-8"
+    assert peek_device_id(b"\xff\xd8\xff\xe0 jpeg") is None
+
+
+def test_stop_waits_at_most_timeout_for_a_stuck_handler():
+    release = threading.Event()
+    dispatcher = MessageDispatcher(lambda client, message: release.wait(5), workers=2).start()
+    dispatcher.submit("iot/stuck", b"x")
+    assert wait_for(lambda: dispatcher.queue_depths().get("iot/stuck") == 0)
+    start = time.perf_counter()
+    assert dispatcher.stop(timeout=0.2) is False
+    assert 0.15 < time.perf_counter() - start < 1.0
+    release.set()
+    assert wait_for(lambda: dispatcher.stats["processed"] == 1)
+    quick = MessageDispatcher(lambda client, message: None).start()
+    quick.submit("t", b"x")
+    assert wait_for(lambda: quick.stats["processed"] == 1)
+    assert quick.stop(timeout=1) is True
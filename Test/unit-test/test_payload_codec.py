@@ -0,0 +1,45 @@
+import json
+import base64
+
+import numpy as np
+import pytest
+
+from payload_codec import decode_message, encode_audio, encode_frame, PayloadError
+
+
+def test_binary_audio_roundtrip_is_a_view():
+    samples = np.arange(-320, 320, dtype=np.int16)
+    payload = encode_audio("esp32-01", samples, seq=42, sample_rate=16000, channels=1, timestamp=1700000000.5)
+    msg = decode_message(payload)
+    assert (msg.device_id, msg.seq, msg.format, msg.encoding) == ("esp32-01", 42, "pcm", "binary")
+    assert msg.timestamp == 1700000000.5 and msg.sample_rate == 16000
+    assert np.array_equal(msg.samples, samples)
+    assert not msg.samples.flags.owndata
+    # 2 bytes per sample plus a small header, vs ~5 chars per sample as JSON
+    legacy = json.dumps({"device_id": "esp32-01", "seq": 42, "audio": samples.tolist()}).encode()
+    assert len(payload) < len(legacy) / 2
+
+
+def test_binary_frame_and_legacy_fallbacks():
+    jpeg = b"\xff\xd8fake-jpeg\xff\xd9"
+    msg = decode_message(encode_frame("cam-1", jpeg, seq=3))
+    assert (msg.device_id, msg.format, msg.data, msg.samples) == ("cam-1", "jpg", jpeg, None)
+
+    legacy_audio = json.dumps({"device_id": "esp32-01", "seq": 7, "audio": [1, -2, 3]}).encode()
+    msg = decode_message(legacy_audio)
+    assert (msg.device_id, msg.seq, list(msg.samples), msg.encoding) == ("esp32-01", 7, [1, -2, 3], "json")
+
+    legacy_b64 = json.dumps({"device_id": "cam-1", "timestamp": 5, "format": "jpg",
+                             "data": base64.b64encode(jpeg).decode()}).encode()
+    msg = decode_message(legacy_b64)
+    assert (msg.device_id, msg.timestamp, msg.format, msg.data) == ("cam-1", 5, "jpg", jpeg)
+
+    msg = decode_message(b"RIFF....WAVE")
+    assert (msg.device_id, msg.data, msg.encoding) == (None, b"RIFF....WAVE", "raw")
+
+
+def test_unknown_version_is_rejected():
+    payload = bytearray(encode_frame("cam-1", b"x"))
+    payload[2] = 99
+    with pytest.raises(PayloadError):
+        decode_message(bytes(payload))
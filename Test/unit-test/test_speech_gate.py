@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+
+from audio_features import extract_features
+from speech_gate import (EnergyGate, calibrate, pcm_energy, agreement_report, load_dataset,
+                         model_predictions, SPEECH_GATE_CONFIG)
+
+
+def test_pcm_energy_matches_feature_extractor():
+    rng = np.random.default_rng(3)
+    t = np.arange(16000) / 16000
+    for y in [0.01 * rng.standard_normal(16000), 0.2 * np.sin(2 * np.pi * 300 * t)]:
+        pcm = np.round(y * 32767).astype(np.int16)
+        rms, zcr = pcm_energy(pcm.tobytes())
+        feats = extract_features(pcm.astype(np.float32) / 32768, 16000, rms_mode="global")
+        assert rms == pytest.approx(feats[0], rel=1e-4)
+        assert zcr == pytest.approx(feats[1], rel=0.05)
+    # stereo is mixed down; 44.1 kHz crossings are expressed per 16 kHz sample
+    stereo = np.repeat(pcm, 2)
+    assert pcm_energy(stereo, 16000, channels=2)[0] == pytest.approx(rms, rel=1e-4)
+    assert pcm_energy(pcm, 44100)[1] == pytest.approx(zcr * 44100 / 16000)
+
+
+def test_hysteresis_per_device():
+    gate = EnergyGate(0.003, hysteresis=1.5)
+    # 0.0025 is under the exit threshold but not under the enter threshold (0.002)
+    assert not gate.is_silent("a", 0.0025, 0.05)
+    assert gate.is_silent("a", 0.0015, 0.05)
+    assert gate.is_silent("a", 0.0025, 0.05)
+    assert not gate.is_silent("b", 0.0025, 0.05)
+    assert not gate.is_silent("a", 0.0035, 0.05)
+    assert not gate.is_silent("a", 0.0025, 0.05)
+    assert gate.stats == {"windows": 6, "gated": 2}
+    assert not EnergyGate(0.003, enabled=False).is_silent("a", 0.0, 0.0)
+
+
+def test_calibrate_precision_and_floor():
+    rng = np.random.default_rng(0)
+    quiet = rng.uniform(0.0005, 0.002, 200)
+    loud = rng.uniform(0.003, 0.05, 300)
+    rms = np.concatenate([quiet, loud])
+    zcr = rng.uniform(0.02, 0.1, len(rms))
+    labels = np.array(["silence"] * 200 + ["whispering"] * 300)
+    config = calibrate(rms, zcr, labels, precision=1.0)
+    assert config["basis"] == "precision" and config["windows_gated"] == 200
+    assert quiet.max() < config["rms_threshold"] < loud.min()
+    # silence louder than the quietest speech: a box around it
+    band = calibrate(rms, zcr, np.array(["whispering"] * 200 + ["silence"] * 300), precision=1.0)
+    assert band["basis"] == "band" and band["silence_share"] > 0.5
+    gate = EnergyGate(band["rms_threshold"], zcr_max=band["zcr_max"], rms_min=band["rms_min"],
+                      zcr_min=band["zcr_min"])
+    assert not any(gate.covers(r, z) for r, z in zip(quiet, zcr[:200]))
+    assert sum(gate.covers(r, z) for r, z in zip(loud, zcr[200:])) == band["windows_gated"]
+    # overlapping classes: only gate below everything that isn't silence
+    labels[::2] = "whispering"
+    config = calibrate(rms, zcr, labels)
+    assert config["basis"] == "floor"
+    assert config["rms_threshold"] == pytest.approx(rms[labels != "silence"].min() / 2)
+
+
+def test_calibrated_gate_agrees_with_model_on_dataset():
+    pytest.importorskip("sklearn")
+    features, _ = load_dataset()
+    predictions = model_predictions(features)
+    gate = EnergyGate.from_config(SPEECH_GATE_CONFIG, enabled=True, rms_override=None)
+    report = agreement_report(features[:, 0], features[:, 1], predictions, gate)
+    # the gate does answer a share of the windows, and every one is a window the full model calls silence
+    assert report["gated"] > 0
+    assert report["gated_agree"] == report["gated"]
+    with open(SPEECH_GATE_CONFIG) as f:
+        shipped = json.load(f)
+    assert report["gated"] == shipped["windows_gated"]
+    assert report["silence_recall"] == pytest.approx(shipped["silence_share"])
+    recalibrated = calibrate(features[:, 0], features[:, 1], predictions, shipped["target_precision"])
+    assert recalibrated == pytest.approx({k: shipped[k] for k in recalibrated})
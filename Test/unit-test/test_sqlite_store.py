@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from sqlite_store import SQLiteStore, MIGRATIONS, migrate, prediction_stats, device_rollup
+
+
+def test_writes_are_batched_and_visible_to_readers(tmp_path):
+    store = SQLiteStore(str(tmp_path / "argus.db"), batch_size=50, flush_ms=20).start()
+    try:
+        for i in range(120):
+            store.insert_prediction(f"dev{i % 3}", "s1", "whispering", 0.9, "[]")
+        store.insert_alert("dev0", "whispering_detected", "medium", "test")
+        assert store.flush(5)
+        assert store.query("PRAGMA journal_mode")[0][0] == "wal"
+        assert store.query("SELECT COUNT(*) FROM audio_predictions")[0][0] == 120
+
+        async def read():
+            rows = await store.aquery("SELECT device_id, alert_type FROM alerts WHERE resolved = 0")
+            await store.awrite("UPDATE alerts SET resolved = 1 WHERE device_id = ?", ("dev0",))
+            return rows, await store.aquery("SELECT COUNT(*) FROM alerts WHERE resolved = 0")
+        rows, unresolved = asyncio.run(read())
+        assert rows == [("dev0", "whispering_detected")] and unresolved == [(0,)]
+        assert store.stats["written"] == 122 and store.stats["batches"] < 122
+        assert store.stats["max_batch"] <= 50
+    finally:
+        store.stop()
+
+
+def test_bad_statement_does_not_lose_its_batch(tmp_path):
+    store = SQLiteStore(str(tmp_path / "argus.db"), flush_ms=50).start()
+    store.insert_prediction("dev0", "s1", "silence", 0.5, "[]")
+    failed = store.execute("INSERT INTO no_such_table VALUES (?)", (1,), wait=True)
+    store.insert_prediction("dev1", "s1", "silence", 0.5, "[]")
+    with pytest.raises(sqlite3.OperationalError):
+        failed.result(5)
+    store.stop()
+    conn = sqlite3.connect(str(tmp_path / "argus.db"))
+    assert conn.execute("SELECT device_id FROM audio_predictions ORDER BY id").fetchall() == [("dev0",), ("dev1",)]
+    conn.close()
+    assert store.stats["failed"] == 1
+
+
+def test_migration_backfills_counters_and_triggers_keep_them(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    # a file created by the old init_database(): version 0, no indexes or counters
+    for statement in MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.executemany("INSERT INTO audio_predictions (device_id, prediction, confidence, timestamp) VALUES (?, ?, ?, ?)",
+                     [("dev0", "whispering", 0.9, "2026-01-05 09:00:10"),
+                      ("dev0", "whispering", 0.7, "2026-01-05T09:00:50"),
+                      ("dev1", None, None, "2026-01-06 10:00:00")])
+    conn.commit()
+    assert migrate(conn) == (0, len(MIGRATIONS))
+    assert migrate(conn) == (len(MIGRATIONS), len(MIGRATIONS))
+    assert prediction_stats(conn) == (3, {"whispering": 2, "unknown": 1}, 0)
+    assert conn.execute("SELECT count, confidence_sum, confidence_max FROM prediction_rollups "
+                        "WHERE device_id = 'dev0' AND minute = '2026-01-05 09:00'").fetchone() == (2, 1.6, 0.9)
+    conn.close()
+
+    store = SQLiteStore(path).start()
+    try:
+        store.insert_prediction("dev0", "s1", "silence", 0.4, "[]")
+        store.insert_prediction("dev0", "s1", "silence", 0.6, "[]")
+        store.execute("DELETE FROM audio_predictions WHERE device_id = 'dev1'")
+        assert store.flush(5)
+        total, by_label, today = store.read(prediction_stats)
+        assert (total, by_label, today) == (4, {"whispering": 2, "silence": 2}, 2)
+        timeline = store.read(device_rollup, "dev0", 5)
+        assert timeline[-1]["predictions"]["silence"] == {"count": 2, "mean_confidence": 0.5, "max_confidence": 0.6}
+        plan = " ".join(r[-1] for r in store.query(
+            "EXPLAIN QUERY PLAN SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC LIMIT 20"))
+        assert "idx_alerts_resolved_time" in plan and "TEMP B-TREE" not in plan
+    finally:
+        store.stop()
@@ -0,0 +1,205 @@
+# test_supabase_writer.py
+import json
+import time
+import threading
+
+from supabase_writer import SupabaseWriter
+
+
+class StorageError(Exception):
+    """Shaped like storage3's StorageException: one dict argument."""
+
+
+class FakeBucket:
+    def __init__(self, sb, name):
+        self.sb, self.name = sb, name
+
+    def upload(self, path, data):
+        if self.sb.down:
+            raise ConnectionError("storage unavailable")
+        if self.sb.reject:
+            raise StorageError({"statusCode": "400", "error": "InvalidKey", "message": "Invalid key"})
+        with self.sb.lock:
+            if path in self.sb.files:
+                raise StorageError({"statusCode": "409", "error": "Duplicate",
+                                    "message": "The resource already exists"})
+            self.sb.files[path] = data
+
+    def get_public_url(self, path):
+        return f"https://fake.supabase.co/storage/v1/object/public/{self.name}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, sb):
+        self.sb = sb
+
+    def list_buckets(self):
+        self.sb.calls["list_buckets"] += 1
+        return [{"name": b} for b in self.sb.buckets]
+
+    def create_bucket(self, name):
+        self.sb.buckets.add(name)
+
+    def from_(self, name):
+        return FakeBucket(self.sb, name)
+
+
+class FakeTable:
+    def __init__(self, sb, name):
+        self.sb, self.name, self.rows = sb, name, None
+
+    def insert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        if self.sb.down:
+            raise ConnectionError("database unavailable")
+        with self.sb.lock:
+            self.sb.inserts.append(self.rows)
+        return {"data": self.rows}
+
+
+class FakeSupabase:
+    """Just enough of the supabase-py client surface used by SupabaseWriter."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down = False
+        self.reject = False
+        self.buckets = set()
+        self.files = {}
+        self.inserts = []
+        self.calls = {"list_buckets": 0}
+        self.storage = FakeStorage(self)
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+
+def _writer(fake, tmp_path, **kw):
+    kw.setdefault("flush_interval", 0.05)
+    kw.setdefault("spool_retry", 3600)
+    return SupabaseWriter(lambda: fake, spool_dir=tmp_path / "spool", **kw)
+
+
+def test_rows_are_batched_and_bucket_checked_once(tmp_path):
+    fake = FakeSupabase()
+    writer = _writer(fake, tmp_path, batch_size=50).start()
+    for i in range(20):
+        writer.enqueue("dev1", "audio", "silence", 1700000000 + i, b"x" * 10, "wav")
+    assert writer.flush(5)
+    writer.stop()
+    assert len(fake.files) == 20
+    assert sum(len(b) for b in fake.inserts) == 20
+    assert len(fake.inserts) < 20
+    assert fake.calls["list_buckets"] == 1
+    assert "ai-files" in fake.buckets
+    assert all(r["file_path"].startswith("https://") for b in fake.inserts for r in b)
+
+
+def test_outage_spools_and_next_start_replays(tmp_path):
+    fake = FakeSupabase()
+    fake.down = True
+    writer = _writer(fake, tmp_path).start()
+    for i in range(5):
+        writer.enqueue("dev1", "vision", "focus", 1700000000 + i, b"jpg", "jpg")
+    writer.flush(5)
+    writer.stop()
+    assert fake.inserts == []
+    assert len(list((tmp_path / "spool").glob("*.json"))) == 5
+
+    fake.down = False
+    restarted = _writer(fake, tmp_path).start()
+    deadline = time.monotonic() + 5
+    while restarted.stats["replayed"] < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert restarted.flush(5)
+    restarted.stop()
+    assert sum(len(b) for b in fake.inserts) == 5
+    assert list((tmp_path / "spool").glob("*.json")) == []
+
+
+def test_full_queue_overflows_to_spool(tmp_path):
+    fake = FakeSupabase()
+    writer = _writer(fake, tmp_path, queue_size=2)
+    writer._threads = [None]  # keep workers stopped so the queue fills up
+    for i in range(5):
+        writer.enqueue("dev1", "audio", "whispering", 1700000000 + i, b"x", "wav")
+    assert writer.stats["spooled"] == 3
+
+
+def test_upload_that_already_exists_still_gets_its_row(tmp_path):
+    # crashed after the upload, before the insert: the replayed event finds its file there
+    fake = FakeSupabase()
+    writer = _writer(fake, tmp_path).start()
+    fake.files["dev1/vision/frame.jpg"] = b"jpg"
+    writer.enqueue("dev1", "vision", "focus", 1700000000, b"jpg", filename="frame.jpg")
+    assert writer.flush(5)
+    writer.stop()
+    assert writer.stats["already_uploaded"] == 1 and writer.stats["dead_lettered"] == 0
+    assert [r["device_id"] for b in fake.inserts for r in b] == ["dev1"]
+
+
+def test_rejected_upload_is_dead_lettered_at_once(tmp_path):
+    fake = FakeSupabase()
+    fake.reject = True
+    writer = _writer(fake, tmp_path).start()
+    writer.enqueue("dev1", "audio", "whispering", 1700000000, b"wav", "wav")
+    assert writer.flush(5)
+    writer.stop()
+    dead = tmp_path / "spool" / "dead"
+    assert list((tmp_path / "spool").glob("*.json")) == []
+    [meta_path] = dead.glob("*.json")
+    meta = json.loads(meta_path.read_text())
+    assert meta["attempts"] == 1 and "Invalid key" in meta["last_error"]
+    assert (dead / meta["blob"]).read_bytes() == b"wav"
+
+
+def test_long_outage_is_retried_until_the_service_is_back(tmp_path):
+    fake = FakeSupabase()
+    fake.down = True
+    writer = _writer(fake, tmp_path, spool_retry=0.01, max_backoff=0.02).start()
+    writer.enqueue("dev1", "audio", "whispering", 1700000000, b"wav", "wav")
+    deadline = time.monotonic() + 10
+    # well past the 10 attempts that used to dead-letter an event
+    while writer.stats["upload_failed"] < 15 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.stats["upload_failed"] >= 15
+    fake.down = False
+    while not fake.inserts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.flush(5)
+    writer.stop()
+    assert [r["label"] for b in fake.inserts for r in b] == ["whispering"]
+    assert fake.files == {"dev1/audio/1700000000.wav": b"wav"}
+    assert writer.stats["dead_lettered"] == 0 and not (tmp_path / "spool" / "dead").exists()
+
+
+def test_backoff_and_age_limit(tmp_path):
+    fake = FakeSupabase()
+    fake.down = True
+    writer = _writer(fake, tmp_path, spool_retry=10, max_backoff=40, max_age_hours=1)
+    event = {"id": "e1", "path": "dev1/audio/1.wav", "data": b"wav", "device_id": "dev1",
+             "event_type": "audio", "label": "silence", "timestamp": 1}
+    delays = []
+    for _ in range(4):
+        before = time.time()
+        writer._failed(event, ConnectionError("down"), "Storage upload")
+        delays.append(round(event["retry_at"] - before))
+    assert delays == [10, 20, 40, 40]
+    assert writer.replay_spool() == 0  # not due yet
+    event["first_failed_at"] -= 3600
+    writer._failed(event, ConnectionError("down"), "Storage upload")
+    assert writer.stats["dead_lettered"] == 1
+
+
+def test_unreadable_spool_entry_keeps_its_blob(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / "1_abc.json").write_text("{not json")
+    (spool / "1_abc.bin").write_bytes(b"audio")
+    writer = _writer(FakeSupabase(), tmp_path)
+    assert writer.replay_spool() == 0
+    assert sorted(p.name for p in spool.iterdir()) == ["dead"]
+    assert sorted(p.name for p in (spool / "dead").iterdir()) == ["1_abc.bin", "1_abc.json"]
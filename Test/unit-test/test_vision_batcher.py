@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+import torch
+
+from vision_batcher import VisionBatcher
+
+
+class BlockingModel(torch.nn.Module):
+    """Scores class = first pixel; holds the forward until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def forward(self, batch):
+        self.entered.set()
+        self.release.wait(5)
+        return torch.nn.functional.one_hot(batch[:, 0, 0, 0].long(), 3).float()
+
+
+def frame(label):
+    return torch.full((1, 2, 2), float(label))
+
+
+def test_submit_after_stop_restarts():
+    batcher = VisionBatcher(BlockingModel(), max_wait_ms=1).start()
+    assert batcher.classify(frame(2), timeout=5) == 2
+    batcher.stop()
+    assert batcher.classify(frame(1), timeout=5) == 1
+    batcher.stop()
+
+
+def test_stop_fails_queued_frames():
+    model = BlockingModel()
+    model.release.clear()
+    batcher = VisionBatcher(model, max_batch_size=1, max_wait_ms=0).start()
+    running = batcher.submit(frame(0))
+    assert model.entered.wait(5)
+    queued = [batcher.submit(frame(1)) for _ in range(3)]
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    while not batcher._stopping.is_set():
+        stopper.join(0.001)
+    model.release.set()
+    stopper.join(5)
+    assert running.result(timeout=5) == 0
+    for future in queued:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
@@ -0,0 +1,40 @@
+import io
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from vision_preprocess import FramePreprocessor
+
+cv_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def _jpeg(size, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    pixels = torch.randint(0, 256, (size[1], size[0], 3), dtype=torch.uint8, generator=g).numpy()
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def test_full_decode_matches_cv_transform():
+    for size in [(160, 120), (640, 480)]:
+        frame = _jpeg(size)
+        expected = cv_transform(Image.open(io.BytesIO(frame)).convert("RGB"))
+        got = FramePreprocessor(draft=False).tensor(frame)
+        assert got.shape == (3, 224, 224) and got.dtype == torch.float32
+        assert torch.allclose(got, expected, atol=1e-5)
+
+
+def test_batch_reuses_buffer_per_thread():
+    pre = FramePreprocessor(max_batch=4)
+    frames = [_jpeg((160, 120), seed=i) for i in range(3)]
+    first = pre.batch(frames)
+    assert first.shape == (3, 3, 224, 224)
+    assert torch.allclose(first[1], pre.tensor(frames[1]))
+    second = pre.batch(frames[:2])
+    assert second.data_ptr() == first.data_ptr()
@@ -1,29 +1,36 @@
-import os
-import io
-import json
 import time
-import base64
-import tempfile
+# measured from the first import so the startup report covers this module's own import cost
+_import_started = time.perf_counter()
+
+import os
 import logging
 from pathlib import Path
 
-import numpy as np
-import joblib
-import torch
-import torch.nn.functional as F
-from torchvision import transforms, models
-from PIL import Image
-import librosa
-
 import paho.mqtt.client as mqtt
-from supabase import create_client
 from dotenv import load_dotenv
-import requests
-from pydub import AudioSegment
 import array
-import shutil
 import urllib.parse
-import wave
+import uuid
+import atexit
+import threading
+
+from mqtt_dispatch import MessageDispatcher
+from audio_window import AudioWindowAggregator
+import mjpeg_grabber
+import http_pool
+from supabase_writer import SupabaseWriter, SUPABASE_SPOOL_DIR
+from audio_decode import decode_audio
+from audio_features import extract_features
+from mjpeg_grabber import CAMERA_MAX_FRAME_AGE_MS
+from payload_codec import decode_message, peek_device_id, PayloadError
+from audio_archive import AudioArchiver, pcm_to_wav_bytes
+from integrity_publisher import IntegrityPublisher, raw_label
+from consumer_cluster import ClusterMembership, device_from_topic, topic_matches
+from frame_change import FrameChangeDetector
+from speech_gate import EnergyGate
+# torch, torchvision, joblib/sklearn and supabase are only imported when first needed
+from model_loader import startup
+from model_registry import build_registry
 
 
 logging.basicConfig(level=logging.INFO)
@@ -39,7 +46,11 @@ HIVEMQ_PASS = os.getenv("HIVEMQ_PASS")
 TOPIC_FRAME = os.getenv("HIVEMQ_TOPIC_FRAME", "esp32cam/frame")
 TOPIC_AUDIO = os.getenv("HIVEMQ_TOPIC_AUDIO", "iot/audio/chunk")
 AI_API_URL = os.getenv("AI_API_URL", "http://localhost:8000")
+# "inprocess": classify with this process's models; "http": POST to {AI_API_URL}/api/classify_both (split deployments)
+AI_MODE = os.getenv("AI_MODE", "inprocess").lower()
 CAMERA_MJPEG_URL = os.getenv("CAMERA_MJPEG_URL", "http://172.20.10.3/stream")
+# CONSUMER_CLUSTER_MODE / CONSUMER_WORKERS / CONSUMER_WORKER_INDEX, see consumer_cluster.py
+cluster = ClusterMembership()
 
 # PCM conversion defaults (from user instructions)
 PCM_SAMPLE_RATE = int(os.getenv("PCM_SAMPLE_RATE", "44100"))
@@ -52,6 +63,12 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY") or os.getenv("NEXT_PUBLIC_SUPABASE_ANON
 # simple in-memory cache to keep the last frame per device (used when MJPEG fetch fails)
 last_frame_by_device = {}
 
+# per-device label cache: near-identical frames reuse the last label instead of running the model
+frame_changes = FrameChangeDetector()
+
+# per-device reorder buffer: tiny seq-numbered chunks in, classification windows out
+audio_windows = AudioWindowAggregator(PCM_SAMPLE_RATE, PCM_CHANNELS)
+
 
 def _try_load_argus_web_env():
     """If no supabase env vars set, try to load them from argus-web/.env file."""
@@ -112,86 +129,49 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 
 # =====================================================================
-# Load Speech models
+# Speech and vision models: loaded on first use, or up front (with warm-up) by main();
+# retrained artifacts are picked up while running (MODEL_WATCH_SECONDS, see model_registry.py)
 # =====================================================================
-speech_model = None
-speech_scaler = None
-speech_encoder = None
-try:
-    speech_model = joblib.load("./Speech-Recognition/models_output/best_model.joblib")
-    speech_scaler = joblib.load("./Speech-Recognition/models_output/scaler.joblib")
-    speech_encoder = joblib.load("./Speech-Recognition/models_output/label_encoder.joblib")
-    logger.info("Loaded speech models")
-except Exception as e:
-    logger.exception("Could not load speech models: %s", e)
-
-
-# =====================================================================
-# Load Vision model
-# =====================================================================
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-IMG_SIZE = 224
-vision_model = None
-vision_encoder = None
-cv_transform = transforms.Compose([
-    transforms.Resize((IMG_SIZE, IMG_SIZE)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
-try:
-    vision_encoder = joblib.load("./Computer-Vision/vision_label_encoder.joblib")
-    num_classes = len(vision_encoder.classes_)
-    vision_model = models.resnet18(weights=None)
-    vision_model.fc = torch.nn.Linear(vision_model.fc.in_features, num_classes)
-    vision_model.load_state_dict(torch.load("./Computer-Vision/cheating_cnn_model.pth", map_location=DEVICE))
-    vision_model.to(DEVICE)
-    vision_model.eval()
-    logger.info("Loaded vision model")
-except Exception as e:
-    logger.exception("Could not load vision model: %s", e)
+model_registry = build_registry()
+speech_models = model_registry["speech"]
+vision_models = model_registry["vision"]
+# windows whose int16 energy the calibration ties to silence are labelled without features or model (see speech_gate.py)
+speech_gate = EnergyGate.from_config()
 
 
 def extract_features_from_wav_bytes(wav_bytes, sr=16000):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as t:
-        t.write(wav_bytes)
-        tmp_path = t.name
-    try:
-        y, sr = librosa.load(tmp_path, sr=sr)
-        rms = np.mean(librosa.feature.rms(y=y))
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-        spec = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        feats = np.hstack([rms, zcr, spec, mfcc_mean]).reshape(1, -1)
-        return feats
-    finally:
-        try:
-            Path(tmp_path).unlink()
-        except Exception:
-            pass
+    # decoded in memory (WAV parsed directly, compressed formats piped through a decoder)
+    y, sr = decode_audio(wav_bytes, sr=sr)
+    # rms, zcr, spectral centroid and 13 MFCC means from one shared STFT
+    return extract_features(y, sr).reshape(1, -1)
 
 
 def classify_audio_bytes(wav_bytes):
-    if speech_model is None or speech_scaler is None or speech_encoder is None:
+    with speech_models.use() as speech:
+        if speech is None:
+            return "none"
+        return speech.value.predict(extract_features_from_wav_bytes(wav_bytes))
+
+
+def classify_audio_pcm(pcm_bytes, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, device_id=None):
+    """Classify raw int16 PCM straight from the device, without building a container first."""
+    if speech_models.get() is None:
         return "none"
-    feats = extract_features_from_wav_bytes(wav_bytes)
-    feats_scaled = speech_scaler.transform(feats)
-    pred = speech_model.predict(feats_scaled)[0]
-    label = speech_encoder.inverse_transform([pred])[0]
-    return label
+    if speech_gate.check_pcm(device_id, pcm_bytes, sample_rate, channels):
+        return "silence"
+    y, sr = decode_audio(pcm_bytes, sr=16000, fmt="pcm", pcm_rate=sample_rate, pcm_channels=channels)
+    feats = extract_features(y, sr).reshape(1, -1)
+    # the version is held only for the prediction; a swap mid-request leaves this call on the old one
+    with speech_models.use() as speech:
+        return speech.value.predict(feats) if speech is not None else "none"
 
 
 def classify_image_bytes(img_bytes):
-    if vision_model is None or vision_encoder is None:
-        return "none"
-    image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    img_tensor = cv_transform(image).unsqueeze(0).to(DEVICE)
-    with torch.no_grad():
-        outputs = vision_model(img_tensor)
-        probs = F.softmax(outputs, dim=1)
-        pred_class = torch.argmax(probs, dim=1).item()
-        pred_label = vision_encoder.inverse_transform([pred_class])[0]
-    return pred_label
+    with vision_models.use() as vision:
+        if vision is None:
+            return "none"
+        # batched with other workers' frames, or a direct forward when VISION_BATCH_MAX=1
+        return vision.value.classify(img_bytes)
 
 
 def supabase_client():
@@ -201,6 +181,7 @@ def supabase_client():
     if hasattr(supabase_client, "_client") and supabase_client._client is not None:
         return supabase_client._client
     try:
+        from supabase import create_client
         c = create_client(SUPABASE_URL, SUPABASE_KEY)
         supabase_client._client = c
         return c
@@ -210,165 +191,117 @@ def supabase_client():
         return None
 
 
+# Uploads and ai_events inserts happen in the background; events are spooled to disk
+# when Supabase is slow or down and replayed later.
+supabase_writer = SupabaseWriter(
+    supabase_client,
+    # each cluster worker replays only its own spool
+    spool_dir=SUPABASE_SPOOL_DIR if cluster.mode == "off" else os.path.join(SUPABASE_SPOOL_DIR, f"worker-{cluster.index}"),
+)
+atexit.register(supabase_writer.stop)
+
+
 def upload_to_supabase(device_id, event_type, label, timestamp, file_bytes, ext, filename=None):
-    client = supabase_client()
-    if client is None:
+    """Queue a file upload plus its ai_events row. Returns immediately."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
         logger.info("Supabase client not configured; skipping upload metadata.")
         return None
+    path = supabase_writer.enqueue(device_id, event_type, label, timestamp, file_bytes, ext, filename=filename)
+    return {"queued": True, "file_path": path}
 
-    bucket = "ai-files"
-    if filename:
-        # allow callers to provide a custom filename (should include extension)
-        path = f"{device_id}/{event_type}/{filename}"
-    else:
-        path = f"{device_id}/{event_type}/{int(timestamp)}.{ext}"
-    file_path = None
-    try:
-        # Try to upload to storage (will create object path)
-        bio = io.BytesIO(file_bytes)
-        # create bucket if not exists (best-effort)
-        try:
-            buckets = client.storage.list_buckets()
-            if isinstance(buckets, dict) and buckets.get("error"):
-                # ignore
-                pass
-        except Exception:
-            pass
 
-        try:
-            # upload bytes
-            res = client.storage.from_(bucket).upload(path, bio.getvalue())
-            logger.info("Uploaded file to storage: %s", path)
-            # try to get a public URL for the file
-            try:
-                pub = client.storage.from_(bucket).get_public_url(path)
-                # get_public_url may return dict or object with 'publicUrl' key
-                if isinstance(pub, dict):
-                    file_path = pub.get("publicUrl") or pub.get("public_url")
-                else:
-                    # if it's a string or has attribute
-                    try:
-                        file_path = pub.publicUrl
-                    except Exception:
-                        file_path = str(pub)
-            except Exception:
-                # fallback to storing the raw storage path
-                file_path = path
-        except Exception as e:
-            logger.warning("Could not upload file to storage (bucket %s) — %s", bucket, e)
-            # Try creating bucket then upload
-            try:
-                client.storage.create_bucket(bucket)
-                bio.seek(0)
-                res = client.storage.from_(bucket).upload(path, bio.getvalue())
-                logger.info("Uploaded file after creating bucket: %s", path)
-                try:
-                    pub = client.storage.from_(bucket).get_public_url(path)
-                    if isinstance(pub, dict):
-                        file_path = pub.get("publicUrl") or pub.get("public_url")
-                    else:
-                        try:
-                            file_path = pub.publicUrl
-                        except Exception:
-                            file_path = str(pub)
-                except Exception:
-                    file_path = path
-            except Exception as e2:
-                logger.warning("Still failed uploading to storage: %s", e2)
+def _archive_audio_segment(device_id, label, timestamp, data, ext):
+    ts = int(timestamp)
+    upload_to_supabase(device_id, "audio", label, ts, data, ext,
+                       filename=f"{device_id}_audio_{ts}_{uuid.uuid4().hex[:8]}.{ext}")
 
-    except Exception as e:
-        logger.warning("Unexpected error during storage upload: %s", e)
-
-    # Insert metadata row to 'ai_events'
-    row = {
-        "device_id": device_id,
-        "event_type": event_type,
-        "label": label,
-        "timestamp": int(timestamp),
-        "file_path": file_path,
-    }
-    try:
-        r = client.table("ai_events").insert(row).execute()
-        logger.info("Inserted metadata row into ai_events: %s", r)
-        return {"insert": r, "file_path": file_path}
-    except Exception as e:
-        logger.exception("Failed to insert metadata into ai_events: %s", e)
-        return {"insert": None, "file_path": file_path}
+
+# Device audio is archived as multi-second segments by one background encoder per device
+# instead of an ffmpeg spawn per window; stopped before the Supabase writer so the last
+# segments still get queued. One archiver per PCM format (devices may send 16 kHz mono
+# binary chunks or 44.1 kHz stereo JSON ones).
+audio_archivers = {}
+_audio_archivers_lock = threading.Lock()
+
+
+def audio_archiver_for(sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS):
+    key = (int(sample_rate), int(channels))
+    archiver = audio_archivers.get(key)
+    if archiver is None:
+        with _audio_archivers_lock:
+            archiver = audio_archivers.get(key)
+            if archiver is None:
+                archiver = audio_archivers[key] = AudioArchiver(_archive_audio_segment, *key)
+    return archiver
+
+
+def _stop_audio_archivers():
+    for archiver in list(audio_archivers.values()):
+        archiver.stop()
 
 
-def on_connect(client, userdata, flags, rc):
+atexit.register(_stop_audio_archivers)
+
+
+def on_connect(client, userdata, flags, rc, properties=None):
     logger.info("Connected to MQTT broker with result code %s", rc)
-    client.subscribe(TOPIC_FRAME)
-    client.subscribe(TOPIC_AUDIO)
-    logger.info("Subscribed to topics: %s, %s", TOPIC_FRAME, TOPIC_AUDIO)
+    # flat topics plus per-device `<topic>/<device_id>` (shared-subscription prefixed in shared mode)
+    topics = cluster.subscriptions([TOPIC_FRAME, TOPIC_AUDIO])
+    client.subscribe([(t, 0) for t in topics])
+    logger.info("Subscribed to topics: %s", ", ".join(topics))
 
 
 def parse_message_payload(payload):
     """Try to parse JSON with base64 data, else return raw bytes."""
-    try:
-        text = payload.decode("utf-8")
-        obj = json.loads(text)
-        if "data" in obj:
-            b = base64.b64decode(obj["data"])
-            return obj.get("device_id", "unknown"), obj.get("timestamp", time.time()), b, obj.get("format", None)
-    except Exception:
-        # Not JSON/base64 — return raw
-        return None, None, payload, None
-    return None, None, payload, None
+    decoded = decode_message(payload)
+    return decoded.device_id, decoded.timestamp, decoded.data, decoded.format
 
 
-def on_message(client, userdata, msg):
+def handle_message(client, msg):
+    """Process one MQTT message. Runs on a dispatcher worker, never on the paho network thread."""
     logger.info("Message on %s", msg.topic)
-    device_id, timestamp_val, data_bytes, fmt = parse_message_payload(msg.payload)
-    if timestamp_val is None:
-        timestamp_val = time.time()
-    if device_id is None:
-        device_id = "unknown"
-
     try:
-        if msg.topic == TOPIC_FRAME:
-            # classify image
-            # prefer device_id embedded in payload if present
-            try:
-                text = msg.payload.decode('utf-8')
-                obj = json.loads(text)
-                if isinstance(obj, dict) and obj.get('device_id'):
-                    device_id = obj.get('device_id')
-            except Exception:
-                pass
+        # one parse per message: binary header, JSON audio array or JSON/base64 (see payload_codec)
+        decoded = decode_message(msg.payload)
+    except PayloadError as e:
+        logger.warning("Dropping malformed payload on %s: %s", msg.topic, e)
+        return
+    topic_device = device_from_topic(msg.topic, TOPIC_FRAME) or device_from_topic(msg.topic, TOPIC_AUDIO)
+    device_id = topic_device or decoded.device_id or "unknown"
+    if topic_device is None and not cluster.owns(device_id):
+        # flat topic: ownership is only known once the payload is parsed
+        return
+    timestamp_val = decoded.timestamp if decoded.timestamp is not None else time.time()
+    data_bytes = decoded.data
 
-            label = classify_image_bytes(data_bytes)
-            logger.info("Vision label for %s: %s", device_id, label)
+    try:
+        if topic_matches(msg.topic, TOPIC_FRAME):
+            # classify image (or reuse the label if it barely differs from the last classified frame)
+            label, reused = frame_changes.classify(device_id, data_bytes, classify_image_bytes)
+            logger.info("Vision label for %s: %s%s", device_id, label, " (unchanged frame)" if reused else "")
             # cache the frame for this device so audio processing can reuse it
             try:
                 last_frame_by_device[device_id] = data_bytes
             except Exception:
                 pass
-            ext = fmt or "jpg"
-            upload_to_supabase(device_id, "vision", label, timestamp_val, data_bytes, ext)
-
-        elif msg.topic == TOPIC_AUDIO:
-            # If payload was JSON with "audio" array, handle chunk processing
-            try:
-                text = msg.payload.decode('utf-8')
-                obj = json.loads(text)
-            except Exception:
-                obj = None
-
-            if obj and isinstance(obj, dict) and 'audio' in obj:
-                seq = obj.get('seq')
-                # audio is array of ints
-                audio_list = obj.get('audio', [])
-                # prefer device_id in the audio JSON if available
-                device_from_payload = obj.get('device_id') if isinstance(obj, dict) else None
-                use_device = device_from_payload or device_id
-                # Process async style: convert to MP3, fetch frame, send to AI API, compute integrity, publish result
-                process_iot_audio_chunk(client, use_device, seq, audio_list)
+            if not reused:
+                ext = decoded.format or "jpg"
+                upload_to_supabase(device_id, "vision", label, timestamp_val, data_bytes, ext)
+
+        elif topic_matches(msg.topic, TOPIC_AUDIO):
+            if decoded.samples is not None:
+                # Buffer per device; the pipeline (convert, fetch frame, classify, publish)
+                # only runs once a full window of contiguous audio is available
+                # binary payloads say their rate / channels; the window carries them to the classifier
+                for window in audio_windows.add(device_id, decoded.seq, decoded.samples,
+                                                sample_rate=decoded.sample_rate, channels=decoded.channels):
+                    process_iot_audio_chunk(client, device_id, window.last_seq, window.samples,
+                                            window.sample_rate, window.channels)
             else:
                 # fallback: treat raw bytes as wav and classify
                 label = classify_audio_bytes(data_bytes)
                 logger.info("Audio label: %s", label)
-                ext = fmt or "wav"
+                ext = decoded.format or "wav"
                 upload_to_supabase(device_id, "audio", label, timestamp_val, data_bytes, ext)
         else:
             logger.info("Unhandled topic %s", msg.topic)
@@ -376,72 +309,57 @@ def on_message(client, userdata, msg):
         logger.exception("Failed to process message: %s", e)
 
 
-def _fetch_mjpeg_frame(mjpeg_url, timeout=5):
-    """Grab one JPEG frame from an MJPEG multipart stream URL."""
+def message_device(topic, payload):
+    """Dispatcher lane: the device (from the topic, else peeked from the payload), so each device's
+    messages are handled in order while different devices run in parallel."""
+    return (device_from_topic(topic, TOPIC_FRAME) or device_from_topic(topic, TOPIC_AUDIO)
+            or peek_device_id(payload))
+
+
+# Messages are only enqueued on the network thread; workers run `handle_message`.
+dispatcher = MessageDispatcher(handle_message, key=message_device)
+
+
+def on_message(client, userdata, msg):
+    # per-device topics: skip other workers' devices before queueing or parsing anything
+    topic_device = device_from_topic(msg.topic, TOPIC_FRAME) or device_from_topic(msg.topic, TOPIC_AUDIO)
+    if topic_device is not None and not cluster.owns(topic_device):
+        return
+    dispatcher.on_message(client, userdata, msg)
+
+
+def _fetch_mjpeg_frame(mjpeg_url, max_age_ms=CAMERA_MAX_FRAME_AGE_MS):
+    """Return the newest JPEG from the camera's background reader, or None if none is fresh enough.
+
+    Never waits on the network: a persistent reader per URL keeps the latest frame.
+    """
     try:
-        r = requests.get(mjpeg_url, stream=True, timeout=timeout)
-        bytes_buf = b""
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk:
-                bytes_buf += chunk
-                start = bytes_buf.find(b"\xff\xd8")
-                end = bytes_buf.find(b"\xff\xd9")
-                if start != -1 and end != -1 and end > start:
-                    jpg = bytes_buf[start:end+2]
-                    return jpg
+        latest = mjpeg_grabber.get_grabber(mjpeg_url).latest(max_age_ms)
     except Exception as e:
-        logger.warning("Failed to fetch MJPEG frame: %s", e)
-    return None
+        logger.warning("Failed to get MJPEG frame: %s", e)
+        return None
+    return latest[0] if latest else None
 
 
-def _pcm_list_to_mp3_bytes(int_list, sample_rate=PCM_SAMPLE_RATE, sample_width=PCM_SAMPLE_WIDTH, channels=PCM_CHANNELS):
-    """Convert list of signed integers (PCM) to MP3 bytes using pydub."""
-    # Deprecated: legacy function kept for compatibility; prefer `convert_pcm_to_audio_bytes`.
-    return None
+def _pcm_bytes(samples):
+    """int16 samples (list, array('h') window or ndarray) -> raw little-endian PCM bytes."""
+    if isinstance(samples, list):
+        return array.array('h', samples).tobytes()
+    return memoryview(samples).cast('B').tobytes()
 
 
 def convert_pcm_to_audio_bytes(int_list, sample_rate=PCM_SAMPLE_RATE, sample_width=PCM_SAMPLE_WIDTH, channels=PCM_CHANNELS):
-    """Convert int16 PCM list to WAV bytes for classification and to upload bytes (MP3 if ffmpeg available, else WAV).
-    Returns tuple: (wav_bytes_for_classify, upload_bytes, ext, mime)
+    """Convert int16 PCM to WAV bytes.
+    Returns tuple: (wav_bytes_for_classify, upload_bytes, ext, mime). Compressed archive copies are
+    produced per segment by the audio archivers, not per window.
     """
-    if not int_list:
+    if int_list is None or len(int_list) == 0:
         return None, None, None, None
-    # pack into signed short (int16)
     try:
-        arr = array.array('h', int_list)
-        raw_bytes = arr.tobytes()
-    except Exception as e:
-        logger.exception("Failed to pack PCM ints: %s", e)
-        return None, None, None, None
-
-    # produce WAV bytes for classification
-    try:
-        wav_io = io.BytesIO()
-        with wave.open(wav_io, 'wb') as w:
-            w.setnchannels(channels)
-            w.setsampwidth(sample_width)
-            w.setframerate(sample_rate)
-            w.writeframes(raw_bytes)
-        wav_io.seek(0)
-        wav_bytes = wav_io.read()
+        wav_bytes = pcm_to_wav_bytes(_pcm_bytes(int_list), sample_rate, channels, sample_width)
     except Exception as e:
         logger.exception("Failed to create WAV bytes: %s", e)
         return None, None, None, None
-
-    # decide upload format
-    ffmpeg_path = shutil.which('ffmpeg')
-    if ffmpeg_path:
-        try:
-            audio = AudioSegment(data=raw_bytes, sample_width=sample_width, frame_rate=sample_rate, channels=channels)
-            out_io = io.BytesIO()
-            audio.export(out_io, format='mp3')
-            out_io.seek(0)
-            mp3_bytes = out_io.read()
-            return wav_bytes, mp3_bytes, 'mp3', 'audio/mpeg'
-        except Exception as e:
-            logger.warning("MP3 export failed despite ffmpeg present, falling back to WAV: %s", e)
-
-    # fallback to WAV upload
     return wav_bytes, wav_bytes, 'wav', 'audio/wav'
 
 
@@ -467,78 +385,110 @@ def _compute_integrity_and_label(vision_label, audio_label):
     a_score = audio_map.get(audio_label, 50)
     integrity = 100 - (v_score * 0.6 + a_score * 0.4)
     integrity = max(0, min(100, integrity))
-    # label thresholds
-    if integrity >= 70:
-        label = 'green'
-    elif integrity >= 50:
-        label = 'yellow'
-    else:
-        label = 'red'
-    return integrity, label
-
-
-def process_iot_audio_chunk(mqtt_client, device_id, seq, audio_list):
-    """Process incoming audio chunk from IoT device: convert to MP3, fetch frame, call AI API, compute integrity, publish result."""
+    # label thresholds: green >= 70, yellow >= 50, else red
+    return integrity, raw_label(integrity)
+
+
+def _classify_inprocess(device_id, frame_bytes, pcm_bytes, upload=True, sample_rate=PCM_SAMPLE_RATE,
+                        channels=PCM_CHANNELS):
+    """Classify with the models already loaded here; same result keys as /api/classify_both."""
+    ts = int(time.time())
+    result = {"status": "ok", "timestamp": ts, "device_id": device_id}
+    frame_reused = False
+    if frame_bytes:
+        try:
+            label, frame_reused = frame_changes.classify(device_id, frame_bytes, classify_image_bytes)
+            result["image_label"] = label or "none"
+        except Exception as e:
+            logger.warning("Local vision classification failed: %s", e)
+            result["image_label"] = "none"
+            result["image_error"] = str(e)
+    if pcm_bytes:
+        try:
+            result["audio_label"] = classify_audio_pcm(pcm_bytes, sample_rate, channels, device_id=device_id) or "none"
+        except Exception as e:
+            logger.warning("Local audio classification failed: %s", e)
+            result["audio_label"] = "none"
+            result["audio_error"] = str(e)
+    # which artifacts answered (not added to the MQTT result, whose JSON the ESP32 parses into 128 bytes)
+    result["model_versions"] = model_registry.versions()
+    if upload:
+        # a near-identical frame was already uploaded with this label
+        if frame_bytes and not frame_reused:
+            upload_to_supabase(device_id, "vision", result.get("image_label", "none"), ts, frame_bytes, "jpg",
+                               filename=f"{device_id}_vision_{ts}_{uuid.uuid4().hex[:8]}.jpg")
+        if pcm_bytes:
+            # encoded and uploaded per segment in the background
+            audio_archiver_for(sample_rate, channels).add(device_id, pcm_bytes, result.get("audio_label", "none"), ts)
+    return result
+
+
+def _classify_via_api(device_id, frame_bytes, pcm_bytes, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS):
+    """POST to the AI API's /api/classify_both; falls back to in-process classification if it is unreachable."""
+    files = {}
+    multipart = {}
+    if frame_bytes:
+        files['image'] = ('frame.jpg', frame_bytes, 'image/jpeg')
+    files['audio'] = ("audio.wav", pcm_to_wav_bytes(pcm_bytes, sample_rate, channels, PCM_SAMPLE_WIDTH),
+                      'audio/wav')
+    multipart['device_id'] = device_id
+    multipart['upload'] = 'true'
+    try:
+        # pooled keep-alive session that fails fast on connect (HTTP_INFERENCE_CONNECT_*), so an
+        # unreachable API costs about one connect timeout before the in-process fallback
+        resp = http_pool.get_session("inference").post(f"{AI_API_URL}/api/classify_both", files=files,
+                                                       data=multipart)
+        return resp.json() if resp.ok else {'error': f'status {resp.status_code}'}
+    except Exception as e:
+        # AI API unreachable — fall back to local classification to keep pipeline working
+        logger.warning("AI API request failed, falling back to local classification: %s", e)
+        json_resp = _classify_inprocess(device_id, frame_bytes, pcm_bytes, upload=False,
+                                        sample_rate=sample_rate, channels=channels)
+        json_resp.update({'error': str(e), 'local_fallback': True})
+        return json_resp
+
+
+# Results go to {HIVEMQ_RESULT_TOPIC}/{device_id} (INTEGRITY_TOPIC_MODE=legacy keeps the shared topic);
+# INTEGRITY_AGGREGATE_TOPIC adds a single topic with every device's results for dashboards.
+integrity_publisher = IntegrityPublisher(os.getenv('HIVEMQ_RESULT_TOPIC', 'iot/integrity/result'))
+
+
+def process_iot_audio_chunk(mqtt_client, device_id, seq, audio_list, sample_rate=PCM_SAMPLE_RATE,
+                            channels=PCM_CHANNELS):
+    """Process incoming audio window from IoT device: convert, fetch frame, classify (in-process or via AI API), compute integrity, publish result.
+
+    `sample_rate` / `channels` describe `audio_list` (the window's format, from the device's payloads).
+    """
     try:
         logger.info("Processing audio chunk seq=%s for device=%s (samples=%d)", seq, device_id, len(audio_list))
-        wav_bytes, upload_bytes, upload_ext, upload_mime = convert_pcm_to_audio_bytes(audio_list)
-        if wav_bytes is None or upload_bytes is None:
+        if audio_list is None or len(audio_list) == 0:
             logger.warning("No audio produced for device %s", device_id)
             return
+        # classification reads the raw PCM; the archive copy is encoded later, per segment
+        pcm_bytes = _pcm_bytes(audio_list)
 
-        # fetch one frame from camera stream
+        # latest frame from the camera stream, else the last one this device published
         frame_bytes = _fetch_mjpeg_frame(CAMERA_MJPEG_URL)
+        if frame_bytes is None:
+            frame_bytes = last_frame_by_device.get(device_id)
 
-        # Send to AI API classify_both
-        files = {}
-        multipart = {}
-        if frame_bytes:
-            files['image'] = ('frame.jpg', frame_bytes, 'image/jpeg')
-        files['audio'] = (f"audio.{upload_ext}", upload_bytes, upload_mime)
-        multipart['device_id'] = device_id
-        multipart['upload'] = 'true'
-        try:
-            resp = requests.post(f"{AI_API_URL}/api/classify_both", files=files, data=multipart, timeout=10)
-            json_resp = resp.json() if resp.ok else {'error': f'status {resp.status_code}'}
-        except Exception as e:
-            # AI API unreachable — fall back to local classification to keep pipeline working
-            logger.warning("AI API request failed, falling back to local classification: %s", e)
-            json_resp = {'error': str(e), 'local_fallback': True}
-            # attempt local vision classification if we have a frame
-            try:
-                if frame_bytes:
-                    vlab = classify_image_bytes(frame_bytes)
-                    json_resp['vision_label'] = vlab
-            except Exception as e2:
-                logger.warning("Local vision classification failed: %s", e2)
-                json_resp['vision_error'] = str(e2)
-            # attempt local audio classification
-            try:
-                if mp3_bytes:
-                    alab = classify_audio_bytes(mp3_bytes)
-                    json_resp['audio_label'] = alab
-                # if wav_bytes: 
-                #     alab = classify_audio_bytes(wav_bytes) 
-                #     json_resp['audio_label'] = alab
-            except Exception as e3:
-                logger.warning("Local audio classification failed: %s", e3)
-                json_resp['audio_error'] = str(e3)
+        if AI_MODE == "http":
+            json_resp = _classify_via_api(device_id, frame_bytes, pcm_bytes, sample_rate, channels)
+        else:
+            json_resp = _classify_inprocess(device_id, frame_bytes, pcm_bytes, sample_rate=sample_rate,
+                                            channels=channels)
 
         # Extract labels
         vision_label = json_resp.get('image_label') if isinstance(json_resp, dict) else None
         audio_label = json_resp.get('audio_label') if isinstance(json_resp, dict) else None
         # compute integrity
-        integrity_score, color_label = _compute_integrity_and_label(vision_label or 'none', audio_label or 'none')
-
-        # Publish minimal JSON payload as requested
-        payload = {
-            'device_id': device_id,
-            'integrity_score': round(integrity_score/100, 3),
-            'label': color_label,
-        }
-        topic = os.getenv('HIVEMQ_RESULT_TOPIC', 'iot/integrity/result')
-        mqtt_client.publish(topic, json.dumps(payload))
-        logger.info("Published integrity result to %s: %s", topic, payload)
+        integrity_score, _ = _compute_integrity_and_label(vision_label or 'none', audio_label or 'none')
+        logger.info("Device %s: vision=%s audio=%s integrity=%.0f models=%s", device_id, vision_label, audio_label,
+                    integrity_score, json_resp.get('model_versions') if isinstance(json_resp, dict) else None)
+
+        # Publish {device_id, integrity_score, label} only on a label change (with hysteresis),
+        # a large score move, or a heartbeat
+        integrity_publisher.update(mqtt_client, device_id, integrity_score)
     except Exception as e:
         logger.exception("Failed processing iot audio chunk: %s", e)
 
@@ -654,9 +604,9 @@ def main():
         logger.error("HIVEMQ_HOST not configured in environment")
         return
 
-    # Use MQTTv311 to avoid deprecated callback API warnings
+    # Use MQTTv311 to avoid deprecated callback API warnings; shared subscriptions need MQTT v5
     try:
-        client = mqtt.Client(protocol=mqtt.MQTTv311)
+        client = mqtt.Client(protocol=mqtt.MQTTv5 if cluster.needs_mqtt5 else mqtt.MQTTv311)
     except Exception:
         client = mqtt.Client()
     if HIVEMQ_USER and HIVEMQ_PASS:
@@ -672,9 +622,42 @@ def main():
     client.on_connect = on_connect
     client.on_message = on_message
 
+    logger.info("Consumer: %s", cluster.describe())
+    logger.info("Integrity results: mode=%s topics=%s", integrity_publisher.mode,
+                integrity_publisher.topics_for("<device_id>"))
+    logger.info("Speech energy gate: %s", speech_gate.describe())
+    logger.info("AI mode: %s%s", AI_MODE, f" ({AI_API_URL})" if AI_MODE == "http" else "")
+    dispatcher.start(client)
+    if SUPABASE_URL and SUPABASE_KEY:
+        # starts the uploaders and replays anything spooled by a previous run
+        supabase_writer.start()
+    # connect to the camera now so a frame is cached before the first audio window
+    mjpeg_grabber.get_grabber(CAMERA_MJPEG_URL)
+    if AI_MODE != "http":
+        # load and warm up both models now rather than on the first messages
+        model_registry.load_all()
+        model_registry.start()
+        logger.info("Model versions: %s", model_registry.versions())
+    logger.info("Startup: %s", startup.report())
     client.connect(HIVEMQ_HOST, HIVEMQ_PORT, 60)
     logger.info("Starting MQTT loop")
-    client.loop_forever()
+    try:
+        client.loop_forever()
+    finally:
+        dispatcher.stop()
+        # stops the watcher and the vision batcher
+        model_registry.stop()
+        mjpeg_grabber.stop_all()
+        _stop_audio_archivers()
+        logger.info("Integrity publisher stats: %s", integrity_publisher.stats)
+        logger.info("Frame change stats: %s", frame_changes.stats())
+        logger.info("Speech gate stats: %s", speech_gate.stats)
+        if cluster.mode == "hash":
+            logger.info("Cluster shard stats: %s", cluster.stats)
+        logger.info("HTTP pool stats: %s", http_pool.pool_stats())
+
+
+startup.add("import ai_mqtt_consumer", time.perf_counter() - _import_started)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,323 @@
+"""Deferred, segmented archival encoding of device audio.
+
+The consumer used to export every ~1 s audio window to MP3 through pydub,
+which runs `shutil.which('ffmpeg')` and spawns a fresh ffmpeg per window just
+to produce the upload copy. Classification works on the raw PCM; archiving is
+done here, off the hot path:
+
+- `AudioArchiver.add` only queues the PCM (never blocks the caller);
+- a background thread appends each device's audio to its current segment;
+- for MP3, each device keeps ONE long-lived ffmpeg that encodes its stream
+  continuously; when a segment is `segment_seconds` long the MP3 frames
+  produced so far are cut off at a frame boundary and handed to `sink`, so
+  the segment files concatenate back into a gapless stream;
+- devices that go quiet for `idle_seconds` have their last segment flushed
+  and their encoder closed;
+- without ffmpeg (or with AUDIO_ARCHIVE_FORMAT=wav) segments are stored as WAV.
+
+The ffmpeg lookup happens once at import. `stats()` reports encode throughput
+as seconds of audio archived per second of encoder-thread time.
+
+Environment variables:
+  AUDIO_ARCHIVE_FORMAT            mp3 or wav (default mp3, wav if ffmpeg is missing)
+  AUDIO_ARCHIVE_SEGMENT_SECONDS   audio per archived file (default 10)
+  AUDIO_ARCHIVE_IDLE_SECONDS      flush a device's segment after this much silence (default 5)
+  AUDIO_ARCHIVE_BITRATE           MP3 bitrate (default 64k)
+  AUDIO_ARCHIVE_QUEUE_SIZE        max queued windows before dropping (default 512)
+"""
+import io
+import os
+import time
+import queue
+import shutil
+import logging
+import threading
+import subprocess
+import wave
+from collections import Counter
+
+
+logger = logging.getLogger("audio_archive")
+
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+AUDIO_ARCHIVE_FORMAT = os.getenv("AUDIO_ARCHIVE_FORMAT", "mp3").lower()
+AUDIO_ARCHIVE_SEGMENT_SECONDS = float(os.getenv("AUDIO_ARCHIVE_SEGMENT_SECONDS", "10"))
+AUDIO_ARCHIVE_IDLE_SECONDS = float(os.getenv("AUDIO_ARCHIVE_IDLE_SECONDS", "5"))
+AUDIO_ARCHIVE_BITRATE = os.getenv("AUDIO_ARCHIVE_BITRATE", "64k")
+AUDIO_ARCHIVE_QUEUE_SIZE = int(os.getenv("AUDIO_ARCHIVE_QUEUE_SIZE", "512"))
+
+# MPEG audio layer III bitrate tables (kbit/s), indexed by the header's bitrate field
+_BITRATES_MPEG1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0]
+_BITRATES_MPEG2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0]
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_frames_end(buf):
+    """Length of the prefix of `buf` made of complete MP3 frames.
+
+    Walks frame headers from the start; a buffer that doesn't start with a
+    frame header is returned whole so unexpected output is never held back.
+    """
+    pos = 0
+    n = len(buf)
+    while pos + 4 <= n:
+        b1, b2 = buf[pos + 1], buf[pos + 2]
+        version = (b1 >> 3) & 3
+        layer = (b1 >> 1) & 3
+        br_idx = b2 >> 4
+        sr_idx = (b2 >> 2) & 3
+        if (buf[pos] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or layer != 1
+                or br_idx in (0, 15) or sr_idx == 3):
+            return n if pos == 0 else pos
+        rate = _SAMPLE_RATES[version][sr_idx]
+        padding = (b2 >> 1) & 1
+        if version == 3:
+            length = 144000 * _BITRATES_MPEG1[br_idx] // rate + padding
+        else:
+            length = 72000 * _BITRATES_MPEG2[br_idx] // rate + padding
+        if pos + length > n:
+            break
+        pos += length
+    return pos
+
+
+def pcm_to_wav_bytes(pcm_bytes, sample_rate, channels=1, sample_width=2):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sample_width)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm_bytes)
+    return out.getvalue()
+
+
+class Mp3StreamEncoder:
+    """A long-lived ffmpeg turning one continuous int16 PCM stream into MP3 frames."""
+
+    def __init__(self, sample_rate, channels=1, bitrate=AUDIO_ARCHIVE_BITRATE, ffmpeg=None):
+        ffmpeg = ffmpeg or FFMPEG_PATH
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found on PATH")
+        self.proc = subprocess.Popen(
+            [ffmpeg, "-hide_banner", "-loglevel", "error",
+             "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+             "-f", "mp3", "-b:a", bitrate, "-id3v2_version", "0", "-write_xing", "0",
+             "-flush_packets", "1", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self._out = bytearray()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, name="mp3-encoder-out", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        stdout = self.proc.stdout
+        while True:
+            data = stdout.read1(65536)
+            if not data:
+                break
+            with self._lock:
+                self._out += data
+
+    def write(self, pcm_bytes):
+        self.proc.stdin.write(pcm_bytes)
+        self.proc.stdin.flush()
+
+    def take(self):
+        """Complete MP3 frames encoded so far (the encoder keeps running)."""
+        with self._lock:
+            end = mp3_frames_end(self._out)
+            data = bytes(self._out[:end])
+            del self._out[:end]
+        return data
+
+    def close(self, timeout=5.0):
+        """Finish the stream and return everything not yet taken."""
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._reader.join(timeout=timeout)
+        with self._lock:
+            data = bytes(self._out)
+            self._out.clear()
+        return data
+
+
+class _Segment:
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.frames = 0
+        self.pcm = bytearray()
+        self.labels = Counter()
+        self.last_seen = time.monotonic()
+        self.encoder = None
+
+
+class AudioArchiver:
+    """Collects per-device PCM into segments and encodes them in the background.
+
+    `sink(device_id, label, timestamp, data, ext)` receives each finished
+    segment; in the consumer it is `upload_to_supabase` with event_type audio.
+    """
+
+    def __init__(self, sink, sample_rate, channels=1, segment_seconds=AUDIO_ARCHIVE_SEGMENT_SECONDS,
+                 fmt=AUDIO_ARCHIVE_FORMAT, bitrate=AUDIO_ARCHIVE_BITRATE, idle_seconds=AUDIO_ARCHIVE_IDLE_SECONDS,
+                 queue_size=AUDIO_ARCHIVE_QUEUE_SIZE):
+        self.sink = sink
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+        self.segment_frames = max(1, int(segment_seconds * self.sample_rate))
+        self.bitrate = bitrate
+        self.idle_seconds = float(idle_seconds)
+        self.fmt = fmt if fmt == "wav" or FFMPEG_PATH else "wav"
+        if fmt == "mp3" and self.fmt == "wav":
+            logger.warning("ffmpeg not found; archiving audio segments as WAV")
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._segments = {}
+        self._thread = None
+        self._stopping = threading.Event()
+        self._busy = 0.0
+        self.stats_counters = {"windows": 0, "dropped": 0, "segments": 0, "encoders_started": 0,
+                               "pcm_bytes": 0, "encoded_bytes": 0, "audio_seconds": 0.0}
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audio-archive", daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, device_id, pcm_bytes, label=None, timestamp=None):
+        """Queue one window of int16 PCM for archiving. Returns False if it had to be dropped."""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((device_id, bytes(pcm_bytes), label, timestamp or time.time()))
+            return True
+        except queue.Full:
+            self.stats_counters["dropped"] += 1
+            logger.warning("Audio archive queue full; dropping window for %s", device_id)
+            return False
+
+    def flush(self, timeout=10.0):
+        """Wait for queued windows to be written into their segments (segments stay open)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return self._queue.unfinished_tasks == 0
+
+    def stop(self, timeout=10.0):
+        """Drain the queue, close every open segment and stop the thread."""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        for device_id in list(self._segments):
+            self._finish(device_id, close=True)
+        logger.info("Audio archive stats: %s", self.stats())
+
+    def stats(self):
+        s = dict(self.stats_counters)
+        s["encode_busy_seconds"] = round(self._busy, 3)
+        # seconds of audio archived per second the encoder thread spent working
+        s["realtime_factor"] = round(s["audio_seconds"] / self._busy, 1) if self._busy else None
+        s["open_segments"] = len(self._segments)
+        s["format"] = self.fmt
+        return s
+
+    # ---------------------------------------------------------------- worker
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._flush_idle()
+                continue
+            try:
+                self._append(*item)
+            except Exception as e:
+                logger.exception("Audio archive append failed for %s: %s", item[0], e)
+            finally:
+                self._queue.task_done()
+            self._flush_idle()
+
+    def _append(self, device_id, pcm_bytes, label, timestamp):
+        start = time.perf_counter()
+        seg = self._segments.get(device_id)
+        if seg is None:
+            seg = self._segments[device_id] = _Segment(timestamp)
+        elif seg.started_at is None:
+            seg.started_at = timestamp
+        if self.fmt == "mp3" and seg.encoder is None and not seg.pcm:
+            seg.encoder = Mp3StreamEncoder(self.sample_rate, self.channels, self.bitrate)
+            self.stats_counters["encoders_started"] += 1
+        if seg.encoder is not None:
+            try:
+                seg.encoder.write(pcm_bytes)
+            except OSError as e:
+                # encoder died: archive what it did encode, then keep the rest of the segment as PCM (WAV)
+                logger.warning("MP3 encoder for %s failed (%s); falling back to WAV", device_id, e)
+                encoded = seg.encoder.close(timeout=1.0)
+                seg.encoder = None
+                self._emit(device_id, seg, encoded, "mp3")
+                seg = self._segments[device_id] = _Segment(timestamp)
+                seg.pcm += pcm_bytes
+        else:
+            seg.pcm += pcm_bytes
+        seg.frames += len(pcm_bytes) // (2 * self.channels)
+        seg.labels[label or "none"] += 1
+        seg.last_seen = time.monotonic()
+        self.stats_counters["windows"] += 1
+        self.stats_counters["pcm_bytes"] += len(pcm_bytes)
+        self._busy += time.perf_counter() - start
+        if seg.frames >= self.segment_frames:
+            self._finish(device_id, close=False)
+
+    def _flush_idle(self):
+        now = time.monotonic()
+        for device_id, seg in list(self._segments.items()):
+            if now - seg.last_seen >= self.idle_seconds:
+                self._finish(device_id, close=True)
+
+    def _finish(self, device_id, close):
+        """Hand the device's current segment to the sink; `close` also ends its encoder."""
+        seg = self._segments.get(device_id)
+        if seg is None:
+            return
+        start = time.perf_counter()
+        if seg.encoder is not None:
+            data = seg.encoder.close() if close else seg.encoder.take()
+            ext = "mp3"
+        else:
+            data = pcm_to_wav_bytes(bytes(seg.pcm), self.sample_rate, self.channels) if seg.pcm else b""
+            ext = "wav"
+        self._busy += time.perf_counter() - start
+        if close:
+            del self._segments[device_id]
+        else:
+            fresh = _Segment(None)
+            fresh.encoder = seg.encoder
+            self._segments[device_id] = fresh
+        self._emit(device_id, seg, data, ext)
+
+    def _emit(self, device_id, seg, data, ext):
+        if seg.frames:
+            self.stats_counters["audio_seconds"] += seg.frames / self.sample_rate
+        if not data:
+            return
+        self.stats_counters["segments"] += 1
+        self.stats_counters["encoded_bytes"] += len(data)
+        label = seg.labels.most_common(1)[0][0] if seg.labels else "none"
+        try:
+            self.sink(device_id, label, seg.started_at or time.time(), data, ext)
+        except Exception as e:
+            logger.exception("Audio archive sink failed for %s: %s", device_id, e)
@@ -0,0 +1,204 @@
+"""In-memory audio decoding shared by the consumer and the FastAPI servers.
+
+Every classify path used to write the clip to disk and read it back with
+`librosa.load` (or, in the servers, to one shared `temp_audio.wav`, which
+concurrent requests overwrite). `decode_audio` returns the same float32 mono
+signal `librosa.load(path, sr=sr)` would, without touching the filesystem:
+
+- WAV/RIFF is parsed directly (PCM 8/16/24/32-bit, IEEE float, extensible);
+- raw little-endian int16 PCM goes straight through `np.frombuffer`;
+- compressed formats (mp3, m4a/aac, ogg, flac, ...) are decoded through
+  soundfile from memory when it can, otherwise piped through ffmpeg
+  (stdin -> stdout, no temp files).
+
+Resampling, when the source rate differs from `sr`, uses librosa's default
+resampler so features stay identical to the `librosa.load` path.
+"""
+import io
+import shutil
+import struct
+import logging
+import subprocess
+
+import numpy as np
+
+
+logger = logging.getLogger("audio_decode")
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_FFMPEG = shutil.which("ffmpeg")
+
+
+class AudioDecodeError(ValueError):
+    pass
+
+
+def sniff_format(data):
+    """Best guess at the container from magic bytes: wav, mp3, m4a, ogg, flac or raw."""
+    head = bytes(data[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    if head[:3] == b"ID3" or _mp3_frames_chain(data):
+        return "mp3"
+    return "raw"
+
+
+# MPEG audio layer III bitrate tables (kbit/s) and sample rates, indexed by header fields
+_BITRATES_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0)
+_BITRATES_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0)
+_MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_frame_length(buf, pos):
+    """Length of the layer III frame whose header starts at `pos`, or 0 if there is none."""
+    if pos + 4 > len(buf):
+        return 0
+    b0, b1, b2 = buf[pos], buf[pos + 1], buf[pos + 2]
+    version = (b1 >> 3) & 3
+    br_idx = b2 >> 4
+    sr_idx = (b2 >> 2) & 3
+    if (b0 != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1
+            or br_idx in (0, 15) or sr_idx == 3):
+        return 0
+    rate = _MP3_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 1
+    if version == 3:
+        return 144000 * _BITRATES_MPEG1[br_idx] // rate + padding
+    return 72000 * _BITRATES_MPEG2[br_idx] // rate + padding
+
+
+def _mp3_frames_chain(data, frames=3):
+    """True when a bare MP3 stream starts here: several valid frame headers, each where the last one ends.
+
+    A single sync word is not enough: raw int16 PCM starting with a -1 sample
+    (bytes FF FF), common in quiet audio, looks like one.
+    """
+    buf = bytes(data[:8192])  # three frames are at most ~4.3 kB
+    pos = seen = 0
+    while seen < frames:
+        length = _mp3_frame_length(buf, pos)
+        if not length:
+            return False
+        pos += length
+        seen += 1
+        if pos >= len(buf):
+            # a clip shorter than `frames` frames: fine if it ends on (or inside the last of) its frames
+            return seen > 1 or pos == len(buf)
+    return True
+
+
+def pcm16_to_float(data):
+    """Raw little-endian int16 PCM -> float32 in [-1, 1)."""
+    n = len(data) // 2
+    return np.frombuffer(data, dtype="<i2", count=n).astype(np.float32) / 32768.0
+
+
+def _parse_wav(data):
+    """Return (samples[frames, channels] float32, sample_rate) from a RIFF/WAVE buffer."""
+    view = memoryview(data)
+    if len(view) < 12:
+        raise AudioDecodeError("truncated WAV header")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        size = struct.unpack_from("<I", view, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, block_align, bits = struct.unpack_from("<HHIIHH", view, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                tag = struct.unpack_from("<H", view, body + 24)[0]
+            fmt = (tag, channels, rate, block_align, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV data chunk before fmt chunk")
+            end = min(body + size, len(view))
+            return _pcm_frames(view[body:end], *fmt)
+        pos = body + size + (size & 1)
+    raise AudioDecodeError("WAV without data chunk")
+
+
+def _pcm_frames(raw, tag, channels, rate, block_align, bits):
+    width = bits // 8
+    usable = len(raw) - len(raw) % (block_align or max(1, channels * width))
+    raw = raw[:usable]
+    if tag == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = "<f4" if width == 4 else "<f8"
+        y = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    elif tag == WAVE_FORMAT_PCM:
+        if width == 1:
+            y = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            y = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+        elif width == 3:
+            b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16))
+            ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+            y = ints.astype(np.float32) / 8388608.0
+        elif width == 4:
+            y = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+        else:
+            raise AudioDecodeError(f"unsupported PCM width {bits} bits")
+    else:
+        raise AudioDecodeError(f"unsupported WAV format tag {tag:#x}")
+    return y.reshape(-1, channels), rate
+
+
+def _decode_compressed(data, sr):
+    """Decode mp3/m4a/ogg/flac from memory. Returns (samples[frames, channels], rate)."""
+    try:
+        import soundfile as sf
+        y, rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return y, rate
+    except Exception:
+        pass
+    if _FFMPEG is None:
+        raise AudioDecodeError("compressed audio needs soundfile support or ffmpeg on PATH")
+    target = sr or 44100
+    proc = subprocess.run(
+        [_FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "f32le", "-ac", "1", "-ar", str(target), "pipe:1"],
+        input=bytes(data), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+    )
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg decode failed: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, dtype="<f4").reshape(-1, 1), target
+
+
+def resample(y, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return y
+    import librosa
+    return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr)
+
+
+def decode_audio(data, sr=16000, fmt=None, pcm_rate=16000, pcm_channels=1):
+    """Decode an audio buffer to mono float32 at `sr` (None keeps the native rate).
+
+    `fmt` overrides sniffing ("wav", "raw"/"pcm", or any compressed extension).
+    Raw PCM is assumed to be int16 at `pcm_rate` with `pcm_channels` interleaved.
+    Returns `(y, sr)` like `librosa.load`.
+    """
+    fmt = (fmt or sniff_format(data)).lower().lstrip(".")
+    if fmt == "wav":
+        frames, rate = _parse_wav(data)
+    elif fmt in ("raw", "pcm"):
+        y = pcm16_to_float(data)
+        y = y[:len(y) - len(y) % pcm_channels]
+        frames, rate = y.reshape(-1, pcm_channels), pcm_rate
+    else:
+        frames, rate = _decode_compressed(data, sr)
+    y = frames[:, 0] if frames.shape[1] == 1 else frames.mean(axis=1, dtype=np.float32)
+    y = np.ascontiguousarray(y, dtype=np.float32)
+    if sr is None:
+        return y, rate
+    return resample(y, rate, sr), sr
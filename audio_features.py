@@ -0,0 +1,168 @@
+"""Shared 16-dim speech feature vector computed from a single STFT.
+
+The speech model is trained on [rms, zcr, spectral_centroid, mfcc_1..13], each
+averaged over frames. Computing them with four separate librosa calls frames
+the signal four times and runs two STFTs (centroid and mel). `FeatureEngine`
+frames the window once, takes one power spectrogram, and derives everything
+from it with plain NumPy:
+
+- rms       mean over frames of sqrt(mean(frame**2))       (librosa.feature.rms)
+- zcr       mean over frames of sign changes / frame_length (librosa.feature.zero_crossing_rate)
+- centroid  mean over frames of sum(f * |S|) / sum(|S|)    (librosa.feature.spectral_centroid)
+- mfcc      DCT-II(ortho) of power_to_db(mel @ |S|**2)     (librosa.feature.mfcc, n_mfcc=13)
+
+with librosa's defaults (n_fft=2048, hop=512, centered frames, periodic Hann,
+128 Slaney mel bands, top_db=80). The Hann window, mel filterbank and DCT
+matrix only depend on (sr, n_fft, n_mels, n_mfcc) and are built once per
+combination. Values match the librosa calls to float32 precision; see
+Test/unit-test/test_audio_features.py.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+FEATURE_NAMES = ["rms", "zcr", "spectral_centroid"] + [f"mfcc_{i}" for i in range(1, 14)]
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+TOP_DB = 80.0
+AMIN = 1e-10
+ZC_THRESHOLD = 1e-10
+
+
+def _hz_to_mel(freqs):
+    """Slaney mel scale (linear below 1 kHz, log above), as librosa with htk=False."""
+    freqs = np.asanyarray(freqs, dtype=np.float64)
+    f_sp = 200.0 / 3
+    mels = freqs / f_sp
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(freqs >= min_log_hz,
+                    min_log_mel + np.log(np.maximum(freqs, min_log_hz) / min_log_hz) / logstep,
+                    mels)
+
+
+def _mel_to_hz(mels):
+    mels = np.asanyarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    freqs = f_sp * mels
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(mels >= min_log_mel, min_log_hz * np.exp(logstep * (mels - min_log_mel)), freqs)
+
+
+@lru_cache(maxsize=None)
+def hann_window(n_fft):
+    n = np.arange(n_fft)
+    return (0.5 - 0.5 * np.cos(2.0 * np.pi * n / n_fft)).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def fft_frequencies(sr, n_fft):
+    return np.fft.rfftfreq(n_fft, 1.0 / sr)
+
+
+@lru_cache(maxsize=None)
+def mel_filterbank(sr, n_fft, n_mels=N_MELS):
+    """Slaney-normalised triangular filters, shape (n_mels, 1 + n_fft // 2)."""
+    fftfreqs = fft_frequencies(sr, n_fft)
+    mel_f = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sr / 2.0), n_mels + 2))
+    fdiff = np.diff(mel_f)
+    ramps = mel_f[:, None] - fftfreqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    enorm = 2.0 / (mel_f[2:n_mels + 2] - mel_f[:n_mels])
+    weights *= enorm[:, None]
+    return weights.astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(n_mfcc, n_mels):
+    """Rows of the orthonormal DCT-II, shape (n_mfcc, n_mels)."""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2.0 * n_mels)) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+def _frames(y, n_fft, hop_length):
+    """Strided (n_frames, n_fft) view of `y`."""
+    n_frames = 1 + (len(y) - n_fft) // hop_length
+    return np.lib.stride_tricks.as_strided(
+        y, shape=(n_frames, n_fft), strides=(y.strides[0] * hop_length, y.strides[0]), writeable=False)
+
+
+class FeatureEngine:
+    """Computes the 16 speech features for signals at one sample rate."""
+
+    def __init__(self, sr=16000, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS, n_mfcc=N_MFCC):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window = hann_window(n_fft)
+        self.freqs = fft_frequencies(sr, n_fft)
+        self.mel = mel_filterbank(sr, n_fft, n_mels)
+        self.dct = dct_matrix(n_mfcc, n_mels)
+
+    def power_spectrogram(self, y):
+        """Centered, zero-padded frames and their |STFT|**2, shapes (T, n_fft) and (T, 1 + n_fft // 2)."""
+        pad = self.n_fft // 2
+        frames = _frames(np.pad(y, pad, mode="constant"), self.n_fft, self.hop_length)
+        spec = np.fft.rfft(frames * self.window, axis=1)
+        power = spec.real ** 2 + spec.imag ** 2
+        return frames, power
+
+    def zcr(self, y):
+        # librosa pads zcr frames by repeating the edge samples, not with zeros
+        pad = self.n_fft // 2
+        padded = np.pad(y, pad, mode="edge")
+        neg = np.signbit(np.where(np.abs(padded) <= ZC_THRESHOLD, 0.0, padded))
+        crossings = np.concatenate(([0], np.cumsum(neg[1:] != neg[:-1])))
+        n_frames = 1 + (len(padded) - self.n_fft) // self.hop_length
+        starts = np.arange(n_frames) * self.hop_length
+        # crossings inside a frame exclude its first sample
+        per_frame = crossings[starts + self.n_fft - 1] - crossings[starts]
+        return float(np.mean(per_frame / self.n_fft))
+
+    def features(self, y, rms_mode="frames"):
+        """16-dim feature vector for mono float signal `y`.
+
+        `rms_mode="frames"` averages per-frame RMS (librosa.feature.rms);
+        `"global"` is sqrt(mean(y**2)) over the whole window, as the
+        dataset extractor in Speech-Recognition/extract_features.py uses.
+        """
+        y = np.ascontiguousarray(y, dtype=np.float32)
+        frames, power = self.power_spectrogram(y)
+
+        if rms_mode == "global":
+            rms = float(np.sqrt(np.mean(y.astype(np.float64) ** 2))) if len(y) else 0.0
+        else:
+            rms = float(np.mean(np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))))
+
+        mag = np.sqrt(power)
+        total = mag.sum(axis=1)
+        safe = np.where(total > np.finfo(np.float32).tiny, total, 1.0)
+        centroid = np.where(total > np.finfo(np.float32).tiny, mag @ self.freqs / safe, 0.0)
+
+        mel_db = 10.0 * np.log10(np.maximum(AMIN, power @ self.mel.T))
+        mel_db = np.maximum(mel_db, mel_db.max() - TOP_DB)
+        mfcc = mel_db @ self.dct.T
+
+        return np.hstack([rms, self.zcr(y), float(np.mean(centroid)), mfcc.mean(axis=0)])
+
+
+@lru_cache(maxsize=8)
+def get_engine(sr=16000):
+    return FeatureEngine(sr)
+
+
+def extract_features(y, sr=16000, rms_mode="frames"):
+    """16-dim feature vector (see FEATURE_NAMES) for signal `y` sampled at `sr`."""
+    return get_engine(sr).features(y, rms_mode=rms_mode)
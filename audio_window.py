@@ -0,0 +1,212 @@
+"""Per-device reassembly of iot/audio/chunk messages into classification windows.
+
+The ESP32 publishes a few dozen int16 samples with an increasing `seq` every
+~30 ms. Running the full pipeline on each of those is wasteful and classifies
+almost no audio, so chunks are first put back in order per device:
+
+- chunks arriving early are held until the missing ones show up;
+- chunks already consumed (duplicates / redeliveries) are dropped;
+- if a hole doesn't fill within `reorder_depth` chunks or `gap_timeout`
+  seconds it is declared lost and skipped;
+- a reboot restarts `seq` at 0. A backwards `seq` is taken as one (and the
+  buffer cleared) when it is 0, when it jumps back by more than
+  SEQ_RESET_THRESHOLD, or when the device was silent for
+  AUDIO_RESET_IDLE_SECONDS first; other backwards chunks are duplicates;
+- each device's sample rate / channel count comes with its chunks (binary
+  payloads carry them; others use the aggregator's defaults). Windows are
+  cut in seconds of that format and carry it, and a chunk in a different
+  format starts a fresh buffer rather than being mixed into the old one.
+
+Contiguous audio is cut into windows of `window_seconds`; consecutive windows
+start `hop_seconds` apart (hop < window gives overlap). The default, 3 s with
+no overlap, is ~100 chunks per classification (two orders of magnitude fewer
+pipeline runs than one per chunk) while every sample is still classified
+once; the cost is that a label arrives up to 3 s after the audio. A shorter
+hop gets labels sooner for proportionally more classifications (1 s hop on
+a 3 s window: ~33x fewer).
+
+Environment variables:
+  AUDIO_WINDOW_SECONDS      window length (default 3.0)
+  AUDIO_WINDOW_HOP_SECONDS  hop between windows (default = window, no overlap)
+  AUDIO_REORDER_DEPTH       max chunks held while waiting for a gap (default 16)
+  AUDIO_GAP_TIMEOUT         seconds before a gap is skipped (default 0.5)
+  AUDIO_RESET_IDLE_SECONDS  silence after which a backwards seq means a reboot (default 2)
+"""
+import os
+import time
+import array
+import logging
+import threading
+from collections import namedtuple
+
+
+logger = logging.getLogger("audio_window")
+
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "3.0"))
+AUDIO_WINDOW_HOP_SECONDS = float(os.getenv("AUDIO_WINDOW_HOP_SECONDS", "0") or 0) or None
+AUDIO_REORDER_DEPTH = int(os.getenv("AUDIO_REORDER_DEPTH", "16"))
+AUDIO_GAP_TIMEOUT = float(os.getenv("AUDIO_GAP_TIMEOUT", "0.5"))
+AUDIO_RESET_IDLE_SECONDS = float(os.getenv("AUDIO_RESET_IDLE_SECONDS", "2"))
+
+# seq jumping back by more than this is a device restart, not a late chunk
+SEQ_RESET_THRESHOLD = 1000
+
+AudioWindow = namedtuple("AudioWindow", ["device_id", "first_seq", "last_seq", "samples", "sample_rate", "channels"])
+
+
+class _DeviceState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.format = None
+        self.last_seen = None
+        self.next_seq = None
+        self.pending = {}
+        self.gap_since = None
+        self.samples = array.array("h")
+        # seq of the chunk each buffered sample run started with, for window metadata
+        self.seq_marks = []
+        self.stats = {"chunks": 0, "duplicates": 0, "reordered": 0, "lost": 0, "windows": 0, "resets": 0,
+                      "format_changes": 0}
+
+
+class AudioWindowAggregator:
+    """Reorders chunks per device and yields `AudioWindow`s when enough audio is buffered."""
+
+    def __init__(self, sample_rate, channels=1, window_seconds=AUDIO_WINDOW_SECONDS,
+                 hop_seconds=AUDIO_WINDOW_HOP_SECONDS, reorder_depth=AUDIO_REORDER_DEPTH,
+                 gap_timeout=AUDIO_GAP_TIMEOUT, reset_idle_seconds=AUDIO_RESET_IDLE_SECONDS):
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+        self.window_seconds = float(window_seconds)
+        self.hop_seconds = hop_seconds if hop_seconds else window_seconds
+        self._lengths = {}
+        self.window_len, self.hop_len = self.lengths(self.sample_rate, self.channels)
+        self.reorder_depth = max(1, int(reorder_depth))
+        self.gap_timeout = float(gap_timeout)
+        self.reset_idle_seconds = float(reset_idle_seconds)
+        self._devices = {}
+        self._devices_lock = threading.Lock()
+
+    def lengths(self, sample_rate, channels):
+        """(window, hop) in int16 values for a format."""
+        key = (sample_rate, channels)
+        if key not in self._lengths:
+            per_second = sample_rate * channels
+            window_len = max(channels, int(self.window_seconds * per_second) // channels * channels)
+            # keep hops aligned to whole frames so channels don't swap
+            hop_len = max(channels, int(self.hop_seconds * per_second) // channels * channels)
+            self._lengths[key] = (window_len, min(hop_len, window_len))
+        return self._lengths[key]
+
+    def _state(self, device_id):
+        state = self._devices.get(device_id)
+        if state is None:
+            with self._devices_lock:
+                state = self._devices.setdefault(device_id, _DeviceState())
+        return state
+
+    def add(self, device_id, seq, samples, now=None, sample_rate=None, channels=None):
+        """Feed one chunk; returns the (possibly empty) list of windows now complete.
+
+        `sample_rate` / `channels` describe the chunk (None: the aggregator's defaults).
+        """
+        now = time.monotonic() if now is None else now
+        fmt = (int(sample_rate or self.sample_rate), int(channels or self.channels))
+        state = self._state(device_id)
+        with state.lock:
+            state.stats["chunks"] += 1
+            if state.format != fmt:
+                if state.format is not None:
+                    logger.info("Device %s audio format changed %s -> %s; clearing buffer",
+                                device_id, state.format, fmt)
+                    state.stats["format_changes"] += 1
+                    self._reset(state, state.next_seq)
+                state.format = fmt
+            if seq is None:
+                # legacy payloads without seq: trust arrival order
+                seq = state.next_seq if state.next_seq is not None else 0
+            seq = int(seq)
+
+            idle = state.last_seen is not None and now - state.last_seen >= self.reset_idle_seconds
+            state.last_seen = now
+            if state.next_seq is None:
+                state.next_seq = seq
+            elif seq < state.next_seq:
+                # seq 0 right after start-up is more likely a redelivery than a reboot
+                if (state.next_seq - seq > SEQ_RESET_THRESHOLD or idle
+                        or (seq == 0 and state.next_seq > self.reorder_depth)):
+                    logger.info("Device %s seq reset (%d -> %d); clearing buffer", device_id, state.next_seq, seq)
+                    self._reset(state, seq)
+                else:
+                    state.stats["duplicates"] += 1
+                    return []
+            if seq in state.pending:
+                state.stats["duplicates"] += 1
+                return []
+
+            if seq == state.next_seq:
+                self._append(state, seq, samples)
+                state.next_seq += 1
+            else:
+                state.pending[seq] = samples
+                state.stats["reordered"] += 1
+                if state.gap_since is None:
+                    state.gap_since = now
+
+            self._drain(state)
+            if state.pending and (len(state.pending) >= self.reorder_depth
+                                  or now - state.gap_since >= self.gap_timeout):
+                # give up on the hole: skip to the oldest chunk we do have
+                resume = min(state.pending)
+                state.stats["lost"] += resume - state.next_seq
+                logger.debug("Device %s lost seq %d..%d", device_id, state.next_seq, resume - 1)
+                state.next_seq = resume
+                self._drain(state)
+                state.gap_since = now
+            if not state.pending:
+                state.gap_since = None
+
+            return self._cut_windows(device_id, state)
+
+    def stats(self, device_id=None):
+        if device_id is not None:
+            state = self._devices.get(device_id)
+            return dict(state.stats) if state else {}
+        return {dev: dict(s.stats) for dev, s in self._devices.items()}
+
+    def _reset(self, state, seq):
+        state.stats["resets"] += 1
+        state.next_seq = seq
+        state.pending.clear()
+        state.gap_since = None
+        state.samples = array.array("h")
+        state.seq_marks = []
+
+    def _append(self, state, seq, samples):
+        state.seq_marks.append((len(state.samples), seq))
+        if isinstance(samples, list):
+            state.samples.extend(samples)
+        else:
+            # int16 buffers (binary payloads decode to an np.frombuffer view): one memcpy
+            state.samples.frombytes(memoryview(samples).cast("B"))
+
+    def _drain(self, state):
+        while state.next_seq in state.pending:
+            self._append(state, state.next_seq, state.pending.pop(state.next_seq))
+            state.next_seq += 1
+
+    def _cut_windows(self, device_id, state):
+        windows = []
+        window_len, hop_len = self.lengths(*state.format)
+        while len(state.samples) >= window_len:
+            chunk = state.samples[:window_len]
+            marks = [s for off, s in state.seq_marks if off < window_len]
+            windows.append(AudioWindow(device_id, marks[0] if marks else None,
+                                       marks[-1] if marks else None, chunk, *state.format))
+            del state.samples[:hop_len]
+            state.seq_marks = [(off - hop_len, s) for off, s in state.seq_marks]
+            # keep the mark of the chunk straddling the new start
+            head = [m for m in state.seq_marks if m[0] <= 0]
+            state.seq_marks = ([(0, head[-1][1])] if head else []) + [m for m in state.seq_marks if m[0] > 0]
+            state.stats["windows"] += 1
+        return windows
@@ -0,0 +1,239 @@
+"""Push predictions and alerts to WebSocket and SSE viewers as they happen.
+
+`/ws` used to run a loop per socket that re-sent the device's latest
+prediction every second, changed or not: one JSON encode and one send per
+viewer per second, and up to a second of delay before a new prediction was
+seen. `BroadcastHub` inverts that:
+
+- `publish` is called once per prediction / alert by the upload handler and
+  hands the message to every matching subscriber straight away;
+- subscribers pick channels: "all", "alerts", "device:<id>" or
+  "class:<label>" (`channels_for` builds them from query parameters); a
+  message matching several of a subscriber's channels is delivered once;
+- a message is encoded at most once per transport (`Message.text` for
+  WebSocket, `Message.sse` for Server-Sent Events), however many viewers
+  receive it;
+- each subscriber has a small bounded queue; a viewer that can't keep up
+  loses its oldest messages (counted in `dropped`) instead of holding
+  memory or delaying anyone else;
+- new subscribers first get the latest prediction of the devices they
+  follow, so a dashboard doesn't start empty.
+
+The hub lives on the server's event loop: call `publish` and `subscribe`
+from coroutines / async handlers, not from other threads.
+
+Environment variables:
+  HUB_QUEUE_SIZE          messages buffered per subscriber before the oldest are dropped (default 32)
+  HUB_SEND_TIMEOUT        seconds a single send may take before the viewer is disconnected (default 10)
+  HUB_KEEPALIVE_SECONDS   SSE comment / idle interval keeping proxies from closing streams (default 15)
+"""
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+
+
+logger = logging.getLogger("broadcast_hub")
+
+HUB_QUEUE_SIZE = int(os.getenv("HUB_QUEUE_SIZE", "32"))
+HUB_SEND_TIMEOUT = float(os.getenv("HUB_SEND_TIMEOUT", "10"))
+HUB_KEEPALIVE_SECONDS = float(os.getenv("HUB_KEEPALIVE_SECONDS", "15"))
+
+ALL = "all"
+ALERTS = "alerts"
+
+
+def channels_for(device_id=None, label=None, alerts=False):
+    """Channels for a viewer's filters; no filter at all means every device."""
+    channels = []
+    if device_id:
+        channels += [f"device:{d}" for d in str(device_id).split(",") if d]
+    if label:
+        channels += [f"class:{c}" for c in str(label).split(",") if c]
+    if alerts:
+        channels.append(ALERTS)
+    return channels or [ALL]
+
+
+class Message:
+    """One published event; its wire forms are built on first use and shared by every subscriber."""
+
+    __slots__ = ("kind", "payload", "_text", "_sse")
+
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload
+        self._text = None
+        self._sse = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = json.dumps(self.payload, default=str)
+        return self._text
+
+    @property
+    def sse(self):
+        if self._sse is None:
+            self._sse = f"event: {self.kind}\ndata: {self.text}\n\n".encode()
+        return self._sse
+
+
+class Subscription:
+    """A viewer's bounded queue of messages from its channels."""
+
+    def __init__(self, hub, channels, queue_size):
+        self.hub = hub
+        self.channels = tuple(channels)
+        self._queue = deque(maxlen=max(1, int(queue_size)))
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    def _put(self, message):
+        if len(self._queue) == self._queue.maxlen:
+            # slow viewer: the oldest (most stale) message goes
+            self.dropped += 1
+            self.hub.stats["dropped"] += 1
+        self._queue.append(message)
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Next message, or None after `timeout` seconds without one (or once closed)."""
+        while not self._queue:
+            if self.closed:
+                return None
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.delivered += 1
+        return self._queue.popleft()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+            self._ready.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BroadcastHub:
+    """Channel registry plus last-value cache; see the module docstring."""
+
+    def __init__(self, queue_size=HUB_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._latest = {}  # device id -> its latest prediction Message
+        self.stats = {"published": 0, "deliveries": 0, "dropped": 0, "subscribed": 0, "unsubscribed": 0}
+
+    def subscribe(self, channels, prime=True, queue_size=None):
+        sub = Subscription(self, channels or [ALL], queue_size or self.queue_size)
+        for channel in sub.channels:
+            self._channels.setdefault(channel, set()).add(sub)
+        self.stats["subscribed"] += 1
+        if prime:
+            if ALL in sub.channels:
+                latest = list(self._latest.values())
+            else:
+                latest = [self._latest[c[7:]] for c in sub.channels
+                          if c.startswith("device:") and c[7:] in self._latest]
+            for message in latest:
+                sub._put(message)
+        return sub
+
+    def unsubscribe(self, sub):
+        for channel in sub.channels:
+            subs = self._channels.get(channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[channel]
+        self.stats["unsubscribed"] += 1
+
+    def publish(self, kind, payload, device_id=None, label=None):
+        """Queue `payload` (a JSON-able dict; "type" is set to `kind`) for every matching subscriber.
+
+        Returns the number of subscribers it was queued for.
+        """
+        message = Message(kind, dict(payload, type=kind))
+        if kind == "prediction" and device_id is not None:
+            self._latest[device_id] = message
+        self.stats["published"] += 1
+        channels = [ALL]
+        if device_id is not None:
+            channels.append(f"device:{device_id}")
+        if label:
+            channels.append(f"class:{label}")
+        if kind == "alert":
+            channels.append(ALERTS)
+        targets = set()
+        for channel in channels:
+            subs = self._channels.get(channel)
+            if subs:
+                targets.update(subs)
+        for sub in targets:
+            sub._put(message)
+        self.stats["deliveries"] += len(targets)
+        return len(targets)
+
+    def latest(self, device_id):
+        message = self._latest.get(device_id)
+        return message.payload if message is not None else None
+
+    def status(self):
+        return dict(self.stats, subscribers=len({s for subs in self._channels.values() for s in subs}),
+                    channels=len(self._channels))
+
+    # ---------------------------------------------------------------- transports
+
+    async def stream_websocket(self, websocket, sub, send_timeout=HUB_SEND_TIMEOUT):
+        """Send `sub`'s messages on an accepted WebSocket until either side goes away."""
+
+        async def sender():
+            while True:
+                message = await sub.get()
+                if message is None:
+                    return
+                await asyncio.wait_for(websocket.send_text(message.text), send_timeout)
+
+        async def receiver():
+            # nothing is expected from the viewer; reading is how a disconnect is noticed
+            while True:
+                event = await websocket.receive()
+                if event["type"] == "websocket.disconnect":
+                    return
+
+        tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            sub.close()
+
+    async def stream_sse(self, channels, keepalive=HUB_KEEPALIVE_SECONDS):
+        """Body iterator for a text/event-stream response.
+
+        Subscribes on its first step, not when created, so a client that leaves
+        before the body starts never leaves a subscription behind; closing the
+        iterator unsubscribes.
+        """
+        with self.subscribe(channels) as sub:
+            yield b"retry: 3000\n\n"
+            while True:
+                message = await sub.get(timeout=keepalive)
+                if sub.closed:
+                    return
+                yield message.sse if message is not None else b": keepalive\n\n"
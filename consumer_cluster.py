@@ -0,0 +1,166 @@
+"""Run the MQTT consumer as several processes that split the devices between them.
+
+A single consumer process caps the room at one core's worth of inference. In
+a cluster each device is owned by exactly one worker process, so its audio
+window buffer, frame cache and integrity state stay in one place:
+
+- devices may publish to per-device topics (`esp32cam/frame/<device_id>`,
+  `iot/audio/chunk/<device_id>`); workers subscribe to the flat topics and
+  the `+` wildcard under them, so old and new firmware can share a room;
+- CONSUMER_CLUSTER_MODE=hash: every worker subscribes to everything and keeps
+  only the devices with crc32(device_id) % CONSUMER_WORKERS == its index.
+  Assignment is deterministic and sticky and needs no broker support; the
+  price is that each worker receives (and cheaply drops) all messages. For
+  per-device topics the check runs on the topic alone, before any parsing;
+- CONSUMER_CLUSTER_MODE=shared: workers join an MQTT v5 shared subscription
+  `$share/<CONSUMER_SHARE_GROUP>/...` and the broker hands each message to one
+  of them. This only keeps device affinity when the broker balances by topic
+  (e.g. EMQX `shared_subscription_strategy = hash_topic`), combined with
+  per-device topics; round-robin brokers spread a device across workers;
+- CONSUMER_CLUSTER_MODE=off (default): one process, as before.
+
+Launch N workers with this module as a small supervisor (restarts workers
+that exit):
+
+    python consumer_cluster.py --workers 4 --mode hash
+
+Environment variables (set per worker by the supervisor):
+  CONSUMER_CLUSTER_MODE   off, hash or shared
+  CONSUMER_WORKERS        number of worker processes
+  CONSUMER_WORKER_INDEX   this worker's index, 0..CONSUMER_WORKERS-1
+  CONSUMER_SHARE_GROUP    shared-subscription group name (default argus-consumers)
+"""
+import os
+import sys
+import time
+import zlib
+import signal
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+
+
+logger = logging.getLogger("consumer_cluster")
+
+CONSUMER_CLUSTER_MODE = os.getenv("CONSUMER_CLUSTER_MODE", "off").lower()
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "1"))
+CONSUMER_WORKER_INDEX = int(os.getenv("CONSUMER_WORKER_INDEX", "0"))
+CONSUMER_SHARE_GROUP = os.getenv("CONSUMER_SHARE_GROUP", "argus-consumers")
+
+CLUSTER_MODES = ("off", "hash", "shared")
+
+
+def shard_of(device_id, workers):
+    """Worker index owning `device_id`. Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(str(device_id).encode("utf-8")) % max(1, int(workers))
+
+
+def device_from_topic(topic, base):
+    """`<base>/<device_id>` -> device_id; the flat `<base>` (or anything else) -> None."""
+    prefix = base.rstrip("/") + "/"
+    if topic.startswith(prefix):
+        rest = topic[len(prefix):]
+        if rest and "/" not in rest:
+            return rest
+    return None
+
+
+def topic_matches(topic, base):
+    return topic == base or device_from_topic(topic, base) is not None
+
+
+class ClusterMembership:
+    """What this worker subscribes to and which devices it keeps."""
+
+    def __init__(self, mode=CONSUMER_CLUSTER_MODE, workers=CONSUMER_WORKERS, index=CONSUMER_WORKER_INDEX,
+                 group=CONSUMER_SHARE_GROUP):
+        if mode not in CLUSTER_MODES:
+            raise ValueError(f"CONSUMER_CLUSTER_MODE must be one of {CLUSTER_MODES}, got {mode!r}")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.index = int(index)
+        if not 0 <= self.index < self.workers:
+            raise ValueError(f"CONSUMER_WORKER_INDEX {self.index} out of range for {self.workers} workers")
+        self.group = group
+        self.stats = {"owned": 0, "skipped": 0}
+
+    @property
+    def needs_mqtt5(self):
+        return self.mode == "shared"
+
+    def subscriptions(self, topics):
+        """Topic filters for the given base topics: the flat topic and its per-device wildcard."""
+        filters = []
+        for base in topics:
+            base = base.rstrip("/")
+            for f in (base, f"{base}/+"):
+                filters.append(f"$share/{self.group}/{f}" if self.mode == "shared" else f)
+        return filters
+
+    def owns(self, device_id):
+        """True if this worker should process `device_id` (always true outside hash mode)."""
+        if self.mode != "hash" or self.workers == 1 or device_id is None:
+            return True
+        mine = shard_of(device_id, self.workers) == self.index
+        self.stats["owned" if mine else "skipped"] += 1
+        return mine
+
+    def describe(self):
+        if self.mode == "off":
+            return "single consumer"
+        return f"{self.mode} cluster, worker {self.index + 1}/{self.workers}"
+
+
+# ---------------------------------------------------------------- supervisor
+
+def _spawn(index, workers, mode, group, script):
+    env = dict(os.environ, CONSUMER_CLUSTER_MODE=mode, CONSUMER_WORKERS=str(workers),
+               CONSUMER_WORKER_INDEX=str(index), CONSUMER_SHARE_GROUP=group)
+    logger.info("Starting consumer worker %d/%d (%s)", index + 1, workers, mode)
+    return subprocess.Popen([sys.executable, str(script)], env=env)
+
+
+def run_cluster(workers, mode="hash", group=CONSUMER_SHARE_GROUP, script=None, restart_delay=2.0):
+    """Start `workers` consumer processes and keep them running until SIGINT/SIGTERM."""
+    script = script or Path(__file__).resolve().parent / "ai_mqtt_consumer.py"
+    procs = {i: _spawn(i, workers, mode, group, script) for i in range(workers)}
+    stopping = []
+
+    def _stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while not stopping:
+            for i, proc in list(procs.items()):
+                code = proc.poll()
+                if code is not None:
+                    logger.warning("Worker %d exited with %s; restarting in %.0fs", i, code, restart_delay)
+                    time.sleep(restart_delay)
+                    procs[i] = _spawn(i, workers, mode, group, script)
+            time.sleep(0.5)
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        logger.info("All consumer workers stopped")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run several ai_mqtt_consumer workers that split devices")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--mode", choices=("hash", "shared"), default="hash")
+    parser.add_argument("--group", default=CONSUMER_SHARE_GROUP, help="shared-subscription group name")
+    args = parser.parse_args()
+    run_cluster(args.workers, args.mode, args.group)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Sampled debug-audio archive with rolling segment files and retention.
+
+`/upload` used to write every clip to `./debug_audio/{device}_{ts}.wav`
+inside the request: a file create + write on the latency path for each
+upload, and a directory that only ever grew. `DebugArchive` keeps the clips
+that are worth looking at and writes them off the event loop:
+
+- `offer` decides after the prediction whether a clip is kept: every alert,
+  every processing error, every clip below the confidence threshold, plus a
+  random `sample_rate` fraction of the rest. Kept clips are only queued;
+- a writer thread appends them to the device's current segment file
+  (`<dir>/<device>/<device>_<YYYYmmdd-HHMMSS>.clips`), rolling to a new
+  segment when it reaches `segment_bytes` or `segment_seconds`;
+- a janitor thread deletes closed segments older than `max_age_seconds`,
+  then the oldest ones until the archive fits in `max_bytes`.
+
+A segment is a sequence of records, each one JSON header line (device,
+time, label, confidence, why it was kept, size) followed by the raw upload
+bytes. `iter_clips` reads them back; `python debug_archive.py extract
+<segment> <dir>` writes each clip out as a WAV.
+
+Environment variables:
+  DEBUG_AUDIO_DIR               archive root (default ./debug_audio)
+  DEBUG_AUDIO_SAMPLE_RATE       fraction of ordinary uploads kept (default 0.01)
+  DEBUG_AUDIO_LOW_CONFIDENCE    keep every clip below this confidence (default 0.6, 0 disables)
+  DEBUG_AUDIO_KEEP_ALERTS       keep every clip that raised an alert or error (default 1)
+  DEBUG_AUDIO_SEGMENT_MB        roll a device's segment at this size (default 16)
+  DEBUG_AUDIO_SEGMENT_SECONDS   ... or after this long (default 600)
+  DEBUG_AUDIO_MAX_MB            total archive size kept by the janitor (default 1024)
+  DEBUG_AUDIO_MAX_AGE_HOURS     segments older than this are deleted (default 72)
+  DEBUG_AUDIO_JANITOR_SECONDS   janitor interval (default 60)
+  DEBUG_AUDIO_QUEUE_SIZE        clips waiting for the writer before dropping (default 256)
+"""
+import os
+import re
+import sys
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from datetime import datetime
+
+
+logger = logging.getLogger("debug_archive")
+
+DEBUG_AUDIO_DIR = os.getenv("DEBUG_AUDIO_DIR", "./debug_audio")
+DEBUG_AUDIO_SAMPLE_RATE = float(os.getenv("DEBUG_AUDIO_SAMPLE_RATE", "0.01"))
+DEBUG_AUDIO_LOW_CONFIDENCE = float(os.getenv("DEBUG_AUDIO_LOW_CONFIDENCE", "0.6"))
+DEBUG_AUDIO_KEEP_ALERTS = os.getenv("DEBUG_AUDIO_KEEP_ALERTS", "1") != "0"
+DEBUG_AUDIO_SEGMENT_MB = float(os.getenv("DEBUG_AUDIO_SEGMENT_MB", "16"))
+DEBUG_AUDIO_SEGMENT_SECONDS = float(os.getenv("DEBUG_AUDIO_SEGMENT_SECONDS", "600"))
+DEBUG_AUDIO_MAX_MB = float(os.getenv("DEBUG_AUDIO_MAX_MB", "1024"))
+DEBUG_AUDIO_MAX_AGE_HOURS = float(os.getenv("DEBUG_AUDIO_MAX_AGE_HOURS", "72"))
+DEBUG_AUDIO_JANITOR_SECONDS = float(os.getenv("DEBUG_AUDIO_JANITOR_SECONDS", "60"))
+DEBUG_AUDIO_QUEUE_SIZE = int(os.getenv("DEBUG_AUDIO_QUEUE_SIZE", "256"))
+
+SEGMENT_SUFFIX = ".clips"
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def safe_name(device_id):
+    """Device id usable as a directory / file name (ids come from request headers)."""
+    return _UNSAFE.sub("_", str(device_id or "unknown")).strip(".")[:64] or "unknown"
+
+
+def iter_clips(path):
+    """Yield (header, data) for every complete record of a segment file."""
+    with open(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            try:
+                header = json.loads(line)
+            except ValueError:
+                logger.warning("Corrupt record header in %s; stopping", path)
+                return
+            data = f.read(header["size"])
+            if len(data) < header["size"]:
+                return  # the tail of a segment still being written, or cut off by a crash
+            yield header, data
+
+
+class _Open:
+    def __init__(self, path, f):
+        self.path = path
+        self.f = f
+        self.size = 0
+        self.opened = time.monotonic()
+
+
+class DebugArchive:
+    """Decides which uploads to keep and writes them to rolling per-device segments."""
+
+    def __init__(self, root=DEBUG_AUDIO_DIR, sample_rate=DEBUG_AUDIO_SAMPLE_RATE,
+                 low_confidence=DEBUG_AUDIO_LOW_CONFIDENCE, keep_alerts=DEBUG_AUDIO_KEEP_ALERTS,
+                 segment_bytes=DEBUG_AUDIO_SEGMENT_MB * 1024 * 1024, segment_seconds=DEBUG_AUDIO_SEGMENT_SECONDS,
+                 max_bytes=DEBUG_AUDIO_MAX_MB * 1024 * 1024, max_age_seconds=DEBUG_AUDIO_MAX_AGE_HOURS * 3600,
+                 janitor_seconds=DEBUG_AUDIO_JANITOR_SECONDS, queue_size=DEBUG_AUDIO_QUEUE_SIZE, seed=None):
+        self.root = root
+        self.sample_rate = float(sample_rate)
+        self.low_confidence = float(low_confidence)
+        self.keep_alerts = bool(keep_alerts)
+        self.segment_bytes = max(1, int(segment_bytes))
+        self.segment_seconds = float(segment_seconds)
+        self.max_bytes = int(max_bytes)
+        self.max_age_seconds = float(max_age_seconds)
+        self.janitor_seconds = float(janitor_seconds)
+        self._rng = random.Random(seed)
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._open = {}
+        # paths the writer still appends to; the janitor never deletes those
+        self._open_paths = set()
+        self._open_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._writer = None
+        self._janitor = None
+        self.stats = {"offered": 0, "kept": 0, "dropped": 0, "written_bytes": 0, "segments": 0,
+                      "deleted_segments": 0, "deleted_bytes": 0,
+                      "reasons": {"alert": 0, "error": 0, "low_confidence": 0, "sampled": 0}}
+
+    # ---------------------------------------------------------------- api
+
+    def start(self):
+        if self._writer is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._stopping.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="debug-archive", daemon=True)
+            self._writer.start()
+            self._janitor = threading.Thread(target=self._janitor_loop, name="debug-archive-janitor", daemon=True)
+            self._janitor.start()
+        return self
+
+    def reason(self, confidence=None, alert=False, error=False):
+        """Why a clip should be kept ("alert", "error", "low_confidence", "sampled"), or None."""
+        if error and self.keep_alerts:
+            return "error"
+        if alert and self.keep_alerts:
+            return "alert"
+        if confidence is not None and confidence < self.low_confidence:
+            return "low_confidence"
+        if self.sample_rate > 0 and self._rng.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def offer(self, device_id, data, label=None, confidence=None, alert=False, error=False, timestamp=None):
+        """Queue the clip if the sampling policy keeps it. Never blocks; returns the reason or None."""
+        self.stats["offered"] += 1
+        why = self.reason(confidence, alert, error)
+        if why is None or not data:
+            return None
+        if self._writer is None:
+            self.start()
+        header = {"device_id": device_id, "timestamp": timestamp or time.time(), "label": label,
+                  "confidence": None if confidence is None else round(float(confidence), 4),
+                  "reason": why, "size": len(data)}
+        try:
+            self._queue.put_nowait((safe_name(device_id), header, bytes(data)))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return None
+        self.stats["kept"] += 1
+        self.stats["reasons"][why] += 1
+        return why
+
+    def flush(self, timeout=10.0):
+        """Wait until every queued clip is written (and flushed to its segment file)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self._queue.unfinished_tasks == 0
+
+    def stop(self, timeout=10.0):
+        """Write what is queued, close every segment and stop both threads."""
+        if self._writer is None:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._writer.join(timeout=timeout)
+        self._janitor.join(timeout=timeout)
+        self._writer = self._janitor = None
+        for name in list(self._open):
+            self._close(name)
+        logger.info("Debug audio archive stats: %s", self.status())
+
+    def status(self):
+        return dict(self.stats, reasons=dict(self.stats["reasons"]), queued=self._queue.qsize(),
+                    open_segments=len(self._open), sample_rate=self.sample_rate,
+                    low_confidence=self.low_confidence)
+
+    # ---------------------------------------------------------------- writer
+
+    def _write_loop(self):
+        while not self._stopping.is_set():
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._roll_expired()
+                continue
+            try:
+                self._append(*item)
+                if self._queue.empty():
+                    # make what was written readable (iter_clips) without closing the segment
+                    for seg in self._open.values():
+                        seg.f.flush()
+            except Exception as e:
+                logger.exception("Debug audio write failed for %s: %s", item[0], e)
+            finally:
+                self._queue.task_done()
+
+    def _append(self, name, header, data):
+        seg = self._open.get(name)
+        if seg is not None and (seg.size >= self.segment_bytes
+                                or time.monotonic() - seg.opened >= self.segment_seconds):
+            self._close(name)
+            seg = None
+        if seg is None:
+            seg = self._segment(name, header["timestamp"])
+        record = json.dumps(header, separators=(",", ":")).encode() + b"\n"
+        seg.f.write(record)
+        seg.f.write(data)
+        seg.size += len(record) + len(data)
+        self.stats["written_bytes"] += len(record) + len(data)
+
+    def _segment(self, name, timestamp):
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.fromtimestamp(timestamp).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, f"{name}_{stamp}{SEGMENT_SUFFIX}")
+        n = 1
+        while os.path.exists(path):
+            # rolled twice in the same second: keep segments distinct
+            path = os.path.join(directory, f"{name}_{stamp}-{n}{SEGMENT_SUFFIX}")
+            n += 1
+        seg = _Open(path, open(path, "ab"))
+        with self._open_lock:
+            self._open[name] = seg
+            self._open_paths.add(path)
+        self.stats["segments"] += 1
+        return seg
+
+    def _close(self, name):
+        with self._open_lock:
+            seg = self._open.pop(name, None)
+            if seg is not None:
+                self._open_paths.discard(seg.path)
+        if seg is not None:
+            seg.f.close()
+
+    def _roll_expired(self):
+        # devices that stopped sending: close their segment so the janitor may delete it later
+        now = time.monotonic()
+        for name, seg in list(self._open.items()):
+            if now - seg.opened >= self.segment_seconds:
+                self._close(name)
+
+    # ---------------------------------------------------------------- janitor
+
+    def _janitor_loop(self):
+        while not self._stopping.wait(self.janitor_seconds):
+            try:
+                self.clean()
+            except Exception as e:
+                logger.exception("Debug audio janitor failed: %s", e)
+
+    def clean(self, now=None):
+        """Apply the age and size limits once. Returns (segments deleted, bytes freed)."""
+        now = now or time.time()
+        with self._open_lock:
+            busy = set(self._open_paths)
+        closed, kept_bytes = [], 0
+        for directory, _, files in os.walk(self.root):
+            for fname in files:
+                if not fname.endswith(SEGMENT_SUFFIX):
+                    continue
+                path = os.path.join(directory, fname)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                kept_bytes += st.st_size
+                if path not in busy:
+                    closed.append((st.st_mtime, st.st_size, path))
+        closed.sort()
+        deleted = freed = 0
+        for mtime, size, path in closed:
+            if now - mtime < self.max_age_seconds and kept_bytes <= self.max_bytes:
+                break  # oldest first: everything after this is newer and fits
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete %s: %s", path, e)
+                continue
+            kept_bytes -= size
+            deleted += 1
+            freed += size
+        if deleted:
+            self.stats["deleted_segments"] += deleted
+            self.stats["deleted_bytes"] += freed
+            logger.info("Debug audio janitor removed %d segments (%.1f MB)", deleted, freed / 1e6)
+            for directory in {os.path.dirname(p) for _, _, p in closed}:
+                try:
+                    os.rmdir(directory)  # only succeeds once a device directory is empty
+                except OSError:
+                    pass
+        return deleted, freed
+
+
+def extract(segment, out_dir, pcm_rate=16000):
+    """Write every clip of `segment` to `out_dir` as a WAV (raw PCM uploads get a WAV header)."""
+    from audio_archive import pcm_to_wav_bytes
+    from audio_decode import sniff_format
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i, (header, data) in enumerate(iter_clips(segment)):
+        kind = sniff_format(data)
+        if kind == "raw":
+            data, kind = pcm_to_wav_bytes(data, pcm_rate), "wav"
+        stamp = datetime.fromtimestamp(header["timestamp"]).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(out_dir, f"{safe_name(header['device_id'])}_{stamp}_{i:04d}_{header['reason']}.{kind}")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "extract":
+        print("usage: python debug_archive.py extract <segment.clips> <out_dir>")
+        sys.exit(2)
+    for p in extract(sys.argv[2], sys.argv[3]):
+        print(p)
@@ -1,76 +1,67 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import librosa
-import numpy as np
-import joblib
-import time
-import torch
-import torch.nn.functional as F
-from torchvision import transforms, models
-from PIL import Image
-import io
+from contextlib import asynccontextmanager
+
+# torch/torchvision and the joblib models load in the lifespan hook, not at import
+from model_loader import startup
+from model_registry import build_registry
+from inference_executor import build_executors, predict_speech, predict_vision, Saturated, saturated_response
 
 # =====================================================================
-# 🔧 CONFIG & SETUP
+# 🧠 AI MODELS (loaded and warmed up at startup, retrained artifacts swapped in
+# while running, see model_registry.py)
 # =====================================================================
-app = FastAPI()
+model_registry = build_registry()
+speech_models = model_registry["speech"]
+# eager .pth, TorchScript, int8 or ONNX, whichever VISION_RUNTIME picks (see vision_runtime.py);
+# concurrent /upload_frame requests share one stacked forward pass
+vision_models = model_registry["vision"]
+# decoding, features and forward passes run on bounded pools (INFERENCE_*_EXECUTOR), not on the event loop
+executors = build_executors(model_registry)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+latest_audio_pred = "none"
+latest_vision_pred = "none"
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-IMG_SIZE = 224
 
-# =====================================================================
-# 🎤 Load Speech Recognition Assets
-# =====================================================================
-speech_model = joblib.load("./Speech-Recognition/models_output/best_model.joblib")
-speech_scaler = joblib.load("./Speech-Recognition/models_output/scaler.joblib")
-speech_encoder = joblib.load("./Speech-Recognition/models_output/label_encoder.joblib")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load and warm up both models before serving, so the first requests aren't the slow ones
+    print("🔄 Loading AI models...")
+    speech = speech_models.load()
+    vision = vision_models.load()
+    if speech is None or vision is None:
+        raise RuntimeError("could not load the speech and vision models (see log)")
+    print(f"✅ Vision runtime: {vision.runtime}, versions: {model_registry.versions()}")
+    print(f"⏱️ Startup: {startup.report()}")
+    model_registry.start()
+    for executor in executors.values():
+        executor.start()
+    yield
+    for executor in executors.values():
+        executor.stop()
+    model_registry.stop()
 
-latest_audio_pred = "none"
 
 # =====================================================================
-# 👁️ Load Computer Vision Model (PyTorch)
+# 🔧 CONFIG & SETUP
 # =====================================================================
-print("🔄 Loading Vision AI Model...")
-
-vision_encoder = joblib.load("./Computer-Vision/vision_label_encoder.joblib")
-num_classes = len(vision_encoder.classes_)
-
-vision_model = models.resnet18(weights=None)
-vision_model.fc = torch.nn.Linear(vision_model.fc.in_features, num_classes)
-vision_model.load_state_dict(torch.load("./Computer-Vision/cheating_cnn_model.pth", map_location=DEVICE))
-vision_model.to(DEVICE)
-vision_model.eval()
-
-cv_transform = transforms.Compose([
-    transforms.Resize((IMG_SIZE, IMG_SIZE)),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225]
-    )
-])
+app = FastAPI(lifespan=lifespan)
 
-latest_vision_pred = "none"
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
-# =====================================================================
-# 🎤 SPEECH FEATURE EXTRACTOR
-# =====================================================================
-def extract_features(path):
-    y, sr = librosa.load(path, sr=16000)
-    rms = np.mean(librosa.feature.rms(y=y))
-    zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-    spec = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    mfcc_mean = np.mean(mfcc, axis=1)
-    return np.hstack([rms, zcr, spec, mfcc_mean])
+@app.exception_handler(Saturated)
+async def saturated_handler(request, exc):
+    # every inference worker is busy and the backlog is full: 503 + Retry-After
+    return saturated_response(exc)
 
 
 # =====================================================================
@@ -81,21 +72,19 @@ async def upload_audio(file: UploadFile):
     global latest_audio_pred
 
     contents = await file.read()
-    temp_path = "temp_audio.wav"
-    with open(temp_path, "wb") as f:
-        f.write(contents)
 
     try:
-        feats = extract_features(temp_path).reshape(1, -1)
-        feats_scaled = speech_scaler.transform(feats)
-        pred = speech_model.predict(feats_scaled)[0]
-        label = speech_encoder.inverse_transform([pred])[0]
+        # decoded in memory, rms/zcr/centroid/MFCC features and the SVM, on the speech pool
+        result = await executors["speech"].run(predict_speech, contents)
+        label = result["label"]
 
         latest_audio_pred = label
         print("🎤 Audio Prediction:", label)
 
-        return {"status": "ok", "prediction": label}
+        return {"status": "ok", "prediction": label, "model_version": result["model_version"]}
 
+    except Saturated:
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e)}
 
@@ -113,28 +102,24 @@ async def upload_frame(file: UploadFile = File(...)):
     global latest_vision_pred
 
     try:
-        # Read image into PIL
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-
-        # Transform
-        img_tensor = cv_transform(image).unsqueeze(0).to(DEVICE)
 
-        # Forward pass
-        with torch.no_grad():
-            outputs = vision_model(img_tensor)
-            probs = F.softmax(outputs, dim=1)
-            pred_class = torch.argmax(probs, dim=1).item()
-            pred_label = vision_encoder.inverse_transform([pred_class])[0]
+        # JPEG decode + resize + forward on the vision pool; frames from concurrent requests are
+        # still stacked into one forward pass by the batcher
+        result = await executors["vision"].run(predict_vision, contents)
+        pred_label = result["label"]
 
         latest_vision_pred = pred_label
         print("👁️ Vision Prediction:", pred_label)
 
         return {
             "status": "ok",
-            "vision_prediction": pred_label
+            "vision_prediction": pred_label,
+            "model_version": result["model_version"]
         }
 
+    except Saturated:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -144,6 +129,19 @@ def get_latest_vision():
     return {"label": latest_vision_pred, "timestamp": time.time()}
 
 
+# =====================================================================
+# 📦 MODEL STATUS
+# =====================================================================
+@app.get("/models/status")
+def get_models_status():
+    status = model_registry.status()
+    status["executors"] = {name: executor.status() for name, executor in executors.items()}
+    return status
+
+
+startup.add("import fastapi_server_final", time.perf_counter() - _import_started)
+
+
 # =====================================================================
 # SERVER RUN
 # =====================================================================
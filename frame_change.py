@@ -0,0 +1,161 @@
+"""Skip vision inference on frames that look like the last classified one.
+
+Students sit still for most of an exam, so consecutive ESP32-CAM frames are
+nearly identical and classifying each of them returns the same label.
+`FrameChangeDetector` keeps, per device, a tiny grayscale thumbnail of the
+last frame that actually went through the model:
+
+- the JPEG is decoded in draft mode at 1/8 scale in grayscale (a 1280x720
+  frame becomes 160x90, almost free) and shrunk to 32x24;
+- the thumbnail's mean is subtracted, so auto-exposure drifting the whole
+  image brighter or darker doesn't count as a change;
+- the distance is the mean absolute difference to the stored thumbnail, in
+  grey levels (0-255).
+
+Under FRAME_CHANGE_THRESHOLD the cached label is returned without running the
+model. A frame is re-classified anyway once the cached label is older than
+FRAME_MAX_STALENESS_SECONDS, so slow drifts are never missed for long.
+Comparing against the last *classified* frame rather than the previous one
+means small changes can't add up unnoticed.
+
+`stats()` reports the skip rate and an estimate of the CPU time saved (frames
+skipped x mean inference time, minus the time spent on thumbnails).
+
+Environment variables:
+  FRAME_CHANGE_THRESHOLD        mean grey-level difference that counts as a change (default 2, 0 disables)
+  FRAME_MAX_STALENESS_SECONDS   re-classify at least this often per device (default 10)
+  FRAME_CHANGE_LOG_SECONDS      log the stats at most this often (default 60, 0 disables)
+"""
+import io
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+logger = logging.getLogger("frame_change")
+
+FRAME_CHANGE_THRESHOLD = float(os.getenv("FRAME_CHANGE_THRESHOLD", "2"))
+FRAME_MAX_STALENESS_SECONDS = float(os.getenv("FRAME_MAX_STALENESS_SECONDS", "10"))
+FRAME_CHANGE_LOG_SECONDS = float(os.getenv("FRAME_CHANGE_LOG_SECONDS", "60"))
+
+THUMB_SIZE = (32, 24)
+
+
+def thumbnail(image_bytes, size=THUMB_SIZE):
+    """Zero-mean float32 grayscale thumbnail of an encoded frame."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("L", (size[0] * 2, size[1] * 2))
+    if img.mode != "L":
+        img = img.convert("L")
+    thumb = np.asarray(img.resize(size, Image.BILINEAR), dtype=np.float32)
+    return thumb - thumb.mean()
+
+
+def frame_distance(a, b):
+    """Mean absolute grey-level difference between two thumbnails."""
+    return float(np.abs(a - b).mean())
+
+
+class _Cached:
+    __slots__ = ("thumb", "label", "classified_at")
+
+    def __init__(self, thumb, label, classified_at):
+        self.thumb = thumb
+        self.label = label
+        self.classified_at = classified_at
+
+
+class FrameChangeDetector:
+    """Per-device cache of the last classified frame and its label."""
+
+    def __init__(self, threshold=FRAME_CHANGE_THRESHOLD, max_staleness=FRAME_MAX_STALENESS_SECONDS,
+                 log_seconds=FRAME_CHANGE_LOG_SECONDS):
+        self.threshold = float(threshold)
+        self.max_staleness = float(max_staleness)
+        self.log_seconds = float(log_seconds)
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._last_log = time.monotonic()
+        self._counts = {"frames": 0, "inferred": 0, "skipped": 0, "changed": 0, "stale": 0, "new": 0}
+        self._thumb_seconds = 0.0
+        self._infer_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def classify(self, device_id, image_bytes, classify_fn, now=None):
+        """Label for the frame, from the cache if it barely changed, else from `classify_fn(image_bytes)`.
+
+        Returns `(label, reused)`.
+        """
+        now = time.monotonic() if now is None else now
+        thumb = None
+        start = time.perf_counter()
+        if self.enabled:
+            try:
+                thumb = thumbnail(image_bytes)
+            except Exception as e:
+                # undecodable here: let the model path report it
+                logger.debug("Could not thumbnail frame from %s: %s", device_id, e)
+        thumb_time = time.perf_counter() - start
+
+        with self._lock:
+            self._counts["frames"] += 1
+            self._thumb_seconds += thumb_time
+            cached = self._devices.get(device_id)
+            if not self.enabled:
+                reason = "changed"
+            elif cached is None or thumb is None:
+                reason = "new"
+            elif now - cached.classified_at >= self.max_staleness:
+                reason = "stale"
+            elif frame_distance(thumb, cached.thumb) >= self.threshold:
+                reason = "changed"
+            else:
+                self._counts["skipped"] += 1
+                label = cached.label
+                reason = None
+        if reason is None:
+            self._maybe_log(now)
+            return label, True
+
+        start = time.perf_counter()
+        label = classify_fn(image_bytes)
+        infer_time = time.perf_counter() - start
+        with self._lock:
+            self._counts["inferred"] += 1
+            self._counts[reason] += 1
+            self._infer_seconds += infer_time
+            if thumb is not None:
+                self._devices[device_id] = _Cached(thumb, label, now)
+        self._maybe_log(now)
+        return label, False
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            thumb_seconds = self._thumb_seconds
+            infer_seconds = self._infer_seconds
+        frames, inferred = stats["frames"], stats["inferred"]
+        mean_infer = infer_seconds / inferred if inferred else 0.0
+        stats["skip_rate"] = round(stats["skipped"] / frames, 3) if frames else 0.0
+        stats["mean_inference_ms"] = round(mean_infer * 1000, 2)
+        stats["mean_thumbnail_ms"] = round(thumb_seconds / frames * 1000, 3) if frames else 0.0
+        stats["cpu_saved_seconds"] = round(stats["skipped"] * mean_infer - thumb_seconds, 2)
+        return stats
+
+    def _maybe_log(self, now):
+        if self.log_seconds <= 0 or now - self._last_log < self.log_seconds:
+            return
+        self._last_log = now
+        logger.info("Frame change stats: %s", self.stats())
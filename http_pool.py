@@ -0,0 +1,200 @@
+"""Shared keep-alive HTTP sessions for the consumer, camera readers and dashboards.
+
+Bare `requests.post(...)` / `requests.get(...)` calls open a new TCP (and TLS)
+connection every time. `get_session()` hands out one `requests.Session` per
+name whose adapter keeps a pool of connections per host, retries failed
+connects with jittered exponential backoff, and applies separate connect and
+read timeouts unless the caller passes its own. Pool usage is counted so the
+hit rate (requests served on an already-open connection) can be logged or
+exposed on a status endpoint.
+
+The "inference" session (the consumer's calls to the AI API) doesn't retry
+connects and uses a short connect timeout: when the API is down the caller
+falls back to in-process classification, and retrying first would cost
+every window several connect timeouts plus backoff.
+
+The "inference" and "default" (dashboard) sessions block at the per-host
+limit: at most HTTP_POOL_MAXSIZE connections to a host are open, and a
+request past that waits up to HTTP_POOL_WAIT seconds for one to come back
+(then fails with requests.ConnectionError) instead of opening an extra
+connection that is thrown away afterwards. The "camera" session doesn't
+block, since each MJPEG stream holds its connection for as long as it runs.
+
+Environment variables:
+  HTTP_POOL_CONNECTIONS   number of hosts to keep pools for (default 10)
+  HTTP_POOL_MAXSIZE       connections kept per host (default 10)
+  HTTP_POOL_WAIT          seconds a blocking session waits for a free connection (default 5)
+  HTTP_RETRIES            retries for connect errors / 502-504 (default 3)
+  HTTP_CONNECT_RETRIES    of those, retries for connect errors (default HTTP_RETRIES)
+  HTTP_BACKOFF            backoff factor in seconds (default 0.3)
+  HTTP_BACKOFF_JITTER     max random seconds added to each backoff (default 0.2)
+  HTTP_CONNECT_TIMEOUT    default connect timeout (default 3)
+  HTTP_READ_TIMEOUT       default read timeout (default 10)
+  HTTP_INFERENCE_CONNECT_RETRIES   connect retries of the "inference" session (default 0)
+  HTTP_INFERENCE_CONNECT_TIMEOUT   its connect timeout (default 1)
+"""
+import os
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger("http_pool")
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+HTTP_POOL_WAIT = float(os.getenv("HTTP_POOL_WAIT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", str(HTTP_RETRIES)))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.3"))
+HTTP_BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.2"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_INFERENCE_CONNECT_RETRIES = int(os.getenv("HTTP_INFERENCE_CONNECT_RETRIES", "0"))
+HTTP_INFERENCE_CONNECT_TIMEOUT = float(os.getenv("HTTP_INFERENCE_CONNECT_TIMEOUT", "1"))
+
+_counters_lock = threading.Lock()
+counters = {"requests": 0, "new_connections": 0}
+
+
+def _count(key):
+    with _counters_lock:
+        counters[key] += 1
+
+
+def _pool_wait(pool, timeout):
+    # requests never passes a pool timeout, and a blocking pool would then wait forever
+    if timeout is None and pool.block:
+        return HTTP_POOL_WAIT
+    return timeout
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        _count("requests")
+        return super()._get_conn(_pool_wait(self, timeout))
+
+    def _new_conn(self):
+        _count("new_connections")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        _count("requests")
+        return super()._get_conn(_pool_wait(self, timeout))
+
+    def _new_conn(self):
+        _count("new_connections")
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count connection checkouts and new connections."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        try:
+            return super().send(request, **kwargs)
+        except EmptyPoolError as e:
+            # every connection to the host is busy: surface it like any other failure to connect
+            raise requests.ConnectionError(e, request=request)
+
+
+class PooledSession(requests.Session):
+    """Session that fills in (connect, read) timeouts when the caller gives none."""
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT):
+        super().__init__()
+        self.default_timeout = (connect_timeout, read_timeout)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        return super().request(method, url, **kwargs)
+
+
+def _retry_policy(retries, connect_retries=None, backoff=HTTP_BACKOFF):
+    kwargs = dict(
+        total=retries,
+        connect=retries if connect_retries is None else min(retries, connect_retries),
+        # reads/status retries only apply to idempotent methods (urllib3 default),
+        # so a POST that reached the server is never replayed
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=HTTP_BACKOFF_JITTER, **kwargs)
+    except TypeError:
+        # urllib3 < 2 has no jitter support
+        return Retry(**kwargs)
+
+
+def make_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 retries=HTTP_RETRIES, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 connect_retries=HTTP_CONNECT_RETRIES, backoff=HTTP_BACKOFF, pool_block=False):
+    session = PooledSession(connect_timeout, read_timeout)
+    adapter = PooledAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                            max_retries=_retry_policy(retries, connect_retries, backoff), pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# per-name overrides of make_session's defaults
+SESSION_OPTIONS = {
+    "default": {"pool_block": True},
+    "inference": {"connect_retries": HTTP_INFERENCE_CONNECT_RETRIES,
+                  "connect_timeout": HTTP_INFERENCE_CONNECT_TIMEOUT, "pool_block": True},
+}
+
+
+def get_session(name="default"):
+    """Process-wide session for `name` ("default" for the dashboards, "inference" for the AI API,
+    "camera" for MJPEG streams)."""
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = make_session(**SESSION_OPTIONS.get(name, {}))
+    return session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def pool_stats():
+    """Requests served, connections opened, and the share of requests that reused a connection."""
+    with _counters_lock:
+        total = counters["requests"]
+        new = counters["new_connections"]
+    reused = max(0, total - new)
+    return {
+        "requests": total,
+        "new_connections": new,
+        "reused_connections": reused,
+        "hit_rate": round(reused / total, 3) if total else 0.0,
+    }
@@ -0,0 +1,225 @@
+"""Run feature extraction and model inference off the asyncio event loop.
+
+The FastAPI handlers are `async def` but decoded audio, computed the STFT/MFCC
+features, ran the SVM (or decoded and resized a JPEG for ResNet) inline, so
+one upload stalled every other request, `/ws` included. `InferenceExecutor`
+gives each workload a pool:
+
+- "thread": a ThreadPoolExecutor in the server process, sharing its model
+  registry. Right for work that releases the GIL: numpy FFTs, torch forward
+  passes, PIL decoding;
+- "process": a pool of spawned worker processes that each load their own
+  model registry at startup (so the first request doesn't pay for it, and
+  each worker hot-reloads retrained artifacts on its own). Right for work that
+  holds the GIL, e.g. scikit-learn's Python-level code around libsvm, at the
+  cost of one model copy per worker;
+- "inline": the old behaviour, for comparison.
+
+Admission is bounded: at most `max_pending` calls may be queued or running.
+Past that, `run` raises `Saturated` immediately instead of letting requests
+pile up behind a busy pool; `saturated_response` turns it into a 503 with a
+Retry-After estimated from the recent service time and the backlog.
+
+`predict_speech` / `predict_vision` are the tasks the servers submit. They
+use the registry bound with `use_registry` (thread mode) or the one each
+worker process builds for itself (process mode), and return plain dicts so
+they pickle across processes.
+
+Environment variables:
+  INFERENCE_SPEECH_EXECUTOR   thread (default), process or inline
+  INFERENCE_VISION_EXECUTOR   thread (default), process or inline
+  INFERENCE_WORKERS           threads or processes per pool (default: CPU count, at most 8)
+  INFERENCE_MAX_PENDING       queued + running calls per pool before answering 503 (default 4 x workers)
+  INFERENCE_RETRY_AFTER       minimum Retry-After seconds (default 1)
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+logger = logging.getLogger("inference_executor")
+
+INFERENCE_SPEECH_EXECUTOR = os.getenv("INFERENCE_SPEECH_EXECUTOR", "thread").lower()
+INFERENCE_VISION_EXECUTOR = os.getenv("INFERENCE_VISION_EXECUTOR", "thread").lower()
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(8, os.cpu_count() or 1))))
+INFERENCE_MAX_PENDING = os.getenv("INFERENCE_MAX_PENDING")
+INFERENCE_RETRY_AFTER = float(os.getenv("INFERENCE_RETRY_AFTER", "1"))
+
+KINDS = ("thread", "process", "inline")
+
+
+class Saturated(RuntimeError):
+    """Too many calls queued or running; retry after `retry_after` seconds."""
+
+    def __init__(self, name, pending, retry_after):
+        super().__init__(f"{name} inference is saturated ({pending} requests pending)")
+        self.retry_after = retry_after
+
+
+def saturated_response(exc):
+    """503 with Retry-After for a `Saturated` error (FastAPI exception handler body)."""
+    from fastapi.responses import JSONResponse
+    return JSONResponse({"status": "busy", "message": str(exc), "retry_after": exc.retry_after},
+                        status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
+# ---------------------------------------------------------------- tasks
+
+_registry = None
+
+
+def use_registry(registry):
+    """Model registry the tasks use in this process (thread and inline pools share the server's)."""
+    global _registry
+    _registry = registry
+
+
+def _init_worker(speech, vision):
+    # runs once in every worker process: its own registry, loaded, warmed up and watched
+    logging.basicConfig(level=logging.INFO)
+    from model_registry import build_registry
+    registry = build_registry(speech=speech, vision=vision)
+    registry.load_all()
+    registry.start()
+    use_registry(registry)
+
+
+def _ready():
+    return os.getpid()
+
+
+def predict_speech(audio_bytes, sr=16000, pcm_rate=16000, proba=False, fmt=None):
+    """Decode, extract the 16 features and classify: label, features, probabilities (if asked) and version.
+
+    `fmt` skips format sniffing (e.g. "pcm" for a device known to post raw int16).
+    """
+    from audio_decode import decode_audio
+    from audio_features import extract_features
+    y, sr = decode_audio(audio_bytes, sr=sr, fmt=fmt, pcm_rate=pcm_rate)
+    features = extract_features(y, sr)
+    with _registry["speech"].use() as speech:
+        if speech is None:
+            raise RuntimeError("speech model not loaded")
+        models = speech.value
+        scaled = models.scaler.transform(features.reshape(1, -1))
+        pred = models.model.predict(scaled)[0]
+        result = {
+            "label": str(models.encoder.inverse_transform([pred])[0]),
+            "features": features.tolist(),
+            "model_version": speech.version,
+        }
+        if proba:
+            result["probabilities"] = models.model.predict_proba(scaled)[0].tolist()
+    return result
+
+
+def predict_vision(image_bytes):
+    """Decode, preprocess and classify one frame (through the batcher when there is one)."""
+    with _registry["vision"].use() as vision:
+        if vision is None:
+            raise RuntimeError("vision model not loaded")
+        return {"label": str(vision.value.classify(image_bytes)), "model_version": vision.version}
+
+
+# ---------------------------------------------------------------- executor
+
+class InferenceExecutor:
+    """A bounded thread or process pool for one kind of inference."""
+
+    def __init__(self, name, kind="thread", workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING,
+                 speech=True, vision=True, min_retry_after=INFERENCE_RETRY_AFTER):
+        if kind not in KINDS:
+            raise ValueError(f"executor kind must be one of {KINDS}, got {kind!r}")
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending)) if max_pending else 4 * self.workers
+        self.min_retry_after = max(1, int(math.ceil(float(min_retry_after))))
+        self._preload = (speech, vision)
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        # exponentially weighted mean service time, for Retry-After
+        self._service_ewma = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "max_pending": 0}
+
+    def start(self):
+        if self._pool is not None or self.kind == "inline":
+            return self
+        if self.kind == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-infer")
+        else:
+            # spawn, not fork: torch and the registry's threads don't survive a fork, and it matches Windows
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=self._preload)
+            # start every worker (and load its models) now rather than on the first requests
+            start = time.perf_counter()
+            pids = {f.result() for f in [self._pool.submit(_ready) for _ in range(self.workers * 2)]}
+            logger.info("%s: %d worker processes ready in %.1fs", self.name, len(pids), time.perf_counter() - start)
+        return self
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def retry_after(self):
+        mean = self._service_ewma or 1.0
+        return max(self.min_retry_after, int(math.ceil(mean * self._pending / self.workers)))
+
+    async def run(self, fn, *args, **kwargs):
+        """Await `fn(*args, **kwargs)` on the pool, or raise `Saturated` if too much is already pending."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise Saturated(self.name, self._pending, self.retry_after())
+            self._pending += 1
+            self.stats["submitted"] += 1
+            self.stats["max_pending"] = max(self.stats["max_pending"], self._pending)
+        start = time.perf_counter()
+        try:
+            if self.kind == "inline":
+                result = fn(*args, **kwargs)
+            else:
+                if self._pool is None:
+                    self.start()
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._pool, _call, fn, args, kwargs)
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self._service_ewma = elapsed if self._service_ewma is None else 0.8 * self._service_ewma + 0.2 * elapsed
+
+    def status(self):
+        return dict(self.stats, kind=self.kind, workers=self.workers, limit=self.max_pending, pending=self._pending,
+                    mean_service_ms=round((self._service_ewma or 0.0) * 1000, 2))
+
+
+def _call(fn, args, kwargs):
+    return fn(*args, **kwargs)
+
+
+def build_executors(registry, speech=True, vision=True):
+    """The speech and/or vision executors configured by INFERENCE_*_EXECUTOR, bound to `registry`."""
+    use_registry(registry)
+    executors = {}
+    if speech:
+        executors["speech"] = InferenceExecutor("speech", INFERENCE_SPEECH_EXECUTOR, speech=True, vision=False)
+    if vision:
+        executors["vision"] = InferenceExecutor("vision", INFERENCE_VISION_EXECUTOR, speech=False, vision=True)
+    return executors
@@ -0,0 +1,166 @@
+"""Change-driven publishing of integrity results back to the devices.
+
+Every ESP32 subscribed to the result topic wakes up, parses the JSON and
+redraws its LEDs for each message, and a red result also sounds the buzzer.
+Publishing after every audio window mostly repeats the previous result, so
+`IntegrityPublisher` keeps a small state machine per device and only emits
+when:
+
+- the color label changes;
+- the score moved by more than `score_delta` points (0-100) since the last
+  published value;
+- nothing has been sent for `heartbeat_seconds` (so a device that rebooted or
+  missed a message resyncs).
+
+Labels use hysteresis around the 70/50 thresholds of
+`_compute_integrity_and_label`. Getting worse is immediate, so an alert goes
+out on the first window that crosses a threshold. Recovering needs the score
+to clear the threshold by `hysteresis` points, so a score hovering around 70
+doesn't flip the LEDs back and forth.
+
+Routing: with one shared result topic every device receives every other
+device's results (N devices -> N^2 deliveries). Results go to
+`<topic>/<device_id>` instead, so each device only gets its own:
+
+- INTEGRITY_TOPIC_MODE=device   `<topic>/<device_id>` only (default)
+- INTEGRITY_TOPIC_MODE=legacy   the shared `<topic>`, for firmware that hasn't been updated
+- INTEGRITY_TOPIC_MODE=both     both, while a room is being migrated
+- INTEGRITY_AGGREGATE_TOPIC     if set, every published result is also sent
+                                there (e.g. `iot/integrity/all` for dashboards)
+
+Environment variables:
+  INTEGRITY_SCORE_DELTA        score change (points) that forces a publish (default 10)
+  INTEGRITY_HYSTERESIS         points above a threshold needed to recover (default 5)
+  INTEGRITY_HEARTBEAT_SECONDS  max silence per device before re-sending (default 30)
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger("integrity_publisher")
+
+INTEGRITY_SCORE_DELTA = float(os.getenv("INTEGRITY_SCORE_DELTA", "10"))
+INTEGRITY_HYSTERESIS = float(os.getenv("INTEGRITY_HYSTERESIS", "5"))
+INTEGRITY_HEARTBEAT_SECONDS = float(os.getenv("INTEGRITY_HEARTBEAT_SECONDS", "30"))
+INTEGRITY_TOPIC_MODE = os.getenv("INTEGRITY_TOPIC_MODE", "device").lower()
+INTEGRITY_AGGREGATE_TOPIC = os.getenv("INTEGRITY_AGGREGATE_TOPIC", "")
+
+TOPIC_MODES = ("device", "legacy", "both")
+
+# (label, lower bound of its score band), best first
+LABEL_BANDS = (("green", 70.0), ("yellow", 50.0), ("red", float("-inf")))
+_RANK = {label: i for i, (label, _) in enumerate(LABEL_BANDS)}
+
+
+def raw_label(score):
+    for label, lower in LABEL_BANDS:
+        if score >= lower:
+            return label
+    return LABEL_BANDS[-1][0]
+
+
+def label_with_hysteresis(score, previous=None, hysteresis=INTEGRITY_HYSTERESIS):
+    """Label for `score`, only moving to a better label once it clears that band by `hysteresis`."""
+    label = raw_label(score)
+    if previous not in _RANK or _RANK[label] >= _RANK[previous]:
+        # first result, unchanged or worse: no delay on alerts
+        return label
+    # improving: step up only as far as the margin allows
+    for candidate, lower in LABEL_BANDS[_RANK[label]:_RANK[previous]]:
+        if score >= lower + hysteresis:
+            return candidate
+    return previous
+
+
+class _DeviceState:
+    __slots__ = ("label", "published_score", "published_label", "published_at")
+
+    def __init__(self):
+        self.label = None
+        self.published_score = None
+        self.published_label = None
+        self.published_at = 0.0
+
+
+class IntegrityPublisher:
+    """Decides per device whether a new integrity score is worth publishing."""
+
+    def __init__(self, topic, score_delta=INTEGRITY_SCORE_DELTA, hysteresis=INTEGRITY_HYSTERESIS,
+                 heartbeat_seconds=INTEGRITY_HEARTBEAT_SECONDS, mode=INTEGRITY_TOPIC_MODE,
+                 aggregate_topic=INTEGRITY_AGGREGATE_TOPIC):
+        if mode not in TOPIC_MODES:
+            raise ValueError(f"INTEGRITY_TOPIC_MODE must be one of {TOPIC_MODES}, got {mode!r}")
+        self.topic = topic.rstrip("/")
+        self.mode = mode
+        self.aggregate_topic = aggregate_topic or None
+        self.score_delta = float(score_delta)
+        self.hysteresis = float(hysteresis)
+        self.heartbeat_seconds = float(heartbeat_seconds)
+        self._devices = {}
+        self._lock = threading.Lock()
+        self.stats = {"updates": 0, "published": 0, "suppressed": 0,
+                      "label_change": 0, "score_delta": 0, "heartbeat": 0}
+
+    def decide(self, device_id, score, now=None):
+        """Update the device's state; returns (label, reason) where reason is None if nothing should be sent."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceState()
+            state.label = label_with_hysteresis(score, state.label, self.hysteresis)
+            self.stats["updates"] += 1
+            if state.published_label != state.label:
+                reason = "label_change"
+            elif abs(score - state.published_score) > self.score_delta:
+                reason = "score_delta"
+            elif now - state.published_at >= self.heartbeat_seconds:
+                reason = "heartbeat"
+            else:
+                self.stats["suppressed"] += 1
+                return state.label, None
+            state.published_label = state.label
+            state.published_score = score
+            state.published_at = now
+            self.stats["published"] += 1
+            self.stats[reason] += 1
+            return state.label, reason
+
+    def topics_for(self, device_id):
+        """Topics a result for `device_id` is published to."""
+        topics = []
+        if self.mode in ("device", "both"):
+            topics.append(f"{self.topic}/{device_id}")
+        if self.mode in ("legacy", "both"):
+            topics.append(self.topic)
+        if self.aggregate_topic:
+            topics.append(self.aggregate_topic)
+        return topics
+
+    def update(self, client, device_id, score, now=None):
+        """Feed a new 0-100 score; publishes `{device_id, integrity_score, label}` when warranted.
+
+        Returns the published payload, or None if it was suppressed.
+        """
+        label, reason = self.decide(device_id, score, now)
+        if reason is None:
+            logger.debug("Suppressed unchanged integrity result for %s (%s, %.1f)", device_id, label, score)
+            return None
+        payload = {
+            'device_id': device_id,
+            'integrity_score': round(score / 100, 3),
+            'label': label,
+        }
+        message = json.dumps(payload)
+        topics = self.topics_for(device_id)
+        for topic in topics:
+            client.publish(topic, message)
+        logger.info("Published integrity result to %s (%s): %s", ", ".join(topics), reason, payload)
+        return payload
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
@@ -0,0 +1,194 @@
+"""Long-lived MJPEG readers that keep only the newest frame per camera.
+
+Opening a fresh HTTP stream for every audio window costs a connection setup
+plus however long the camera takes to emit its next frame. Instead, one
+background thread per camera URL stays connected, parses the multipart stream
+incrementally and publishes the latest JPEG with its capture time, so callers
+can ask for "the newest frame no older than X ms" without touching the network.
+
+`MjpegStreamParser` never rescans bytes it has already looked at: it resumes
+the search where the previous `feed` stopped, uses the part's Content-Length
+when the camera sends one (the ESP32 stream does) and falls back to scanning
+for the JPEG end marker otherwise. Consumed bytes are trimmed in place so the
+same bytearray is reused for the life of the stream.
+
+Environment variables:
+  CAMERA_MAX_FRAME_AGE_MS   oldest frame callers accept by default (default 2000)
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+import http_pool
+
+
+logger = logging.getLogger("mjpeg_grabber")
+
+CAMERA_MAX_FRAME_AGE_MS = float(os.getenv("CAMERA_MAX_FRAME_AGE_MS", "2000"))
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+_CONTENT_LENGTH = re.compile(rb"content-length\s*:\s*(\d+)", re.IGNORECASE)
+
+
+class MjpegStreamParser:
+    """Incremental multipart/x-mixed-replace JPEG splitter."""
+
+    def __init__(self, max_buffer=4 * 1024 * 1024):
+        self.max_buffer = max_buffer
+        self._buf = bytearray()
+        self._scan = 0
+        self._start = None
+        self._length = None
+
+    def feed(self, data):
+        """Append stream bytes; returns the list of complete JPEG frames found."""
+        self._buf += data
+        frames = []
+        while True:
+            if self._start is None:
+                soi = self._buf.find(JPEG_SOI, self._scan)
+                if soi == -1:
+                    # a marker may be split across reads; keep the last byte in view
+                    self._scan = max(0, len(self._buf) - 1)
+                    break
+                self._start = soi
+                m = None
+                for m in _CONTENT_LENGTH.finditer(self._buf, 0, soi):
+                    pass
+                self._length = int(m.group(1)) if m else None
+                self._scan = soi + 2
+
+            if self._length:
+                end = self._start + self._length
+                if len(self._buf) < end:
+                    break
+            else:
+                eoi = self._buf.find(JPEG_EOI, self._scan)
+                if eoi == -1:
+                    self._scan = max(self._start + 2, len(self._buf) - 1)
+                    break
+                end = eoi + 2
+
+            frames.append(bytes(self._buf[self._start:end]))
+            del self._buf[:end]
+            self._start = None
+            self._length = None
+            self._scan = 0
+
+        if len(self._buf) > self.max_buffer:
+            logger.warning("MJPEG buffer exceeded %d bytes without a frame; resetting", self.max_buffer)
+            self.reset()
+        return frames
+
+    def reset(self):
+        del self._buf[:]
+        self._scan = 0
+        self._start = None
+        self._length = None
+
+
+class MjpegGrabber:
+    """Background reader for one MJPEG URL holding the latest frame and its timestamp."""
+
+    def __init__(self, url, session=None, chunk_size=4096, connect_timeout=3.0, read_timeout=10.0,
+                 reconnect_delay=0.5, max_reconnect_delay=10.0):
+        self.url = url
+        self.session = session or http_pool.get_session("camera")
+        self.chunk_size = chunk_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._frame = None
+        self._frame_ts = 0.0
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.stats = {"frames": 0, "bytes": 0, "connects": 0, "errors": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"mjpeg-{self.url}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def latest(self, max_age_ms=CAMERA_MAX_FRAME_AGE_MS):
+        """Return `(jpeg_bytes, capture_time)` if the newest frame is fresh enough, else None."""
+        with self._cond:
+            frame, ts = self._frame, self._frame_ts
+        if frame is None:
+            return None
+        if max_age_ms is not None and (time.time() - ts) * 1000.0 > max_age_ms:
+            return None
+        return frame, ts
+
+    def wait_for_frame(self, timeout):
+        """Block until a frame newer than now arrives (used by tests and warm-up)."""
+        since = time.time()
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None and self._frame_ts >= since, timeout)
+            return (self._frame, self._frame_ts) if self._frame is not None else None
+
+    def _publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._frame_ts = time.time()
+            self._cond.notify_all()
+        self.stats["frames"] += 1
+
+    def _run(self):
+        delay = self.reconnect_delay
+        parser = MjpegStreamParser()
+        while not self._stopping.is_set():
+            try:
+                with self.session.get(self.url, stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    self.stats["connects"] += 1
+                    delay = self.reconnect_delay
+                    parser.reset()
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        if self._stopping.is_set():
+                            return
+                        if not chunk:
+                            continue
+                        self.stats["bytes"] += len(chunk)
+                        frames = parser.feed(chunk)
+                        if frames:
+                            self._publish(frames[-1])
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning("MJPEG stream %s failed: %s (retrying in %.1fs)", self.url, e, delay)
+            if self._stopping.wait(delay):
+                return
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+
+_grabbers = {}
+_grabbers_lock = threading.Lock()
+
+
+def get_grabber(url, **kwargs):
+    """Shared, started grabber for `url` (one reader thread per camera)."""
+    grabber = _grabbers.get(url)
+    if grabber is None:
+        with _grabbers_lock:
+            grabber = _grabbers.get(url)
+            if grabber is None:
+                grabber = MjpegGrabber(url, **kwargs).start()
+                _grabbers[url] = grabber
+    return grabber
+
+
+def stop_all():
+    with _grabbers_lock:
+        for grabber in _grabbers.values():
+            grabber.stop()
+        _grabbers.clear()
@@ -0,0 +1,355 @@
+"""Deferred loading and warm-up of the speech and vision models.
+
+Importing the consumer used to import torch/torchvision and unpickle both
+models before the first line of `main()` ran, so every tool that imported it
+for one helper (the AI API, capture scripts, tests) paid several seconds of
+startup. Here the heavy imports live inside the loader functions and the
+models sit behind `LazyModel`:
+
+- `get()` loads on first use (thread-safe, once) and returns None if the
+  artifacts can't be loaded, so callers fall back to the "none" label as
+  before;
+- `load()` loads now and runs one dummy inference (`warm_up`), so torch's
+  kernels, the thread pools and the feature engine's filterbanks are ready
+  before the first real request. Servers call it at startup;
+- `startup` records how long importing, loading and warming up took;
+  `startup.report()` is logged once the process is ready;
+- `use()` and `reload()` let model_registry.py swap in retrained artifacts
+  without a restart.
+
+Environment variables:
+  SPEECH_MODEL_DIR      best_model / scaler / label_encoder .joblib (default ./Speech-Recognition/models_output)
+  VISION_ENCODER_PATH   vision label encoder (default ./Computer-Vision/vision_label_encoder.joblib)
+  MODEL_WARMUP          1 (default) to run a dummy inference after loading, 0 to skip
+"""
+import os
+import io
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("model_loader")
+
+SPEECH_MODEL_DIR = os.getenv("SPEECH_MODEL_DIR", "./Speech-Recognition/models_output")
+VISION_ENCODER_PATH = os.getenv("VISION_ENCODER_PATH", "./Computer-Vision/vision_label_encoder.joblib")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") != "0"
+
+
+class StartupTimer:
+    """Wall time per startup phase (import, load, warm-up), in the order they happened."""
+
+    def __init__(self):
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def report(self):
+        with self._lock:
+            phases = list(self.phases.items())
+        total = sum(s for _, s in phases)
+        return ", ".join(f"{name} {s:.2f}s" for name, s in phases) + f" (total {total:.2f}s)"
+
+
+startup = StartupTimer()
+
+
+# ---------------------------------------------------------------- speech
+
+class SpeechModels:
+    """Scaler + classifier + label encoder for the 16-dim feature vector."""
+
+    def __init__(self, model, scaler, encoder):
+        self.model = model
+        self.scaler = scaler
+        self.encoder = encoder
+
+    def predict(self, feats):
+        pred = self.model.predict(self.scaler.transform(feats))[0]
+        return self.encoder.inverse_transform([pred])[0]
+
+    def describe(self):
+        return {"model": type(self.model).__name__, "classes": [str(c) for c in self.encoder.classes_]}
+
+
+def load_speech_models(model_dir=SPEECH_MODEL_DIR):
+    import joblib
+    return SpeechModels(
+        joblib.load(os.path.join(model_dir, "best_model.joblib")),
+        joblib.load(os.path.join(model_dir, "scaler.joblib")),
+        joblib.load(os.path.join(model_dir, "label_encoder.joblib")),
+    )
+
+
+def warm_up_speech(speech):
+    import numpy as np
+    from audio_features import extract_features
+    # one second of faint noise: builds the feature engine's window/filterbank cache and runs the model once
+    y = (np.random.default_rng(0).standard_normal(16000) * 1e-3).astype(np.float32)
+    speech.predict(extract_features(y, 16000).reshape(1, -1))
+
+
+# ---------------------------------------------------------------- vision
+
+class VisionModels:
+    """The vision artifact chosen by vision_runtime plus its encoder, batcher and preprocessor."""
+
+    def __init__(self, model, encoder, device, runtime, batcher, preprocessor):
+        self.model = model
+        self.encoder = encoder
+        self.device = device
+        self.runtime = runtime
+        self.batcher = batcher
+        self.preprocessor = preprocessor
+
+    def classify(self, image_bytes):
+        if self.batcher is not None:
+            return self.batcher.classify(self.preprocessor.tensor(image_bytes))
+        import torch
+        # per-thread (1, 3, H, W) buffer, reused by this worker's next frame
+        img_tensor = self.preprocessor.batch([image_bytes]).to(self.device)
+        with torch.no_grad():
+            pred_class = torch.argmax(self.model(img_tensor), dim=1).item()
+        return self.encoder.inverse_transform([pred_class])[0]
+
+    def describe(self):
+        return {"runtime": self.runtime, "device": str(self.device), "classes": [str(c) for c in self.encoder.classes_]}
+
+    def stop(self):
+        if self.batcher is not None:
+            self.batcher.stop()
+
+
+def load_vision_models(encoder_path=VISION_ENCODER_PATH, device=None, batch=True, img_size=224):
+    import joblib
+    import torch
+    from vision_runtime import load_vision_model
+    from vision_batcher import VisionBatcher, VISION_BATCH_MAX
+    from vision_preprocess import FramePreprocessor
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    encoder = joblib.load(encoder_path)
+    # eager .pth, TorchScript, int8 or ONNX, whichever VISION_RUNTIME picks (see vision_runtime.py)
+    model, runtime = load_vision_model(len(encoder.classes_), device)
+    if runtime in ("int8", "onnx"):
+        device = "cpu"
+    batcher = None
+    if batch and VISION_BATCH_MAX > 1:
+        # frames from all callers share one stacked forward pass
+        batcher = VisionBatcher(model, encoder, device).start()
+    preprocessor = FramePreprocessor(img_size, max_batch=1 if batcher else VISION_BATCH_MAX)
+    return VisionModels(model, encoder, device, runtime, batcher, preprocessor)
+
+
+def _blank_jpeg(size=(160, 120)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", size, (128, 128, 128)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def warm_up_vision(vision):
+    # a QQVGA frame like the ESP32-CAM's, through the same decode/batch/forward path as real frames
+    vision.classify(_blank_jpeg())
+
+
+# ---------------------------------------------------------------- lazy holder
+
+class ModelVersion:
+    """One loaded version of a bundle. Closed once it has been replaced and no request still holds it."""
+
+    def __init__(self, value, version, close=None):
+        self.value = value
+        self.version = version
+        self.loaded_at = time.time()
+        self._close = close
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        return self._refs
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            done = self._retired and self._refs == 0
+        if done:
+            self._shutdown()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            done = self._refs == 0
+        if done:
+            self._shutdown()
+
+    def _shutdown(self):
+        if self._close is not None:
+            try:
+                self._close(self.value)
+            except Exception as e:
+                logger.warning("Closing model version %s failed: %s", self.version, e)
+
+
+class LazyModel:
+    """Load a model bundle once, on first use or explicitly at startup, and swap in new versions.
+
+    `fingerprint()` names the version of the artifacts on disk (see
+    model_registry.py); `reload()` loads and warms up a new version next to
+    the current one and swaps it in. Requests wrapped in `use()` keep the
+    version they started with, which is closed only after the last of them
+    finishes.
+    """
+
+    def __init__(self, name, loader, warm_up=None, fingerprint=None, close=None):
+        self.name = name
+        self.loader = loader
+        self.warm_up_fn = warm_up
+        self.fingerprint = fingerprint
+        self.close = close
+        self._current = None
+        self._error = None
+        self.failed_version = None
+        self.stats = {"reloads": 0, "failures": 0}
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._current is not None
+
+    @property
+    def version(self):
+        current = self._current
+        return current.version if current is not None else None
+
+    @property
+    def error(self):
+        return self._error
+
+    def _fingerprint(self):
+        if self.fingerprint is None:
+            return None
+        try:
+            return self.fingerprint()
+        except OSError:
+            return None
+
+    def _new_version(self, warm_up):
+        version = self._fingerprint()
+        value = self.loader()
+        if warm_up and self.warm_up_fn is not None:
+            try:
+                self.warm_up_fn(value)
+            except Exception as e:
+                logger.warning("Warm-up of %s models failed: %s", self.name, e)
+        return ModelVersion(value, version, self.close)
+
+    def get(self):
+        """The loaded bundle, or None if loading failed (the error is logged once)."""
+        if self._current is None and self._error is None:
+            with self._lock:
+                if self._current is None and self._error is None:
+                    try:
+                        with startup.phase(f"load {self.name}"):
+                            self._current = self._new_version(warm_up=False)
+                        logger.info("Loaded %s models (version %s)", self.name, self._current.version)
+                    except Exception as e:
+                        logger.exception("Could not load %s models: %s", self.name, e)
+                        self._error = e
+                        self.failed_version = self._fingerprint()
+        current = self._current
+        return current.value if current is not None else None
+
+    def load(self, warm_up=MODEL_WARMUP):
+        """Load now (if not already) and optionally run one dummy inference."""
+        value = self.get()
+        if value is not None and warm_up and self.warm_up_fn is not None:
+            try:
+                with startup.phase(f"warm-up {self.name}"):
+                    self.warm_up_fn(value)
+            except Exception as e:
+                logger.warning("Warm-up of %s models failed: %s", self.name, e)
+        return value
+
+    @contextmanager
+    def use(self):
+        """Hold the current version for the duration of a request: yields a ModelVersion, or None."""
+        self.get()
+        with self._swap_lock:
+            current = self._current
+            if current is not None:
+                current.acquire()
+        try:
+            yield current
+        finally:
+            if current is not None:
+                current.release()
+
+    def reload(self, warm_up=MODEL_WARMUP, force=False):
+        """Load the artifacts on disk if their version changed; True if a new version was swapped in."""
+        with self._lock:
+            version = self._fingerprint()
+            if not force and self._current is not None and version == self._current.version:
+                return False
+            start = time.perf_counter()
+            try:
+                new = self._new_version(warm_up)
+            except Exception as e:
+                # keep serving the old version; don't retry these artifacts until they change again
+                self.failed_version = version
+                self.stats["failures"] += 1
+                self._error = self._error if self._current is not None else e
+                logger.exception("Could not load %s models version %s: %s", self.name, version, e)
+                return False
+            with self._swap_lock:
+                old, self._current = self._current, new
+            self._error = None
+            self.failed_version = None
+            self.stats["reloads"] += 1
+        logger.info("Swapped in %s models version %s (was %s), loaded and warmed up in %.2fs",
+                    self.name, new.version, old.version if old else None, time.perf_counter() - start)
+        if old is not None:
+            old.retire()
+        return True
+
+    def retire(self):
+        """Drop the current version (closing it once idle); used at shutdown."""
+        with self._swap_lock:
+            old, self._current = self._current, None
+        if old is not None:
+            old.retire()
+
+    def status(self):
+        current = self._current
+        status = {
+            "version": current.version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "in_flight": current.in_flight if current else 0,
+            "reloads": self.stats["reloads"],
+            "failures": self.stats["failures"],
+            "failed_version": self.failed_version,
+        }
+        if current is not None and hasattr(current.value, "describe"):
+            status.update(current.value.describe())
+        elif self._error is not None:
+            status["error"] = str(self._error)
+        return status
@@ -0,0 +1,176 @@
+"""Versioned speech and vision models that follow the artifacts on disk.
+
+Each model bundle is a `LazyModel` slot (see model_loader.py) whose version
+is a fingerprint of its artifact files: the newest modification time plus a
+short hash of every file's name, size and mtime, e.g. `20261017-142501-3fa9c2d1`.
+Copying a retrained `best_model.joblib` or re-running
+`Computer-Vision/export_model.py` changes it.
+
+`ModelRegistry.start()` runs a watcher thread that polls the fingerprints
+every MODEL_WATCH_SECONDS (polling rather than inotify: no extra dependency,
+and it works the same on the Windows lab machines and on bind mounts). When a
+slot's fingerprint changes and stays the same for two polls in a row (so a
+half-copied file isn't loaded), the new version is loaded and warmed up on the
+watcher thread while the old one keeps serving, then swapped in under a lock.
+Requests that already hold the old version through `slot.use()` finish on it;
+it is closed (the vision batcher stopped) after the last of them. A version
+that fails to load is logged and skipped until the files change again, and
+the old version stays active.
+
+Slots that were never requested are not watched: the first request loads
+whatever is on disk then. A slot whose first load failed is retried once its
+files change. Labels cached by frame_change.py from the previous
+vision model expire within FRAME_MAX_STALENESS_SECONDS.
+
+    python model_registry.py            # print the versions on disk
+
+Environment variables:
+  MODEL_WATCH_SECONDS   poll interval for new artifacts (default 5, 0 disables hot reload)
+  VISION_MODEL_DIR      vision artifacts (default ./Computer-Vision, as in vision_runtime.py)
+"""
+import os
+import time
+import json
+import hashlib
+import logging
+import threading
+
+from model_loader import (LazyModel, SPEECH_MODEL_DIR, VISION_ENCODER_PATH, load_speech_models, warm_up_speech,
+                          load_vision_models, warm_up_vision)
+
+
+logger = logging.getLogger("model_registry")
+
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "5"))
+# vision_runtime.py has the same default but imports torch, which the fingerprint must not need
+VISION_MODEL_DIR = os.getenv("VISION_MODEL_DIR", "./Computer-Vision")
+VISION_MODEL_STEM = "cheating_cnn_model"
+
+SPEECH_ARTIFACTS = ("best_model.joblib", "scaler.joblib", "label_encoder.joblib")
+
+
+def artifact_version(paths):
+    """Version string for a set of files; missing files count too, so adding one is a change."""
+    digest = hashlib.sha1()
+    newest = 0
+    for path in sorted(paths):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            digest.update(f"{os.path.basename(path)}:missing\n".encode())
+            continue
+        newest = max(newest, st.st_mtime_ns)
+        digest.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(newest / 1e9)) if newest else "missing"
+    return f"{stamp}-{digest.hexdigest()[:8]}"
+
+
+def speech_artifacts(model_dir=SPEECH_MODEL_DIR):
+    return [os.path.join(model_dir, name) for name in SPEECH_ARTIFACTS]
+
+
+def vision_artifacts(model_dir=VISION_MODEL_DIR, encoder_path=VISION_ENCODER_PATH):
+    """The label encoder and every exported variant of the network (.pth, .ts.pt, .int8.pt, .onnx)."""
+    try:
+        names = [n for n in os.listdir(model_dir) if n.startswith(VISION_MODEL_STEM + ".")]
+    except FileNotFoundError:
+        names = []
+    return [encoder_path] + [os.path.join(model_dir, n) for n in names]
+
+
+def speech_version():
+    return artifact_version(speech_artifacts())
+
+
+def vision_version():
+    return artifact_version(vision_artifacts())
+
+
+def _stop_vision(vision):
+    vision.stop()
+
+
+class ModelRegistry:
+    """Named model slots plus the watcher thread that reloads them."""
+
+    def __init__(self, slots, interval=MODEL_WATCH_SECONDS):
+        self.slots = dict(slots)
+        self.interval = float(interval)
+        # last fingerprint seen per slot, so a change has to hold for two polls
+        self._seen = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getitem__(self, name):
+        return self.slots[name]
+
+    def load_all(self, warm_up=True):
+        for slot in self.slots.values():
+            slot.load(warm_up)
+
+    def poll(self):
+        """Check every loaded slot once; returns the names that were swapped."""
+        swapped = []
+        for name, slot in self.slots.items():
+            # never requested: the first use loads whatever is on disk then
+            if slot.fingerprint is None or not (slot.loaded or slot.error is not None):
+                continue
+            try:
+                version = slot.fingerprint()
+            except OSError as e:
+                logger.warning("Could not fingerprint %s artifacts: %s", name, e)
+                continue
+            previous, self._seen[name] = self._seen.get(name), version
+            if version == slot.version or version == slot.failed_version or version != previous:
+                continue
+            logger.info("New %s models on disk (%s), loading in the background", name, version)
+            if slot.reload():
+                swapped.append(name)
+        return swapped
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception("Model watcher poll failed: %s", e)
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        logger.info("Watching model artifacts every %gs", self.interval)
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for slot in self.slots.values():
+            slot.retire()
+
+    def versions(self):
+        return {name: slot.version for name, slot in self.slots.items()}
+
+    def status(self):
+        return {
+            "watch_seconds": self.interval if self._thread is not None else 0,
+            "models": {name: slot.status() for name, slot in self.slots.items()},
+        }
+
+
+def build_registry(speech=True, vision=True, interval=MODEL_WATCH_SECONDS):
+    slots = {}
+    if speech:
+        slots["speech"] = LazyModel("speech", load_speech_models, warm_up_speech, fingerprint=speech_version)
+    if vision:
+        slots["vision"] = LazyModel("vision", load_vision_models, warm_up_vision, fingerprint=vision_version,
+                                    close=_stop_vision)
+    return ModelRegistry(slots, interval)
+
+
+if __name__ == "__main__":
+    print(json.dumps({"speech": speech_version(), "vision": vision_version()}, indent=2))
@@ -0,0 +1,174 @@
+"""Hand MQTT messages off the paho network thread to a worker pool.
+
+paho runs `on_message` on the same thread that services keepalives, so anything
+slow done there (inference, HTTP calls, Supabase uploads) stalls every device.
+`MessageDispatcher` keeps the network callback down to a queue put:
+
+- each message goes to a lane chosen by `key(topic, payload)` (the consumer
+  uses the device id, so one lane per device); a lane's messages are handled
+  one at a time, in arrival order, because the handlers keep per-device state
+  (audio windows, integrity hysteresis, last classified frame);
+- different lanes run in parallel on a shared thread pool. A lane with work
+  holds at most one pool task, and hands its worker back after each message
+  so a flooding device can't starve the others;
+- each lane is bounded; when it is full its oldest message is dropped so the
+  pipeline always works on the freshest data.
+
+Workers are threads: the heavy parts (numpy, torch, HTTP) release the GIL,
+and the per-device state lives in this process. (A process pool used to be
+an option; forked workers inherited dead batcher / writer threads and split
+one device's messages across processes.)
+
+Environment variables:
+  MQTT_WORKERS       pool size (default 4)
+  MQTT_QUEUE_SIZE    max queued messages per lane (default 256)
+"""
+import os
+import time
+import logging
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger("mqtt_dispatch")
+
+MQTT_WORKERS = int(os.getenv("MQTT_WORKERS", "4"))
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", "256"))
+
+if os.getenv("MQTT_WORKER_MODE", "thread").lower() != "thread":
+    logger.warning("MQTT_WORKER_MODE=%s is no longer supported; using threads", os.getenv("MQTT_WORKER_MODE"))
+
+# Plain copy of a paho MQTTMessage, detached from the network thread's buffers.
+DecodedMessage = namedtuple("DecodedMessage", ["topic", "payload", "received_at"])
+
+
+def topic_key(topic, payload):
+    return topic
+
+
+class _Lane:
+    __slots__ = ("messages", "scheduled")
+
+    def __init__(self):
+        self.messages = deque()
+        self.scheduled = False
+
+
+class MessageDispatcher:
+    """Bounded per-key lanes, each drained in order by a shared thread pool.
+
+    `handler(client, message)` is called with the MQTT client and a `DecodedMessage`.
+    """
+
+    def __init__(self, handler, workers=MQTT_WORKERS, queue_size=MQTT_QUEUE_SIZE, key=topic_key):
+        self.handler = handler
+        self.key = key
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.client = None
+        self._executor = None
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._running = {}  # lane key -> topic of the message being handled
+        self._stopping = threading.Event()
+        self.stats = {"enqueued": 0, "dropped": 0, "processed": 0, "failed": 0}
+
+    def start(self, client=None):
+        self.client = client
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mqtt-worker")
+        logger.info("Dispatcher started (%d workers, queue %d per lane)", self.workers, self.queue_size)
+        return self
+
+    def submit(self, topic, payload):
+        """Enqueue a message; safe to call from the paho network thread. Never blocks."""
+        try:
+            key = self.key(topic, payload)
+        except Exception:
+            key = None
+        message = DecodedMessage(topic, bytes(payload), time.time())
+        with self._lock:
+            lane_key = topic if key is None else key
+            lane = self._lanes.get(lane_key)
+            if lane is None:
+                lane = self._lanes[lane_key] = _Lane()
+            if len(lane.messages) >= self.queue_size:
+                lane.messages.popleft()
+                self.stats["dropped"] += 1
+            lane.messages.append(message)
+            self.stats["enqueued"] += 1
+            if lane.scheduled or self._executor is None or self._stopping.is_set():
+                return
+            lane.scheduled = True
+        self._schedule(lane_key, lane)
+
+    def on_message(self, client, userdata, msg):
+        """Drop-in paho `on_message` callback."""
+        if self.client is None:
+            self.client = client
+        self.submit(msg.topic, msg.payload)
+
+    def queue_depths(self):
+        with self._lock:
+            return {key: len(lane.messages) for key, lane in self._lanes.items()}
+
+    def stop(self, timeout=5.0):
+        """Stop taking work from the lanes; queued messages are discarded.
+
+        Waits up to `timeout` seconds for messages already running; a handler
+        still stuck after that is logged and left to finish on its own.
+        Returns True if every worker was idle in time.
+        """
+        self._stopping.set()
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return True
+        executor.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Dispatcher stopped with %d handler(s) still running: %s",
+                                   len(self._running), sorted(map(str, self._running.values())))
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _schedule(self, lane_key, lane):
+        try:
+            self._executor.submit(self._drain_one, lane_key, lane)
+        except (RuntimeError, AttributeError):
+            # executor already shut down
+            with self._lock:
+                lane.scheduled = False
+
+    def _drain_one(self, lane_key, lane):
+        with self._lock:
+            if self._stopping.is_set() or not lane.messages:
+                lane.scheduled = False
+                if not lane.messages and self._lanes.get(lane_key) is lane:
+                    del self._lanes[lane_key]
+                return
+            message = lane.messages.popleft()
+            self._running[lane_key] = message.topic
+        try:
+            self.handler(self.client, message)
+            ok = True
+        except Exception as e:
+            ok = False
+            logger.exception("Worker failed to process message on %s: %s", message.topic, e)
+        with self._lock:
+            self.stats["processed" if ok else "failed"] += 1
+            del self._running[lane_key]
+            self._idle.notify_all()
+            if not lane.messages:
+                # idle lanes are forgotten; the next message for the key starts a new one
+                lane.scheduled = False
+                if self._lanes.get(lane_key) is lane:
+                    del self._lanes[lane_key]
+                return
+        # more queued for this lane: go to the back of the pool's queue, behind the other lanes
+        self._schedule(lane_key, lane)
@@ -0,0 +1,150 @@
+"""Versioned MQTT payload codec for audio chunks and camera frames.
+
+Binary layout (little-endian), version 1:
+
+    offset  size  field
+    0       2     magic b"AG"
+    2       1     version (1)
+    3       1     format (FORMAT_PCM16 / FORMAT_JPEG / FORMAT_WAV)
+    4       4     seq (uint32)
+    8       8     timestamp in milliseconds (uint64)
+    16      4     sample rate (uint32, 0 for images)
+    20      1     channels (uint8, 0 for images)
+    21      1     device_id length N (uint8)
+    22      N     device_id (utf-8)
+    22+N    ...   body: raw int16 PCM, JPEG or WAV bytes
+
+Compared with a JSON array of numbers this is ~3-6x smaller and decodes with
+no parsing: PCM bodies become an `np.frombuffer` view over the MQTT payload.
+
+`decode_message` parses a payload exactly once and understands every format
+the devices send today, so old firmware keeps working:
+- the binary format above;
+- JSON `{"device_id", "seq", "audio": [int, ...]}` (ESP32 mic firmware);
+- JSON `{"device_id", "timestamp", "format", "data": <base64>}` (camera / test scripts);
+- anything else is treated as raw bytes.
+"""
+import re
+import json
+import time
+import base64
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+
+MAGIC = b"AG"
+VERSION = 1
+
+FORMAT_PCM16 = 1
+FORMAT_JPEG = 2
+FORMAT_WAV = 3
+
+FORMAT_NAMES = {FORMAT_PCM16: "pcm", FORMAT_JPEG: "jpg", FORMAT_WAV: "wav"}
+
+_HEADER = struct.Struct("<2sBBIQIBB")
+
+# `samples` is an int16 sequence for audio chunks (ndarray view for binary, list for JSON),
+# `data` the raw body bytes for images / encoded audio; whichever doesn't apply is None.
+DecodedPayload = namedtuple(
+    "DecodedPayload",
+    ["device_id", "seq", "timestamp", "format", "data", "samples", "sample_rate", "channels", "encoding"],
+)
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def encode(device_id, fmt, body, seq=0, timestamp=None, sample_rate=0, channels=0):
+    dev = device_id.encode("utf-8")
+    if len(dev) > 255:
+        raise PayloadError("device_id longer than 255 bytes")
+    ts_ms = int((time.time() if timestamp is None else timestamp) * 1000)
+    header = _HEADER.pack(MAGIC, VERSION, fmt, seq & 0xFFFFFFFF, ts_ms, sample_rate, channels, len(dev))
+    return header + dev + bytes(body)
+
+
+def encode_audio(device_id, samples, seq=0, sample_rate=16000, channels=1, timestamp=None):
+    """Binary message carrying int16 PCM (`samples`: ndarray, array('h'), list or raw bytes)."""
+    if isinstance(samples, (bytes, bytearray, memoryview)):
+        body = samples
+    else:
+        body = np.asarray(samples, dtype="<i2").tobytes()
+    return encode(device_id, FORMAT_PCM16, body, seq, timestamp, sample_rate, channels)
+
+
+def encode_frame(device_id, jpeg_bytes, seq=0, timestamp=None):
+    return encode(device_id, FORMAT_JPEG, jpeg_bytes, seq, timestamp)
+
+
+def is_binary(payload):
+    return len(payload) >= _HEADER.size and payload[:2] == MAGIC
+
+
+_JSON_DEVICE_ID = re.compile(rb'"device_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def peek_device_id(payload):
+    """The payload's device_id without decoding the body (header slice or a regex over the JSON), else None.
+
+    Cheap enough for the MQTT network thread, which uses it to keep each device's messages in order.
+    """
+    if is_binary(payload):
+        start = _HEADER.size
+        end = start + payload[start - 1]
+        return bytes(payload[start:end]).decode("utf-8", errors="replace") if len(payload) >= end else None
+    m = _JSON_DEVICE_ID.search(payload)
+    if m is None:
+        return None
+    try:
+        return json.loads(b'"' + m.group(1) + b'"') or None
+    except ValueError:
+        return None
+
+
+def _decode_binary(payload):
+    magic, version, fmt, seq, ts_ms, rate, channels, dev_len = _HEADER.unpack_from(payload, 0)
+    if version != VERSION:
+        raise PayloadError(f"unsupported payload version {version}")
+    start = _HEADER.size + dev_len
+    if len(payload) < start:
+        raise PayloadError("truncated payload header")
+    device_id = bytes(payload[_HEADER.size:start]).decode("utf-8", errors="replace")
+    samples = None
+    data = None
+    if fmt == FORMAT_PCM16:
+        body_len = (len(payload) - start) // 2 * 2
+        samples = np.frombuffer(payload, dtype="<i2", count=body_len // 2, offset=start)
+    else:
+        # images are handed to PIL / uploads / caches, which all want real bytes
+        data = bytes(payload[start:])
+    return DecodedPayload(device_id, seq, ts_ms / 1000.0, FORMAT_NAMES.get(fmt, str(fmt)), data, samples,
+                          rate or None, channels or None, "binary")
+
+
+def decode_message(payload):
+    """Parse an MQTT payload once into a `DecodedPayload`, whatever encoding it uses."""
+    if is_binary(payload):
+        return _decode_binary(payload)
+    try:
+        obj = json.loads(payload)
+    except (ValueError, UnicodeDecodeError):
+        obj = None
+    if isinstance(obj, dict):
+        device_id = obj.get("device_id") or None
+        timestamp = obj.get("timestamp")
+        if "audio" in obj:
+            return DecodedPayload(device_id, obj.get("seq"), timestamp, "pcm", None, obj.get("audio") or [],
+                                  obj.get("sample_rate"), obj.get("channels"), "json")
+        if "data" in obj:
+            try:
+                data = base64.b64decode(obj["data"])
+            except Exception:
+                data = None
+            if data is not None:
+                return DecodedPayload(device_id, obj.get("seq"), timestamp, obj.get("format"), data, None,
+                                      None, None, "json")
+    # Not JSON/base64 — return raw
+    return DecodedPayload(None, None, None, None, payload, None, None, None, "raw")
@@ -0,0 +1,319 @@
+"""Energy gate in front of the speech model: skip windows whose energy already says silence.
+
+Every audio window normally pays for the STFT/MFCC features, the scaler and
+the SVM. `EnergyGate` looks at the raw int16 PCM first (one dot product for
+RMS, one sign comparison for the zero-crossing rate, no float signal, no
+resampling) and answers "silence" itself when the window's RMS and ZCR fall
+where the model, on its training data, always says silence.
+
+Thresholds come from calibration on the feature CSV the model was trained on
+(Speech-Recognition/audio_dataset_final.csv, whose rms/zcr columns use the
+same scale as `pcm_energy`):
+
+    python speech_gate.py --calibrate
+
+sorts the windows by RMS and picks the largest threshold below which at least
+`--precision` of the windows are called silence by the full model (or by the
+dataset label with `--reference label`), with at least `--min-support` of
+them ("precision" basis).
+
+If the quietest windows aren't silence, which is the case for the shipped
+model (whispering is the quietest class; what it calls silence is room noise
+at a steady level), it searches an RMS x ZCR grid of dataset quantiles for
+the largest box, `rms_min <= rms < rms_threshold` and
+`zcr_min <= zcr <= zcr_max`, holding at least `--min-support` windows at
+`--precision` ("band" basis). The shipped calibration is a band at precision
+1.0; `silence_share` in the file is the share of the reference's silence
+windows the gate answers itself.
+
+If neither exists, it falls back to half the RMS of the quietest window the
+model called anything else ("floor" basis): the gate then only catches muted
+or disconnected microphones, quieter than anything in the dataset (with no
+ZCR limit, a dead input's hiss crosses zero a lot). The result is written to
+Speech-Recognition/models_output/speech_gate.json.
+
+Hysteresis, per device: a window enters the silent state below
+`rms_enter` (= calibrated threshold / SPEECH_GATE_HYSTERESIS) and stays there
+while it is below the calibrated `rms_exit`, so the gate doesn't flicker on
+a noise floor that sits right at the threshold. A band's `rms_min` and the
+ZCR limits are plain bounds.
+
+Environment variables:
+  SPEECH_GATE              1 (default) to enable, 0 to always run the model
+  SPEECH_GATE_CONFIG       calibration file (default Speech-Recognition/models_output/speech_gate.json)
+  SPEECH_GATE_RMS          override the calibrated exit threshold (0-1 full-scale RMS)
+  SPEECH_GATE_HYSTERESIS   exit/enter threshold ratio (default 1.5)
+"""
+import os
+import csv
+import math
+import json
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+logger = logging.getLogger("speech_gate")
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_CSV = ROOT / "Speech-Recognition" / "audio_dataset_final.csv"
+DEFAULT_MODEL_DIR = ROOT / "Speech-Recognition" / "models_output"
+
+SPEECH_GATE = os.getenv("SPEECH_GATE", "1") != "0"
+SPEECH_GATE_CONFIG = os.getenv("SPEECH_GATE_CONFIG", str(DEFAULT_MODEL_DIR / "speech_gate.json"))
+SPEECH_GATE_RMS = os.getenv("SPEECH_GATE_RMS")
+SPEECH_GATE_HYSTERESIS = float(os.getenv("SPEECH_GATE_HYSTERESIS", "1.5"))
+
+SILENCE = "silence"
+FEATURE_COLUMNS = ["rms", "zcr", "spectral_centroid"] + [f"mfcc_{i}" for i in range(1, 14)]
+MODEL_RATE = 16000
+
+
+def pcm_energy(pcm, sample_rate=MODEL_RATE, channels=1):
+    """(rms, zcr) of int16 PCM on the dataset's scale.
+
+    rms is full-scale (int16 / 32768) over the whole window, like the
+    extractor's `rms_mode="global"`; zcr is crossings per sample at the
+    model's 16 kHz rate.
+    """
+    if isinstance(pcm, (bytes, bytearray, memoryview)):
+        x = np.frombuffer(pcm, dtype="<i2")
+    else:
+        x = np.asarray(pcm, dtype=np.int16)
+    channels = max(1, int(channels))
+    if channels > 1:
+        x = x[:len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    n = len(x)
+    if n == 0:
+        return 0.0, 0.0
+    xf = x.astype(np.float32, copy=False)
+    rms = float(np.sqrt(np.dot(xf, xf) / n)) / 32768.0
+    # librosa counts 0 as positive, which is exactly signbit
+    neg = np.signbit(x)
+    crossings = int(np.count_nonzero(neg[1:] != neg[:-1]))
+    zcr = crossings / n * sample_rate / MODEL_RATE
+    return rms, zcr
+
+
+class EnergyGate:
+    """Per-device silent/not-silent state with hysteresis on the window RMS."""
+
+    def __init__(self, rms_exit, hysteresis=SPEECH_GATE_HYSTERESIS, zcr_max=None, enabled=True,
+                 rms_min=0.0, zcr_min=0.0):
+        hysteresis = max(1.0, float(hysteresis))
+        # rms_exit None: no upper bound (a "band" calibration open towards loud windows)
+        self.rms_exit = math.inf if rms_exit is None else max(0.0, float(rms_exit))
+        self.rms_enter = self.rms_exit / hysteresis
+        self.rms_min = max(0.0, float(rms_min or 0.0))
+        self.zcr_min = float(zcr_min or 0.0)
+        self.zcr_max = zcr_max
+        self.enabled = enabled and self.rms_exit > self.rms_min
+        self._silent = {}
+        self._lock = threading.Lock()
+        self.stats = {"windows": 0, "gated": 0}
+
+    @classmethod
+    def from_config(cls, path=SPEECH_GATE_CONFIG, enabled=SPEECH_GATE, rms_override=SPEECH_GATE_RMS,
+                    hysteresis=SPEECH_GATE_HYSTERESIS):
+        config = {}
+        try:
+            with open(path) as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            if rms_override is None:
+                logger.info("No speech gate calibration at %s; gate disabled", path)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read speech gate calibration %s: %s", path, e)
+        rms_exit = float(rms_override) if rms_override is not None else config.get("rms_threshold", 0.0)
+        return cls(rms_exit, hysteresis, config.get("zcr_max"), enabled,
+                   rms_min=config.get("rms_min"), zcr_min=config.get("zcr_min"))
+
+    def covers(self, rms, zcr, entering=False):
+        """Whether (rms, zcr) is inside the gate's bounds (below `rms_enter` with `entering`)."""
+        return (self.rms_min <= rms < (self.rms_enter if entering else self.rms_exit) and zcr >= self.zcr_min
+                and (self.zcr_max is None or zcr <= self.zcr_max))
+
+    def is_silent(self, device_id, rms, zcr):
+        """Update the device's state with one window's energy; True if it should be labelled silence."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            was_silent = self._silent.get(device_id, False)
+            silent = self.covers(rms, zcr, entering=not was_silent)
+            self._silent[device_id] = silent
+            self.stats["windows"] += 1
+            if silent:
+                self.stats["gated"] += 1
+            return silent
+
+    def check_pcm(self, device_id, pcm, sample_rate=MODEL_RATE, channels=1):
+        rms, zcr = pcm_energy(pcm, sample_rate, channels)
+        return self.is_silent(device_id, rms, zcr)
+
+    def forget(self, device_id):
+        with self._lock:
+            self._silent.pop(device_id, None)
+
+    def describe(self):
+        if not self.enabled:
+            return "off"
+        zcr = f", zcr <= {self.zcr_max:.3f}" if self.zcr_max is not None else ""
+        if self.zcr_min:
+            zcr = f", zcr >= {self.zcr_min:.3f}" + zcr
+        rms = f"rms >= {self.rms_min:.5f}" if self.rms_min else ""
+        if self.rms_exit != math.inf:
+            rms += ", " if rms else ""
+            rms += f"rms < {self.rms_enter:.5f} to enter, < {self.rms_exit:.5f} to stay"
+        return rms + zcr
+
+
+# ---------------------------------------------------------------- calibration
+
+def load_dataset(csv_path=DEFAULT_CSV):
+    """Feature matrix (N, 16) in model column order and the label column."""
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    features = np.array([[float(r[c]) for c in FEATURE_COLUMNS] for r in rows], dtype=np.float64)
+    labels = np.array([r["label"] for r in rows])
+    return features, labels
+
+
+def model_predictions(features, model_dir=DEFAULT_MODEL_DIR):
+    """What the deployed speech model says for each feature row."""
+    import joblib
+    model = joblib.load(Path(model_dir) / "best_model.joblib")
+    scaler = joblib.load(Path(model_dir) / "scaler.joblib")
+    encoder = joblib.load(Path(model_dir) / "label_encoder.joblib")
+    return np.asarray(encoder.inverse_transform(model.predict(scaler.transform(features))))
+
+
+def _best_band(rms, zcr, silent, precision, min_support, steps):
+    """Largest RMS x ZCR box on a quantile grid with the required precision, as index bounds, or None."""
+    r_edges = np.unique(np.quantile(rms, np.linspace(0, 1, steps + 1)))
+    z_edges = np.unique(np.quantile(zcr, np.linspace(0, 1, steps + 1)))
+    ri = np.clip(np.searchsorted(r_edges, rms, side="right") - 1, 0, len(r_edges) - 2)
+    zi = np.clip(np.searchsorted(z_edges, zcr, side="right") - 1, 0, len(z_edges) - 2)
+    # 2-D prefix sums of (silent windows, all windows) per grid cell
+    hits = np.zeros((len(r_edges), len(z_edges)))
+    counts = np.zeros_like(hits)
+    np.add.at(hits, (ri + 1, zi + 1), silent)
+    np.add.at(counts, (ri + 1, zi + 1), 1)
+    hits = hits.cumsum(0).cumsum(1)
+    counts = counts.cumsum(0).cumsum(1)
+    best = None
+    for a in range(len(r_edges) - 1):
+        for b in range(a + 1, len(r_edges)):
+            h, n = hits[b] - hits[a], counts[b] - counts[a]
+            # every zcr range [c, d) at once
+            box_hits, box_counts = h[None, :] - h[:, None], n[None, :] - n[:, None]
+            ok = (box_counts >= min_support) & (box_hits >= precision * box_counts)
+            if not ok.any():
+                continue
+            c, d = np.unravel_index(np.argmax(np.where(ok, box_counts, 0)), ok.shape)
+            if best is None or box_counts[c, d] > best[0]:
+                best = (box_counts[c, d], a, b, c, d)
+    if best is None:
+        return None
+    _, a, b, c, d = best
+    inside = (ri >= a) & (ri < b) & (zi >= c) & (zi < d)
+    return inside, (r_edges[b] if b < len(r_edges) - 1 else None)
+
+
+def calibrate(rms, zcr, reference, precision=0.98, min_support=20, steps=40):
+    """Pick the gate's bounds; see the module docstring. Returns the config dict."""
+    rms = np.asarray(rms, dtype=np.float64)
+    zcr = np.asarray(zcr, dtype=np.float64)
+    silent = np.asarray(reference) == SILENCE
+    total_silent = max(1, int(silent.sum()))
+    order = np.argsort(rms, kind="stable")
+    hits = np.cumsum(silent[order])
+    counts = np.arange(1, len(order) + 1)
+    ok = (hits / counts >= precision) & (counts >= min_support)
+    if ok.any():
+        k = int(np.flatnonzero(ok)[-1])
+        upper = rms[order[k + 1]] if k + 1 < len(order) else rms[order[k]] * 1.01
+        threshold = float((rms[order[k]] + upper) / 2)
+        below = order[:k + 1]
+        return {
+            "basis": "precision",
+            "rms_threshold": threshold,
+            "zcr_max": float(zcr[below][silent[below]].max()),
+            "windows_gated": int(k + 1),
+            "precision": float(hits[k] / counts[k]),
+            "silence_share": float(silent[below].sum() / total_silent),
+        }
+    band = _best_band(rms, zcr, silent, precision, min_support, steps)
+    if band is not None:
+        inside, rms_upper = band
+        # tighten to the windows actually in the box: inclusive lower bounds and zcr_max
+        return {
+            "basis": "band",
+            "rms_min": float(rms[inside].min()),
+            "rms_threshold": None if rms_upper is None else float(rms_upper),
+            "zcr_min": float(zcr[inside].min()),
+            "zcr_max": float(zcr[inside].max()),
+            "windows_gated": int(inside.sum()),
+            "precision": float(silent[inside].mean()),
+            "silence_share": float(silent[inside].sum() / total_silent),
+        }
+    # silence isn't separable by energy in this data: only gate below anything ever called speech
+    quietest_other = float(rms[~silent].min()) if (~silent).any() else float(rms.max())
+    below = rms < quietest_other / 2
+    return {
+        "basis": "floor",
+        "rms_threshold": quietest_other / 2,
+        "zcr_max": None,
+        "windows_gated": int(np.count_nonzero(below)),
+        "precision": None,
+        "silence_share": float(silent[below].sum() / total_silent),
+    }
+
+
+def agreement_report(rms, zcr, reference, gate):
+    """How the gate's decisions line up with `reference` over independent windows."""
+    gated = np.array([gate.enabled and gate.covers(r, z) for r, z in zip(rms, zcr)], dtype=bool)
+    silent = np.asarray(reference) == SILENCE
+    return {
+        "windows": int(len(gated)),
+        "gated": int(gated.sum()),
+        "gated_agree": int((gated & silent).sum()),
+        "silence_recall": float((gated & silent).sum() / silent.sum()) if silent.any() else 0.0,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Calibrate the speech energy gate")
+    parser.add_argument("--calibrate", action="store_true", help="write the calibration file")
+    parser.add_argument("--csv", default=str(DEFAULT_CSV))
+    parser.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR))
+    parser.add_argument("--reference", choices=("model", "label"), default="model",
+                        help="what the gate has to agree with: the deployed model or the dataset labels")
+    parser.add_argument("--precision", type=float, default=0.98)
+    parser.add_argument("--min-support", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=40, help="quantile grid size for a band calibration")
+    parser.add_argument("--output", default=SPEECH_GATE_CONFIG)
+    args = parser.parse_args()
+
+    features, labels = load_dataset(args.csv)
+    rms, zcr = features[:, 0], features[:, 1]
+    reference = model_predictions(features, args.model_dir) if args.reference == "model" else labels
+    config = calibrate(rms, zcr, reference, args.precision, args.min_support, args.steps)
+    config.update({"reference": args.reference, "source": Path(args.csv).name,
+                   "target_precision": args.precision})
+    gate = EnergyGate(config["rms_threshold"], zcr_max=config["zcr_max"],
+                      rms_min=config.get("rms_min"), zcr_min=config.get("zcr_min"))
+    print(f"{len(rms)} windows, reference={args.reference}, basis={config['basis']}")
+    print(f"gate: {gate.describe()}")
+    print(f"agreement: {agreement_report(rms, zcr, reference, gate)}")
+    if args.calibrate:
+        with open(args.output, "w") as f:
+            json.dump(config, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""SQLite storage for the IoT server: one writer thread, pooled readers, WAL.
+
+`Server/fastapi_iot_server.py` used to open `argus_data.db` for every
+request and INSERT + COMMIT each prediction from inside the async handler,
+so every upload paid a connection setup and an fsync on the event loop.
+`SQLiteStore` replaces that:
+
+- the database is switched to WAL with `synchronous=NORMAL` once, so readers
+  never wait for the writer and a commit doesn't fsync the main file;
+- all writes go through a queue to one writer thread that owns a long-lived
+  connection and commits up to SQLITE_BATCH_SIZE statements (consecutive
+  statements with the same SQL via one `executemany`) in one transaction at
+  least every SQLITE_FLUSH_MS. `insert_prediction` / `insert_alert` return
+  immediately; `awrite` lets a handler wait for its row without blocking the
+  event loop;
+- reads run on a small pool of threads with one read-only connection each
+  (`aquery`, `aread`), never on the event loop.
+
+The schema is versioned (`MIGRATIONS`, recorded in PRAGMA user_version) and
+migrated when the store starts. Version 2 indexes predictions by
+(device_id, timestamp) and alerts by (resolved, timestamp), and adds two
+tables kept up to date by triggers in the same transaction as each insert:
+
+- `prediction_counts`: predictions per label per UTC day. `/stats` sums a
+  few rows per day (`prediction_stats`) instead of scanning every prediction;
+- `prediction_rollups`: predictions per device, minute and label with the
+  confidence sum and maximum, for dashboards (`device_rollup`).
+
+Both are backfilled from the existing rows when an older file is migrated.
+
+If a batch fails, it is rolled back and replayed one statement at a time, so
+one bad row doesn't take its neighbours with it. When the queue is full the
+write is dropped and counted in `stats["dropped"]` rather than stalling the
+request.
+
+Environment variables:
+  ARGUS_DB_PATH          database file (default argus_data.db)
+  SQLITE_BATCH_SIZE      max statements per transaction (default 200)
+  SQLITE_FLUSH_MS        max milliseconds a write waits for its batch (default 50)
+  SQLITE_QUEUE_SIZE      pending write bound (default 10000)
+  SQLITE_READERS         read connections / threads (default 4)
+  SQLITE_BUSY_TIMEOUT_MS how long a connection waits on a lock (default 5000)
+"""
+import os
+import time
+import queue
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+logger = logging.getLogger("sqlite_store")
+
+ARGUS_DB_PATH = os.getenv("ARGUS_DB_PATH", "argus_data.db")
+SQLITE_BATCH_SIZE = int(os.getenv("SQLITE_BATCH_SIZE", "200"))
+SQLITE_FLUSH_MS = float(os.getenv("SQLITE_FLUSH_MS", "50"))
+SQLITE_QUEUE_SIZE = int(os.getenv("SQLITE_QUEUE_SIZE", "10000"))
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "4"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def _rollup_keys(row=None):
+    """SQL for the counter keys of a prediction row (NEW, OLD or the table's own columns); NULLs get a key too."""
+    p = f"{row}." if row else ""
+    return {
+        "day": f"DATE(COALESCE({p}timestamp, CURRENT_TIMESTAMP))",
+        "minute": f"strftime('%Y-%m-%d %H:%M', COALESCE({p}timestamp, CURRENT_TIMESTAMP))",
+        "device": f"COALESCE({p}device_id, '')",
+        "prediction": f"COALESCE({p}prediction, 'unknown')",
+        "confidence": f"COALESCE({p}confidence, 0)",
+    }
+
+
+# Schema versions, applied in order and recorded in PRAGMA user_version. Each entry runs in one
+# transaction; version 1 is the original schema (IF NOT EXISTS, so older files start here too).
+MIGRATIONS = (
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS audio_predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            student_id TEXT,
+            prediction TEXT,
+            confidence REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            audio_features TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            student_id TEXT,
+            last_seen DATETIME,
+            ip_address TEXT,
+            status TEXT DEFAULT 'active'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            alert_type TEXT,
+            severity TEXT,
+            description TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            resolved BOOLEAN DEFAULT 0
+        )
+        ''',
+    ),
+    (
+        # per-device history and /alerts (unresolved first, newest first) without a table scan or sort
+        "CREATE INDEX IF NOT EXISTS idx_audio_predictions_device_time ON audio_predictions (device_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_resolved_time ON alerts (resolved, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts (timestamp)",
+        # predictions per label per UTC day: /stats reads a few rows per day instead of the whole table
+        '''
+        CREATE TABLE IF NOT EXISTS prediction_counts (
+            day TEXT NOT NULL,
+            prediction TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, prediction)
+        ) WITHOUT ROWID
+        ''',
+        # predictions per device per minute and label, for dashboards
+        '''
+        CREATE TABLE IF NOT EXISTS prediction_rollups (
+            device_id TEXT NOT NULL,
+            minute TEXT NOT NULL,
+            prediction TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            confidence_sum REAL NOT NULL,
+            confidence_max REAL NOT NULL,
+            PRIMARY KEY (device_id, minute, prediction)
+        ) WITHOUT ROWID
+        ''',
+        # kept up to date in the same transaction as the rows themselves
+        '''
+        CREATE TRIGGER IF NOT EXISTS audio_predictions_count_insert AFTER INSERT ON audio_predictions
+        BEGIN
+            INSERT INTO prediction_counts (day, prediction, count)
+            VALUES ({day}, {prediction}, 1)
+            ON CONFLICT (day, prediction) DO UPDATE SET count = count + 1;
+            INSERT INTO prediction_rollups (device_id, minute, prediction, count, confidence_sum, confidence_max)
+            VALUES ({device}, {minute}, {prediction}, 1, {confidence}, {confidence})
+            ON CONFLICT (device_id, minute, prediction) DO UPDATE SET
+                count = count + 1,
+                confidence_sum = confidence_sum + excluded.confidence_sum,
+                confidence_max = MAX(confidence_max, excluded.confidence_max);
+        END
+        '''.format(**_rollup_keys("NEW")),
+        # confidence_max can't be undone incrementally; it stays an upper bound after a delete
+        '''
+        CREATE TRIGGER IF NOT EXISTS audio_predictions_count_delete AFTER DELETE ON audio_predictions
+        BEGIN
+            UPDATE prediction_counts SET count = count - 1
+            WHERE day = {day} AND prediction = {prediction};
+            UPDATE prediction_rollups SET count = count - 1, confidence_sum = confidence_sum - {confidence}
+            WHERE device_id = {device} AND minute = {minute} AND prediction = {prediction};
+        END
+        '''.format(**_rollup_keys("OLD")),
+        # backfill from the rows already there
+        '''
+        INSERT OR REPLACE INTO prediction_counts (day, prediction, count)
+        SELECT {day}, {prediction}, COUNT(*) FROM audio_predictions GROUP BY 1, 2
+        '''.format(**_rollup_keys()),
+        '''
+        INSERT OR REPLACE INTO prediction_rollups (device_id, minute, prediction, count, confidence_sum, confidence_max)
+        SELECT {device}, {minute}, {prediction}, COUNT(*), TOTAL({confidence}), MAX({confidence})
+        FROM audio_predictions GROUP BY 1, 2, 3
+        '''.format(**_rollup_keys()),
+    ),
+)
+
+INSERT_PREDICTION = '''
+    INSERT INTO audio_predictions (device_id, student_id, prediction, confidence, timestamp, audio_features)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+INSERT_ALERT = '''
+    INSERT INTO alerts (device_id, alert_type, severity, description, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+def sql_now(ts=None):
+    """CURRENT_TIMESTAMP's format (UTC), taken when the row is queued rather than when its batch commits."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+def migrate(conn):
+    """Bring the schema up to the newest version; returns (from_version, to_version)."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info("Migrated database to schema version %d in %.2fs", version, time.perf_counter() - start)
+    return current, len(MIGRATIONS)
+
+
+def prediction_stats(conn):
+    """(total, {label: count}, today's count) from the counters, not from audio_predictions."""
+    by_label = dict(conn.execute(
+        "SELECT prediction, SUM(count) FROM prediction_counts GROUP BY prediction HAVING SUM(count) > 0").fetchall())
+    today = conn.execute("SELECT COALESCE(SUM(count), 0) FROM prediction_counts WHERE day = DATE('now')").fetchone()[0]
+    return sum(by_label.values()), by_label, today
+
+
+def device_rollup(conn, device_id, minutes=60):
+    """Per-minute prediction counts of one device over the last `minutes` (UTC minutes, oldest first)."""
+    rows = conn.execute('''
+        SELECT minute, prediction, count, confidence_sum, confidence_max FROM prediction_rollups
+        WHERE device_id = ? AND minute >= strftime('%Y-%m-%d %H:%M', 'now', ?) AND count > 0
+        ORDER BY minute
+    ''', (device_id, f"-{int(minutes)} minutes")).fetchall()
+    timeline = {}
+    for minute, prediction, count, confidence_sum, confidence_max in rows:
+        timeline.setdefault(minute, {})[prediction] = {
+            "count": count,
+            "mean_confidence": round(confidence_sum / count, 4),
+            "max_confidence": confidence_max,
+        }
+    return [{"minute": minute, "predictions": preds} for minute, preds in timeline.items()]
+
+
+def connect(path, readonly=False, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS):
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False,
+                               timeout=busy_timeout_ms / 1000)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_ms / 1000)
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    return conn
+
+
+class SQLiteStore:
+    """Write-behind batches on a writer thread plus a pool of read-only connections."""
+
+    def __init__(self, path=ARGUS_DB_PATH, batch_size=SQLITE_BATCH_SIZE, flush_ms=SQLITE_FLUSH_MS,
+                 queue_size=SQLITE_QUEUE_SIZE, readers=SQLITE_READERS):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_ms)) / 1000
+        self.readers = max(1, int(readers))
+        self._writes = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._writer = None
+        self._conn = None
+        self._read_pool = None
+        self._local = threading.local()
+        self._reader_conns = []
+        self._reader_lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0, "max_batch": 0}
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self):
+        if self._writer is not None:
+            return self
+        self._conn = connect(self.path)
+        migrate(self._conn)
+        self._read_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="sqlite-read")
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        logger.info("SQLite store %s: WAL, batches of up to %d every %.0f ms, %d readers",
+                    self.path, self.batch_size, self.flush_interval * 1000, self.readers)
+        return self
+
+    def flush(self, timeout=10.0):
+        """Wait until every write queued so far is committed (best effort)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._writes.unfinished_tasks == 0:
+                return True
+            time.sleep(0.005)
+        return False
+
+    def stop(self, timeout=10.0):
+        """Commit what is queued, then close every connection."""
+        if self._writer is None:
+            return
+        self._writes.put(_STOP)
+        self._writer.join(timeout)
+        self._writer = None
+        self._read_pool.shutdown(wait=True)
+        self._read_pool = None
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns = []
+        self._local = threading.local()
+        self._conn.close()
+        self._conn = None
+
+    # ---------------------------------------------------------------- writes
+
+    def execute(self, sql, params=(), wait=False):
+        """Queue one statement. Returns a Future (resolved once committed) if `wait`, else None."""
+        future = Future() if wait else None
+        if self._writer is None:
+            self.start()
+        try:
+            self._writes.put_nowait((sql, tuple(params), future))
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+            logger.warning("SQLite write queue full; dropping write")
+            if future is not None:
+                future.set_exception(RuntimeError("SQLite write queue full"))
+        return future
+
+    async def awrite(self, sql, params=()):
+        """Queue one statement and wait for its commit without blocking the event loop."""
+        return await asyncio.wrap_future(self.execute(sql, params, wait=True))
+
+    def insert_prediction(self, device_id, student_id, prediction, confidence, audio_features, timestamp=None):
+        self.execute(INSERT_PREDICTION, (device_id, student_id, prediction, confidence,
+                                         sql_now(timestamp), audio_features))
+
+    def insert_alert(self, device_id, alert_type, severity, description, timestamp=None):
+        self.execute(INSERT_ALERT, (device_id, alert_type, severity, description, sql_now(timestamp)))
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            item = self._writes.get()
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    # everything queued before stop() is in this batch or already committed
+                    stopping = True
+                    self._writes.task_done()
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            with self._conn:
+                i = 0
+                while i < len(batch):
+                    # consecutive statements with the same SQL go through one executemany
+                    j = i + 1
+                    while j < len(batch) and batch[j][0] == batch[i][0]:
+                        j += 1
+                    if j - i == 1:
+                        self._conn.execute(batch[i][0], batch[i][1])
+                    else:
+                        self._conn.executemany(batch[i][0], [item[1] for item in batch[i:j]])
+                    i = j
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            for _, _, future in batch:
+                if future is not None:
+                    future.set_result(None)
+        except sqlite3.Error as e:
+            logger.warning("SQLite batch of %d failed (%s); retrying one by one", len(batch), e)
+            for sql, params, future in batch:
+                try:
+                    with self._conn:
+                        self._conn.execute(sql, params)
+                    self.stats["written"] += 1
+                    if future is not None:
+                        future.set_result(None)
+                except sqlite3.Error as row_error:
+                    self.stats["failed"] += 1
+                    logger.error("SQLite write failed: %s", row_error)
+                    if future is not None:
+                        future.set_exception(row_error)
+        finally:
+            for _ in batch:
+                self._writes.task_done()
+
+    # ----------------------------------------------------------------- reads
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path, readonly=True)
+            self._local.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def read(self, fn, *args):
+        """Run `fn(conn, *args)` on this thread's read-only connection (call from a reader thread or at startup)."""
+        return fn(self._reader(), *args)
+
+    def query(self, sql, params=()):
+        return self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def aread(self, fn, *args):
+        """`read` on the reader pool, awaited from the event loop."""
+        if self._read_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_pool, self.read, fn, *args)
+
+    async def aquery(self, sql, params=()):
+        return await self.aread(lambda conn: conn.execute(sql, params).fetchall())
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import http_pool  # shared keep-alive session
 import time
 import json
 import pandas as pd
@@ -196,7 +197,7 @@ def send_audio_to_api(audio_data, sample_rate=16000):
         
         # Send to FastAPI - UPDATED endpoint
         files = {'file': ('audio.wav', audio_bytes, 'audio/wav')}
-        response = requests.post(f"{FASTAPI_URL}/upload_audio", files=files, timeout=10)
+        response = http_pool.post(f"{FASTAPI_URL}/upload_audio", files=files, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -216,7 +217,7 @@ def send_frame_to_api(frame):
         
         # Send to FastAPI
         files = {'file': ('frame.jpg', img_bytes, 'image/jpeg')}
-        response = requests.post(f"{FASTAPI_URL}/upload_frame", files=files, timeout=10)
+        response = http_pool.post(f"{FASTAPI_URL}/upload_frame", files=files, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -230,7 +231,7 @@ def send_frame_to_api(frame):
 def get_latest_audio_prediction():
     """Get latest audio prediction from FastAPI server"""
     try:
-        response = requests.get(f"{FASTAPI_URL}/latest_audio", timeout=5)
+        response = http_pool.get(f"{FASTAPI_URL}/latest_audio", timeout=5)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -240,7 +241,7 @@ def get_latest_audio_prediction():
 def get_latest_vision_prediction():
     """Get latest vision prediction from FastAPI server"""
     try:
-        response = requests.get(f"{FASTAPI_URL}/latest_vision", timeout=5)
+        response = http_pool.get(f"{FASTAPI_URL}/latest_vision", timeout=5)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -453,8 +454,8 @@ def main():
         st.markdown("### 🔗 Connection Status")
         try:
             # Test both endpoints
-            audio_response = requests.get(f"{FASTAPI_URL}/latest_audio", timeout=2)
-            vision_response = requests.get(f"{FASTAPI_URL}/latest_vision", timeout=2)
+            audio_response = http_pool.get(f"{FASTAPI_URL}/latest_audio", timeout=2)
+            vision_response = http_pool.get(f"{FASTAPI_URL}/latest_vision", timeout=2)
             
             if audio_response.status_code == 200 and vision_response.status_code == 200:
                 st.success("✅ Both APIs Connected")
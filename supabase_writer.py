@@ -0,0 +1,426 @@
+"""Background write-behind for Supabase storage uploads and ai_events rows.
+
+Calling Supabase inline put a storage upload and a single-row insert (plus a
+`list_buckets` round trip) on every classification. `SupabaseWriter` moves all
+of that off the hot path:
+
+- `enqueue` only puts the event on a bounded in-memory queue;
+- a small pool uploads files to storage concurrently;
+- rows are collected and written to `ai_events` as one multi-row insert every
+  `flush_interval` seconds or `batch_size` rows;
+- the bucket is checked (and created if missing) once, not per upload;
+- events that can't be queued (queue full) or written (Supabase down), and
+  anything still queued at shutdown, go to an on-disk spool that is replayed
+  in the background and on the next start;
+- in the background, a spooled item that failed is retried with exponential
+  backoff (from SUPABASE_SPOOL_RETRY up to SUPABASE_RETRY_MAX_BACKOFF); a
+  restart retries everything at once. An outage of any length is ridden out. Only an error that retrying can't fix (a 4xx from
+  storage, a constraint or type error from the insert), or an item still
+  failing SUPABASE_MAX_AGE_HOURS after its first failure, is moved to a
+  dead-letter directory with its last error. An upload answered with
+  "already exists" (e.g. replayed after a crash between the upload and the
+  row insert) counts as done.
+
+Environment variables:
+  SUPABASE_BUCKET           storage bucket (default ai-files)
+  SUPABASE_QUEUE_SIZE       in-memory queue bound (default 1000)
+  SUPABASE_UPLOAD_WORKERS   concurrent storage uploads (default 4)
+  SUPABASE_BATCH_SIZE       max rows per ai_events insert (default 50)
+  SUPABASE_FLUSH_INTERVAL   seconds between row flushes (default 1.0)
+  SUPABASE_SPOOL_DIR        spool directory (default ./supabase_spool)
+  SUPABASE_SPOOL_RETRY      seconds between spool replays (default 30)
+  SUPABASE_RETRY_MAX_BACKOFF  longest wait between retries of one item, seconds (default 600)
+  SUPABASE_MAX_AGE_HOURS    how long a failing item keeps being retried (default 72)
+  SUPABASE_DEAD_LETTER_DIR  where those go (default <spool dir>/dead)
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger("supabase_writer")
+
+SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "ai-files")
+SUPABASE_QUEUE_SIZE = int(os.getenv("SUPABASE_QUEUE_SIZE", "1000"))
+SUPABASE_UPLOAD_WORKERS = int(os.getenv("SUPABASE_UPLOAD_WORKERS", "4"))
+SUPABASE_BATCH_SIZE = int(os.getenv("SUPABASE_BATCH_SIZE", "50"))
+SUPABASE_FLUSH_INTERVAL = float(os.getenv("SUPABASE_FLUSH_INTERVAL", "1.0"))
+SUPABASE_SPOOL_DIR = os.getenv("SUPABASE_SPOOL_DIR", "./supabase_spool")
+SUPABASE_SPOOL_RETRY = float(os.getenv("SUPABASE_SPOOL_RETRY", "30"))
+SUPABASE_RETRY_MAX_BACKOFF = float(os.getenv("SUPABASE_RETRY_MAX_BACKOFF", "600"))
+SUPABASE_MAX_AGE_HOURS = float(os.getenv("SUPABASE_MAX_AGE_HOURS", "72"))
+SUPABASE_DEAD_LETTER_DIR = os.getenv("SUPABASE_DEAD_LETTER_DIR")
+
+ROW_FIELDS = ("device_id", "event_type", "label", "timestamp", "file_path")
+
+
+def storage_path(device_id, event_type, timestamp, ext, filename=None):
+    if filename:
+        # allow callers to provide a custom filename (should include extension)
+        return f"{device_id}/{event_type}/{filename}"
+    return f"{device_id}/{event_type}/{int(timestamp)}.{ext}"
+
+
+def _error_status(e):
+    """HTTP status carried by a storage / postgrest / requests error, if any."""
+    for attr in ("status_code", "status", "statusCode"):
+        value = getattr(e, attr, None)
+        if value is not None:
+            break
+    else:
+        response = getattr(e, "response", None)
+        value = getattr(response, "status_code", None)
+        if value is None and e.args and isinstance(e.args[0], dict):
+            # storage3 raises StorageException({"statusCode": ..., "error": ..., "message": ...})
+            value = e.args[0].get("statusCode") or e.args[0].get("status")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def already_exists(e):
+    return _error_status(e) == 409 or "already exists" in str(e).lower() or "duplicate" in str(e).lower()
+
+
+def is_permanent(e):
+    """An error that retrying the same request won't fix."""
+    status = _error_status(e)
+    if status is not None and 400 <= status < 500 and status not in (408, 429):
+        return True
+    # postgrest APIError: SQLSTATE classes 22 (bad data), 23 (constraint), 42 (unknown column / syntax)
+    code = str(getattr(e, "code", "") or "")
+    return code[:2] in ("22", "23", "42")
+
+
+def _public_url(pub, path):
+    # get_public_url may return dict, a string, or an object with 'publicUrl'
+    if isinstance(pub, dict):
+        return pub.get("publicUrl") or pub.get("public_url") or path
+    try:
+        return pub.publicUrl
+    except Exception:
+        return str(pub)
+
+
+class SupabaseWriter:
+    """Bounded queue + upload pool + batched row inserts + disk spool."""
+
+    def __init__(self, client_factory, bucket=SUPABASE_BUCKET, queue_size=SUPABASE_QUEUE_SIZE,
+                 upload_workers=SUPABASE_UPLOAD_WORKERS, batch_size=SUPABASE_BATCH_SIZE,
+                 flush_interval=SUPABASE_FLUSH_INTERVAL, spool_dir=SUPABASE_SPOOL_DIR,
+                 spool_retry=SUPABASE_SPOOL_RETRY, max_backoff=SUPABASE_RETRY_MAX_BACKOFF,
+                 max_age_hours=SUPABASE_MAX_AGE_HOURS, dead_letter_dir=SUPABASE_DEAD_LETTER_DIR):
+        self.client_factory = client_factory
+        self.bucket = bucket
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.spool_dir = Path(spool_dir)
+        self.spool_retry = float(spool_retry)
+        self.max_backoff = max(self.spool_retry, float(max_backoff))
+        self.max_age = float(max_age_hours) * 3600
+        self.dead_letter_dir = Path(dead_letter_dir) if dead_letter_dir else self.spool_dir / "dead"
+        self.upload_workers = max(1, int(upload_workers))
+        self._events = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._rows = queue.Queue()
+        self._pool = None
+        self._threads = []
+        self._stopping = threading.Event()
+        self._bucket_ready = False
+        self._bucket_lock = threading.Lock()
+        self.stats = {"queued": 0, "uploaded": 0, "upload_failed": 0, "rows_inserted": 0,
+                      "insert_batches": 0, "insert_failed": 0, "spooled": 0, "replayed": 0,
+                      "already_uploaded": 0, "dead_lettered": 0}
+
+    # ------------------------------------------------------------------ public
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stopping.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="supabase-upload")
+        for target, name in ((self._dispatch_loop, "supabase-dispatch"),
+                             (self._flush_loop, "supabase-rows"),
+                             (self._spool_loop, "supabase-spool")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def enqueue(self, device_id, event_type, label, timestamp, file_bytes=None, ext=None, filename=None):
+        """Queue an event for upload; never blocks. Returns the storage path the file will get."""
+        event = {
+            "id": uuid.uuid4().hex,
+            "device_id": device_id,
+            "event_type": event_type,
+            "label": label,
+            "timestamp": int(timestamp),
+            "path": storage_path(device_id, event_type, timestamp, ext, filename) if file_bytes else None,
+            "data": file_bytes,
+        }
+        if not self._threads:
+            self.start()
+        try:
+            self._events.put_nowait(event)
+            self.stats["queued"] += 1
+        except queue.Full:
+            logger.warning("Supabase queue full; spooling event %s to disk", event["path"])
+            self._spool(event)
+        return event["path"]
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far has been uploaded and inserted (best effort)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._events.unfinished_tasks == 0 and self._rows.unfinished_tasks == 0:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def stop(self, timeout=5.0):
+        """Drain what we can within `timeout`, spool the rest, and stop the threads."""
+        if not self._threads:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        leftovers = 0
+        for q in (self._events, self._rows):
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                self._spool(item)
+                q.task_done()
+                leftovers += 1
+        if leftovers:
+            logger.info("Spooled %d pending Supabase events at shutdown", leftovers)
+
+    # ---------------------------------------------------------------- storage
+
+    def _ensure_bucket(self, client):
+        if self._bucket_ready:
+            return
+        with self._bucket_lock:
+            if self._bucket_ready:
+                return
+            try:
+                buckets = client.storage.list_buckets() or []
+                names = {getattr(b, "name", None) or (b.get("name") if isinstance(b, dict) else None)
+                         for b in buckets} if isinstance(buckets, list) else set()
+                if self.bucket not in names:
+                    client.storage.create_bucket(self.bucket)
+                    logger.info("Created storage bucket %s", self.bucket)
+            except Exception as e:
+                # the bucket usually exists already; uploads will tell us if it doesn't
+                logger.warning("Could not verify storage bucket %s: %s", self.bucket, e)
+            self._bucket_ready = True
+
+    def _upload(self, event):
+        try:
+            client = self.client_factory()
+            if client is None:
+                raise RuntimeError("Supabase client not configured")
+            self._ensure_bucket(client)
+            file_path = None
+            if event.get("data"):
+                store = client.storage.from_(self.bucket)
+                try:
+                    store.upload(event["path"], event["data"])
+                    self.stats["uploaded"] += 1
+                    logger.info("Uploaded file to storage: %s", event["path"])
+                except Exception as e:
+                    if not already_exists(e):
+                        raise
+                    # uploaded by an earlier attempt whose row never made it
+                    self.stats["already_uploaded"] += 1
+                    logger.info("File already in storage: %s", event["path"])
+                try:
+                    file_path = _public_url(store.get_public_url(event["path"]), event["path"])
+                except Exception:
+                    file_path = event["path"]
+            row = {
+                "id": event["id"],
+                "device_id": event["device_id"],
+                "event_type": event["event_type"],
+                "label": event["label"],
+                "timestamp": event["timestamp"],
+                "file_path": file_path,
+            }
+            self._rows.put(row)
+        except Exception as e:
+            self.stats["upload_failed"] += 1
+            self._failed(event, e, "Storage upload")
+        finally:
+            self._events.task_done()
+
+    def _dispatch_loop(self):
+        slots = threading.BoundedSemaphore(self.upload_workers)
+        while not self._stopping.is_set():
+            try:
+                event = self._events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            slots.acquire()
+            future = self._pool.submit(self._upload, event)
+            future.add_done_callback(lambda f: slots.release())
+
+    # ------------------------------------------------------------------- rows
+
+    def _flush_loop(self):
+        while not self._stopping.is_set():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._rows.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._insert(batch)
+
+    def _insert(self, rows, done=True):
+        payload = [{k: r.get(k) for k in ROW_FIELDS} for r in rows]
+        try:
+            client = self.client_factory()
+            if client is None:
+                raise RuntimeError("Supabase client not configured")
+            client.table("ai_events").insert(payload).execute()
+            self.stats["rows_inserted"] += len(rows)
+            self.stats["insert_batches"] += 1
+            logger.info("Inserted %d rows into ai_events", len(rows))
+        except Exception as e:
+            if len(rows) > 1 and is_permanent(e):
+                # one bad row rejects the whole batch: find it, keep the others
+                for r in rows:
+                    self._insert([r], done=False)
+            else:
+                self.stats["insert_failed"] += len(rows)
+                for r in rows:
+                    self._failed(r, e, "ai_events insert")
+        finally:
+            if done:
+                for _ in rows:
+                    self._rows.task_done()
+
+    # ------------------------------------------------------------------ spool
+
+    def _failed(self, item, error, what):
+        """Spool `item` for a later retry, or dead-letter it if retrying is pointless."""
+        now = time.time()
+        item["attempts"] = item.get("attempts", 0) + 1
+        item["last_error"] = str(error)[:500]
+        item.setdefault("first_failed_at", now)
+        expired = now - item["first_failed_at"] >= self.max_age
+        if is_permanent(error) or expired:
+            logger.error("%s failed for %s (%s), attempt %d%s; moving it to %s", what,
+                         item.get("path") or item.get("id"), error, item["attempts"],
+                         ", retried too long" if expired else "", self.dead_letter_dir)
+            self.stats["dead_lettered"] += 1
+            self._spool(item, self.dead_letter_dir)
+        else:
+            # transient (network, timeout, 5xx): back off, but never give up on an outage
+            backoff = min(self.spool_retry * 2 ** (item["attempts"] - 1), self.max_backoff)
+            item["retry_at"] = now + backoff
+            logger.warning("%s failed for %s (%s); spooling, retry in %.0fs", what,
+                           item.get("path") or item.get("id"), error, backoff)
+            self._spool(item)
+
+    def _spool(self, item, directory=None):
+        """Persist an event (needs upload) or a row (upload done) so it survives restarts."""
+        directory = self.spool_dir if directory is None else directory
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            name = f"{int(time.time() * 1000)}_{item['id']}"
+            meta = {k: v for k, v in item.items() if k != "data"}
+            meta["kind"] = "event" if "path" in item else "row"
+            if item.get("data"):
+                blob = directory / f"{name}.bin"
+                tmp = blob.with_suffix(".bin.tmp")
+                tmp.write_bytes(item["data"])
+                os.replace(tmp, blob)
+                meta["blob"] = blob.name
+            target = directory / f"{name}.json"
+            tmp = target.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, target)
+            self.stats["spooled"] += 1
+        except Exception as e:
+            logger.error("Could not spool Supabase event %s: %s", item.get("id"), e)
+
+    def replay_spool(self, limit=None, due_only=True):
+        """Move spooled items back into the queues while there is room. Returns the count.
+
+        With `due_only`, items still backing off from a failure are left for later.
+        """
+        if not self.spool_dir.exists():
+            return 0
+        count = 0
+        now = time.time()
+        for meta_path in sorted(self.spool_dir.glob("*.json")):
+            if limit is not None and count >= limit:
+                break
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                if due_only and meta.get("retry_at", 0) > now:
+                    continue
+                kind = meta.pop("kind", "event")
+                blob_name = meta.pop("blob", None)
+                blob = self.spool_dir / blob_name if blob_name else None
+                if kind == "row":
+                    self._rows.put(meta)
+                else:
+                    meta["data"] = blob.read_bytes() if blob is not None else None
+                    self._events.put_nowait(meta)
+            except queue.Full:
+                break
+            except Exception as e:
+                # keep it (and its blob, named after it) for inspection instead of leaking the blob
+                logger.warning("Unreadable spool entry %s (%s); moving it to %s", meta_path.name, e,
+                               self.dead_letter_dir)
+                self._move_to_dead_letter(meta_path)
+                continue
+            meta_path.unlink(missing_ok=True)
+            if blob is not None:
+                blob.unlink(missing_ok=True)
+            count += 1
+        if count:
+            self.stats["replayed"] += count
+            logger.info("Replayed %d spooled Supabase events", count)
+        return count
+
+    def _move_to_dead_letter(self, meta_path):
+        self.stats["dead_lettered"] += 1
+        try:
+            self.dead_letter_dir.mkdir(parents=True, exist_ok=True)
+            for path in (meta_path, meta_path.with_suffix(".bin")):
+                if path.exists():
+                    os.replace(path, self.dead_letter_dir / path.name)
+        except OSError as e:
+            logger.error("Could not move %s to the dead-letter directory: %s", meta_path.name, e)
+            meta_path.unlink(missing_ok=True)
+            meta_path.with_suffix(".bin").unlink(missing_ok=True)
+
+    def _spool_loop(self):
+        # a fresh start retries everything at once, whatever its backoff
+        self.replay_spool(limit=self._events.maxsize // 2, due_only=False)
+        while not self._stopping.wait(self.spool_retry):
+            # only replay while the queue is mostly empty so live traffic keeps priority
+            room = self._events.maxsize // 2 - self._events.qsize()
+            if room > 0:
+                self.replay_spool(limit=room)
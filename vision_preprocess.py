@@ -0,0 +1,98 @@
+"""Fused JPEG -> normalized tensor preprocessing for the vision model.
+
+The torchvision pipeline (`Image.open(...).convert("RGB")`, then `Resize`,
+`ToTensor`, `Normalize`) copies the frame five or six times: `convert` copies
+an image that is already RGB, `ToTensor` makes a uint8 tensor, a permuted
+contiguous copy and a float copy, and `Normalize` returns another tensor.
+`FramePreprocessor` does the same math with fewer copies:
+
+- the JPEG decoder is asked for the target scale with `Image.draft`, so a
+  1280x720 frame is decoded by libjpeg's DCT scaling at 640x360 instead of at
+  full size (QQVGA 160x120 frames from the ESP32 are already smaller than 224
+  and are decoded as-is), straight to RGB;
+- one bilinear resize to 224x224 (the same call `transforms.Resize` makes);
+- the decoded pixels are copied out of PIL once as uint8 HWC, then turned
+  into normalized float32 CHW in two in-place passes,
+  `x * 1/(255*std) - mean/std`, written into the destination tensor.
+
+`tensor()` returns a fresh (3, H, W) tensor for `VisionBatcher.submit` (the
+frame waits in a queue, so it can't share a buffer). `batch()` writes into a
+per-thread (N, 3, H, W) buffer that is reused by the next call from the same
+thread, for callers that run the forward pass themselves.
+
+Environment variables:
+  VISION_JPEG_DRAFT   1 (default) to let the JPEG decoder downscale; 0 decodes at full
+                      size, which matches `cv_transform` bit for bit
+"""
+import io
+import os
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+VISION_JPEG_DRAFT = os.getenv("VISION_JPEG_DRAFT", "1") != "0"
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def decode_resized(image_bytes, size=224, draft=VISION_JPEG_DRAFT):
+    """Decode an image and resize it to `size` x `size` RGB with as few copies as possible."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if draft and img.format == "JPEG":
+        # picks the largest 1/2, 1/4, 1/8 DCT reduction that stays >= size
+        img.draft("RGB", (size, size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.BILINEAR)
+    return img
+
+
+class FramePreprocessor:
+    """Turn encoded frames into normalized float32 tensors for the vision model."""
+
+    def __init__(self, size=224, mean=IMAGENET_MEAN, std=IMAGENET_STD, max_batch=8, draft=VISION_JPEG_DRAFT):
+        self.size = int(size)
+        self.max_batch = max(1, int(max_batch))
+        self.draft = draft
+        std = np.asarray(std, dtype=np.float32).reshape(3, 1, 1)
+        mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1)
+        self._scale = 1.0 / (255.0 * std)
+        self._shift = mean / std
+        self._local = threading.local()
+
+    def fill(self, img, out):
+        """Write the normalized (3, H, W) form of an RGB `size`x`size` image into `out`."""
+        # one uint8 HWC copy of the decoded pixels (PIL exports through tobytes(), there is no view)
+        hwc = np.asarray(img)
+        dst = out.numpy()
+        np.multiply(hwc.transpose(2, 0, 1), self._scale, out=dst)
+        np.subtract(dst, self._shift, out=dst)
+        return out
+
+    def tensor(self, image_bytes, out=None):
+        """(3, H, W) float32 tensor for one encoded frame; allocates unless `out` is given."""
+        if out is None:
+            out = torch.empty((3, self.size, self.size), dtype=torch.float32)
+        return self.fill(decode_resized(image_bytes, self.size, self.draft), out)
+
+    def _buffer(self, n):
+        buf = getattr(self._local, "batch", None)
+        if buf is None or buf.shape[0] < n:
+            buf = torch.empty((max(n, self.max_batch), 3, self.size, self.size), dtype=torch.float32)
+            self._local.batch = buf
+        return buf[:n]
+
+    def batch(self, frames):
+        """(N, 3, H, W) tensor for a list of encoded frames, in this thread's reusable buffer.
+
+        The result is overwritten by the next `batch` call from the same thread.
+        """
+        out = self._buffer(len(frames))
+        for i, image_bytes in enumerate(frames):
+            self.tensor(image_bytes, out[i])
+        return out
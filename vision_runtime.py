@@ -0,0 +1,125 @@
+"""Pick and load the vision model artifact to serve.
+
+`Computer-Vision/export_model.py` turns the FP32 `cheating_cnn_model.pth`
+into faster CPU artifacts next to it:
+
+  cheating_cnn_model.pth       eager FP32 ResNet18 state_dict (training output)
+  cheating_cnn_model.ts.pt     TorchScript FP32
+  cheating_cnn_model.int8.pt   TorchScript int8 (static FX quantization, or dynamic as fallback)
+  cheating_cnn_model.onnx      ONNX FP32, served with onnxruntime
+
+`load_vision_model` loads the one named by VISION_RUNTIME, or with "auto"
+the first present of int8, onnx, torchscript, eager on CPU (torchscript,
+eager on CUDA). Every variant is called like the eager model: a float batch
+(N, 3, 224, 224) in, logits out, so `VisionBatcher` and `classify_image_bytes`
+don't care which one they got.
+
+Environment variables:
+  VISION_RUNTIME     auto (default), eager, torchscript, int8 or onnx
+  VISION_MODEL_DIR   directory holding the artifacts (default ./Computer-Vision)
+"""
+import os
+import logging
+
+import torch
+from torchvision import models
+
+
+logger = logging.getLogger("vision_runtime")
+
+VISION_RUNTIME = os.getenv("VISION_RUNTIME", "auto").lower()
+VISION_MODEL_DIR = os.getenv("VISION_MODEL_DIR", "./Computer-Vision")
+
+MODEL_STEM = "cheating_cnn_model"
+ARTIFACTS = {
+    "eager": f"{MODEL_STEM}.pth",
+    "torchscript": f"{MODEL_STEM}.ts.pt",
+    "int8": f"{MODEL_STEM}.int8.pt",
+    "onnx": f"{MODEL_STEM}.onnx",
+}
+AUTO_ORDER_CPU = ("int8", "onnx", "torchscript", "eager")
+AUTO_ORDER_CUDA = ("torchscript", "eager")
+
+
+def artifact_path(runtime, model_dir=VISION_MODEL_DIR):
+    return os.path.join(model_dir, ARTIFACTS[runtime])
+
+
+def build_resnet18(num_classes):
+    model = models.resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+
+def load_eager(path, num_classes, device="cpu"):
+    model = build_resnet18(num_classes)
+    model.load_state_dict(torch.load(path, map_location=device))
+    return model.to(device).eval()
+
+
+def _set_quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    return None
+
+
+class OnnxVisionModel:
+    """onnxruntime session behind the same call interface as the torch model."""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+def load_artifact(runtime, num_classes, device="cpu", model_dir=VISION_MODEL_DIR):
+    path = artifact_path(runtime, model_dir)
+    if runtime == "eager":
+        return load_eager(path, num_classes, device)
+    if runtime == "onnx":
+        return OnnxVisionModel(path)
+    if runtime == "int8":
+        # quantized kernels are CPU-only
+        _set_quantized_engine()
+        return torch.jit.load(path, map_location="cpu").eval()
+    return torch.jit.load(path, map_location=device).eval()
+
+
+def load_vision_model(num_classes, device="cpu", runtime=VISION_RUNTIME, model_dir=VISION_MODEL_DIR):
+    """Return `(model, runtime_name)` for the requested or best available artifact."""
+    if runtime != "auto":
+        if runtime not in ARTIFACTS:
+            raise ValueError(f"VISION_RUNTIME must be auto or one of {sorted(ARTIFACTS)}, got {runtime!r}")
+        candidates = (runtime,)
+    else:
+        candidates = AUTO_ORDER_CUDA if str(device).startswith("cuda") else AUTO_ORDER_CPU
+    errors = []
+    for name in candidates:
+        if not os.path.exists(artifact_path(name, model_dir)):
+            continue
+        try:
+            model = load_artifact(name, num_classes, device, model_dir)
+            logger.info("Vision runtime: %s (%s)", name, artifact_path(name, model_dir))
+            return model, name
+        except Exception as e:
+            # e.g. onnxruntime not installed: fall through to the next artifact
+            logger.warning("Could not load %s vision artifact: %s", name, e)
+            errors.append(f"{name}: {e}")
+    raise FileNotFoundError(
+        f"no loadable vision model among {list(candidates)} in {model_dir}" + (f" ({'; '.join(errors)})" if errors else ""))